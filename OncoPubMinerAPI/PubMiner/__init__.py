@@ -19,6 +19,7 @@ from config import config, Config
 # 配置数据库
 db = SQLAlchemy()
 scheduler = APScheduler()
+csrf = CSRFProtect()
 
 
 def setup_log(config_name):
@@ -52,7 +53,7 @@ def create_app(config_name):
     # 配置数据库
     db.init_app(app)
     # 开启csrf保护
-    CSRFProtect(app)
+    csrf.init_app(app)
 
     CORS(app, resources={r"/*": {"origins": "*"}})
 
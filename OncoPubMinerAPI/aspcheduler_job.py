@@ -2,9 +2,14 @@
 # @Time : 2021/10/19 13:30
 # @File : aspcheduler_job.py
 # @Project : OncoPubMinerAPI
-from config import Config
-from model import PubMed
+import logging
+
+from model import PubMed, Stat
 from PubMiner import db, scheduler
+from cache import set_data_version
+from bitmap import cancer_bitmap
+from dictionary import reload_dictionaries
+from suggest import reload_suggest_indexes
 
 
 class AspConfig(object):
@@ -14,6 +19,19 @@ class AspConfig(object):
             'func': 'aspcheduler_job:update_pub_med_base',
             'trigger': 'interval',
             'seconds': 2*60
+        },
+        {
+            'id': 'check_data_version',
+            'func': 'aspcheduler_job:check_data_version',
+            'trigger': 'interval',
+            'seconds': 30
+        },
+        {
+            'id': 'reload_dictionaries',
+            'func': 'aspcheduler_job:reload_library_dictionaries',
+            'trigger': 'cron',
+            'hour': 5,
+            'minute': 0
         }
     ]
 
@@ -21,12 +39,35 @@ class AspConfig(object):
     SCHEDULER_TIMEZONE = "Asia/Shanghai"
 
 
+# 多进程运行时只由master执行一次的任务(写共享的位图文件, 重新加载词典后重启worker), 其余任务每个worker各自执行
+LEADER_JOBS = ['auto_update', 'reload_dictionaries']
+
+
 def update_pub_med_base():
+    """is_cancer只在Monitor写入实体识别结果时变化, 数据版本号不变时不需要重建癌症文献位图"""
     with scheduler.app.app_context():
+        stat = db.session.query(Stat.postingVersion).filter(Stat.id == 1).first()
+        version = stat[0] if stat else None
+        if cancer_bitmap.ready and version is not None and version == cancer_bitmap.version:
+            return
         is_cancer_pubs = db.session.query(PubMed.id).filter(PubMed.is_cancer == 1).all()
-    Config.cancer_pubmed_ids = {is_cancer_pub[0] for is_cancer_pub in is_cancer_pubs}
-    with open(Config.is_cancer_pub_path, 'w', encoding='utf-8') as f:
-        f.write('|'.join([str(pub_id) for pub_id in Config.cancer_pubmed_ids]))
+    pages = cancer_bitmap.update([is_cancer_pub[0] for is_cancer_pub in is_cancer_pubs], version)
+    logging.info(f'update is_cancer bitmap, version: {version}, changed pages: {pages}')
+
+
+def check_data_version():
+    """检查实体-文献倒排表数据版本号, 版本变化时清空进程内缓存"""
+    with scheduler.app.app_context():
+        stat = db.session.query(Stat.postingVersion).filter(Stat.id == 1).first()
+    if stat:
+        set_data_version(stat[0] or 0)
+
+
+def reload_library_dictionaries():
+    """每日重新加载标准库内存词典和输入联想索引"""
+    with scheduler.app.app_context():
+        reload_dictionaries()
+        reload_suggest_indexes()
 
 
 """
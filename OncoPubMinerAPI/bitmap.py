@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 11:20
+# @File : bitmap.py
+# @Project : OncoPubMinerAPI
+"""
+以PMID为下标的位图文件(第PMID位为1表示属于该集合), 通过mmap只读映射, 多个进程共享同一份页缓存。
+
+35M PubMed文献对应的位图约5MB, 判断一批PMID是否属于集合是一次向量化的下标运算, 不需要访问数据库。
+"""
+import mmap
+import os
+import threading
+
+import numpy as np
+
+from config import Config
+
+# 更新位图时按页比较, 只写入发生变化的页
+PAGE_SIZE = 4096
+
+
+class PMIDBitmap(object):
+    def __init__(self, path):
+        self.path = path
+        # 最近一次根据数据库重建位图时的数据版本号
+        self.version = None
+        self._mmap = None
+        self._bits = np.zeros(0, dtype=np.uint8)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        """位图文件是否已生成"""
+        return self._remap() > 0
+
+    def _remap(self):
+        """位图文件大小变化时(首次加载或被重建扩容)重新映射"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        if size != self._size:
+            with self._lock:
+                if size != self._size:
+                    with open(self.path, 'rb') as f:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+                    self._bits = np.frombuffer(self._mmap, dtype=np.uint8) if size else np.zeros(0, dtype=np.uint8)
+                    self._size = size
+        return self._size
+
+    def contains(self, pub_ids):
+        """
+        :param pub_ids: PMID数组
+        :return: 与pub_ids等长的bool数组
+        """
+        pub_ids = np.asarray(pub_ids, dtype=np.uint32)
+        if len(pub_ids) == 0:
+            return np.zeros(0, dtype=bool)
+        bits = self._bits
+        if int(pub_ids.max()) >> 3 >= len(bits):
+            self._remap()
+            bits = self._bits
+        byte_index = (pub_ids >> 3).astype(np.int64)
+        in_range = byte_index < len(bits)
+        mask = np.zeros(len(pub_ids), dtype=bool)
+        mask[in_range] = (bits[byte_index[in_range]] >> (pub_ids[in_range] & 7).astype(np.uint8)) & 1 == 1
+        return mask
+
+    def filter(self, pub_ids):
+        """保留属于集合的PMID, 顺序不变"""
+        return pub_ids[self.contains(pub_ids)]
+
+    def count(self, pub_ids):
+        return int(self.contains(pub_ids).sum())
+
+    def update(self, pub_ids, version=None):
+        """
+        根据完整的PMID集合更新位图文件, 只写入发生变化的页(不重写整个文件)
+        :param pub_ids: 属于集合的全部PMID
+        :param version: 数据版本号
+        :return: 写入的页数
+        """
+        pub_ids = np.asarray(pub_ids, dtype=np.uint32)
+        flags = np.zeros(int(pub_ids.max()) + 1 if len(pub_ids) else 0, dtype=bool)
+        flags[pub_ids] = True
+        new_bits = np.packbits(flags, bitorder='little')
+        # 文件大小按页对齐(写了一半的文件补齐到整页), 之后只会增长
+        size = -(-max(len(new_bits), self._remap()) // PAGE_SIZE) * PAGE_SIZE
+        new_bits = np.concatenate((new_bits, np.zeros(size - len(new_bits), dtype=np.uint8)))
+        old_bits = np.zeros(size, dtype=np.uint8)
+        old_bits[:len(self._bits)] = self._bits
+        changed = np.flatnonzero((new_bits.reshape(-1, PAGE_SIZE) != old_bits.reshape(-1, PAGE_SIZE)).any(axis=1))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        with open(self.path, mode) as f:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            for page in changed:
+                f.seek(int(page) * PAGE_SIZE)
+                f.write(new_bits[page * PAGE_SIZE:(page + 1) * PAGE_SIZE].tobytes())
+        self._remap()
+        self.version = version
+        return len(changed)
+
+
+# 癌症文献位图
+cancer_bitmap = PMIDBitmap(Config.is_cancer_bitmap_path)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 10:05
+# @File : cache.py
+# @Project : OncoPubMinerAPI
+"""
+进程内缓存
+
+LRUCache按字节数限制容量(而不是条目数), 通过version与数据库stat表中的postingVersion对齐:
+Monitor写入新的实体识别结果后版本号递增, 定时任务检测到版本变化时清空缓存。
+可以设置过期时间(ttl), 以及多个进程共享的磁盘缓存(DiskCache, 只用于bytes类型的值)作为第二级缓存。
+倒排表的共享缓存(ArrayDiskCache)保存解码后的PMID数组, 读取时通过mmap映射, 多个worker进程共享同一份页缓存。
+"""
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import Config
+
+# 每个缓存条目除value外的大致开销(key, OrderedDict节点等)
+ENTRY_OVERHEAD = 128
+
+caches = {}
+
+
+def sizeof(value):
+    """估算缓存值占用的内存"""
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes + ENTRY_OVERHEAD
+    if isinstance(value, (bytes, str)):
+        return len(value) + ENTRY_OVERHEAD
+    return sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+class DiskCache(object):
+    """
+    磁盘缓存, 同一台机器上的多个worker进程共享
+    每个数据版本一个子目录, 每个条目一个文件, 文件头记录数据版本号和过期时间, 版本号不一致或已过期的条目视为不存在
+    版本切换期间新旧版本的worker各自读写自己的子目录, 清理时只删除更旧的版本
+    """
+    HEADER = struct.Struct('<qd')
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, version):
+        return os.path.join(self.directory, str(self._version(version)),
+                            hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def _version(version):
+        return -1 if version is None else int(version)
+
+    def get(self, key, version):
+        try:
+            with open(self._path(key, version), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < self.HEADER.size:
+            return None
+        file_version, expires = self.HEADER.unpack_from(data)
+        if file_version != self._version(version) or (expires and expires < time.time()):
+            return None
+        return data[self.HEADER.size:], expires
+
+    def put(self, key, value, version, expires):
+        path = self._path(key, version)
+        # 先写临时文件再重命名, 其他进程不会读到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(self.HEADER.pack(self._version(version), expires or 0))
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f'write disk cache error: {e}')
+
+    def purge(self, version):
+        """删除比version旧的版本和当前版本中已过期的条目, 不删除其他worker正在使用的更新的版本"""
+        version = self._version(version)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                # 没有按版本分目录时写入的条目
+                self._remove(path)
+                continue
+            try:
+                directory_version = int(name)
+            except ValueError:
+                continue
+            if directory_version < version:
+                shutil.rmtree(path, ignore_errors=True)
+            elif directory_version == version:
+                self._purge_expired(path)
+
+    def _purge_expired(self, directory):
+        now = time.time()
+        for filename in os.listdir(directory):
+            if filename.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, 'rb') as f:
+                    header = f.read(self.HEADER.size)
+            except OSError:
+                continue
+            expires = self.HEADER.unpack(header)[1] if len(header) == self.HEADER.size else -1
+            if expires and expires < now:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ArrayDiskCache(DiskCache):
+    """
+    numpy数组的磁盘缓存, 文件内容为文件头+数组数据
+    读取时mmap映射为只读数组, 不复制数据, 多个进程映射同一个文件时共享物理内存
+    文件被替换或删除后已映射的数组仍然有效
+    """
+
+    def __init__(self, directory, dtype):
+        super().__init__(directory)
+        self.dtype = np.dtype(dtype)
+
+    def get(self, key, version):
+        try:
+            with open(self._path(key, version), 'rb') as f:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return None
+                file_version, expires = self.HEADER.unpack(header)
+                if file_version != self._version(version) or (expires and expires < time.time()):
+                    return None
+                count = (os.fstat(f.fileno()).st_size - self.HEADER.size) // self.dtype.itemsize
+                if not count:
+                    return np.zeros(0, dtype=self.dtype), expires
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        return np.frombuffer(data, dtype=self.dtype, count=count, offset=self.HEADER.size), expires
+
+    def put(self, key, value, version, expires):
+        super().put(key, np.ascontiguousarray(value, dtype=self.dtype).tobytes(), version, expires)
+
+
+class LRUCache(object):
+    def __init__(self, name, max_bytes, ttl=None, disk_directory=None, disk=None):
+        """
+        :param name: 缓存名称
+        :param max_bytes: 容量(字节)
+        :param ttl: 过期时间(秒), None表示不过期
+        :param disk_directory: 磁盘缓存目录, None表示不使用磁盘缓存
+        :param disk: 自定义的磁盘缓存(如ArrayDiskCache), 优先于disk_directory
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = disk if disk is not None else DiskCache(disk_directory) if disk_directory else None
+        self.version = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                value, _, expires = self._data[key]
+                if not expires or expires >= time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self.bytes -= self._data.pop(key)[1]
+        if self.disk is not None:
+            result = self.disk.get(key, self.version)
+            if result is not None:
+                value, expires = result
+                self._put(key, value, sizeof(value), expires)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value, size=None):
+        size = size if size is not None else sizeof(value)
+        expires = time.time() + self.ttl if self.ttl else None
+        if self._put(key, value, size, expires) and self.disk is not None:
+            self.disk.put(key, value, self.version, expires)
+
+    def _put(self, key, value, size, expires):
+        # 单个条目超过容量的1/4不缓存, 避免一个超大条目清空整个缓存
+        if size > self.max_bytes // 4:
+            return False
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._data:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def set_version(self, version):
+        """数据版本变化时清空缓存"""
+        if version != self.version:
+            self.clear()
+            self.version = version
+            if self.disk is not None:
+                self.disk.purge(version)
+
+    def stats(self):
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "hitRate": round((self.hits + self.disk_hits) / total, 4) if total else 0.0,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "version": self.version
+        }
+
+
+# 实体倒排表缓存 key: ('library', library_id) / ('mention', mention_id), value: 升序PMID数组
+# 配置了POSTING_SHARED_DIR时, 解码后的数组写入共享目录, 其他worker进程直接mmap映射
+posting_cache = LRUCache('posting', Config.POSTING_CACHE_BYTES,
+                         disk=ArrayDiskCache(Config.POSTING_SHARED_DIR, np.uint32)
+                         if Config.POSTING_SHARED_DIR else None)
+# 查询结果缓存 key: (by_type, 规范化后的查询语句), value: 升序PMID数组或需要消歧的标准库列表
+result_cache = LRUCache('result', Config.RESULT_CACHE_BYTES, ttl=Config.RESULT_CACHE_TTL)
+# 分页响应缓存 key: (by_type, q, t, m, p, l, cursor), value: 完整的响应体bytes
+page_cache = LRUCache('page', Config.PAGE_CACHE_BYTES, ttl=Config.RESULT_CACHE_TTL,
+                      disk_directory=Config.PAGE_CACHE_DIR)
+
+
+def set_data_version(version):
+    """同步数据版本号到所有缓存"""
+    for cache in caches.values():
+        cache.set_version(version)
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 18:30
+# @File : citation_graph.py
+# @Project : OncoPubMinerAPI
+"""
+文献引用关系图(只读)
+
+与 OncoPubMinerMonitor/pub_miner/citation_graph.py 使用同一种格式, 由Monitor写入:
+    BioCJsonDirPATH/GRAPH/<cite|cited>/index.bin   以PMID为下标的定长索引
+    BioCJsonDirPATH/GRAPH/<cite|cited>/edges.bin   只追加写入的int32 PMID数组
+
+    index entry(16 bytes): offset(Q) count(I) flags(I), offset/count以PMID个数为单位, flags为0表示没有数据
+
+一篇文献的相关文献是edges中连续的一段(升序), 通过mmap映射后直接返回numpy视图, 分页只需要切片。
+GRAPH/library 使用相同的格式保存每篇文献关联的标准库id, 用于统计检索结果中共同出现的实体。
+"""
+import mmap
+import os
+import threading
+
+import numpy as np
+
+from config import Config
+
+ENTRY_DTYPE = np.dtype([('offset', '<u8'), ('count', '<u4'), ('flags', '<u4')])
+EDGE_DTYPE = np.dtype('<i4')
+FLAG_PRESENT = 1
+
+
+def map_array(path, dtype):
+    """文件只读映射为numpy数组, 文件不存在或为空时返回None"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if size < dtype.itemsize:
+        return None
+    with open(path, 'rb') as f:
+        return np.frombuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), dtype=dtype,
+                             count=size // dtype.itemsize)
+
+
+class CitationGraph(object):
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.bin')
+        self.edges_path = os.path.join(root, 'edges.bin')
+        self._index = np.zeros(0, dtype=ENTRY_DTYPE)
+        self._edges = np.zeros(0, dtype=EDGE_DTYPE)
+        self._lock = threading.Lock()
+
+    def _remap(self, index_size, edges_size):
+        """索引扩容或edges被追加写入后重新映射"""
+        with self._lock:
+            if index_size > len(self._index):
+                index = map_array(self.index_path, ENTRY_DTYPE)
+                if index is not None:
+                    self._index = index
+            if edges_size > len(self._edges):
+                edges = map_array(self.edges_path, EDGE_DTYPE)
+                if edges is not None:
+                    self._edges = edges
+
+    def get(self, pub_id):
+        """
+        :return: 升序的相关文献PMID数组(只读视图), 没有数据时返回None
+        """
+        key = int(pub_id)
+        if key >= len(self._index):
+            self._remap(key + 1, 0)
+            if key >= len(self._index):
+                return None
+        entry = self._index[key]
+        if not entry['flags'] & FLAG_PRESENT:
+            return None
+        start = int(entry['offset'])
+        end = start + int(entry['count'])
+        if end > len(self._edges):
+            self._remap(0, end)
+            if end > len(self._edges):
+                return None
+        return self._edges[start:end]
+
+    def gather(self, pub_ids):
+        """
+        多篇文献的相关数据首尾相接(向量化), 用于统计
+        :param pub_ids: PMID数组
+        :return: int32数组
+        """
+        keys = np.asarray(pub_ids, dtype=np.int64)
+        if len(keys) and int(keys.max()) >= len(self._index):
+            self._remap(int(keys.max()) + 1, 0)
+        entries = self._index[keys[keys < len(self._index)]]
+        entries = entries[(entries['flags'] & FLAG_PRESENT) != 0]
+        starts = entries['offset'].astype(np.int64)
+        counts = entries['count'].astype(np.int64)
+        if len(counts) and int((starts + counts).max()) > len(self._edges):
+            self._remap(0, int((starts + counts).max()))
+            in_range = starts + counts <= len(self._edges)
+            starts, counts = starts[in_range], counts[in_range]
+        total = int(counts.sum())
+        if not total:
+            return np.zeros(0, dtype=EDGE_DTYPE)
+        # 每一段的起始位置重复count次, 加上段内偏移
+        shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self._edges[shifts + np.arange(total, dtype=np.int64)]
+
+
+graphs = {
+    'ref': CitationGraph(os.path.join(Config.CitationGraphPATH, 'cite')),
+    'cited_by': CitationGraph(os.path.join(Config.CitationGraphPATH, 'cited')),
+}
+# 文献关联的标准库id
+library_graph = CitationGraph(os.path.join(Config.CitationGraphPATH, 'library'))
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 20:40
+# @File : codec.py
+# @Project : OncoPubMinerAPI
+"""
+文献JSON解析/序列化进程池
+
+PMC全文的json.loads/json.dumps是CPU密集的操作, 而且C实现在整个调用期间都持有GIL, 放到线程中执行
+同样会阻塞gevent事件循环, 一篇大的全文会让其他所有请求等待。
+这里fork出几个子进程, 解析/合并/序列化都在子进程中完成, 通过socketpair只传回最终的响应字节,
+事件循环只需要等待socket可读, /stat /suggest 等小请求不受影响。
+    有界排队: 正在执行和排队的任务数超过上限时直接返回PoolBusy, 不无限堆积
+    截止时间: 超过deadline未完成时返回DeadlineExceeded, 正在执行的子进程被结束并重新fork
+    子进程在第一次使用时fork(pre-fork方式运行时每个worker各自fork), 父进程退出后子进程随之退出
+任务函数和参数通过pickle传递, 函数必须是模块级函数; 子进程中不能访问数据库。
+"""
+import json
+import logging
+import os
+import pickle
+import signal
+import socket
+import struct
+
+import gevent
+from gevent.lock import BoundedSemaphore
+from gevent.queue import Queue
+
+from config import Config
+
+HEADER = struct.Struct('<Q')
+
+
+class PoolBusy(Exception):
+    """排队的任务数已达上限"""
+
+
+class DeadlineExceeded(Exception):
+    """任务未在截止时间前完成"""
+
+
+def read_message(fd):
+    """子进程中阻塞读取一条消息, 父进程已退出时返回None"""
+    data = b''
+    size = None
+    while size is None or len(data) < size:
+        chunk = os.read(fd, 1 << 20 if size is None else min(1 << 20, size - len(data)))
+        if not chunk:
+            return None
+        data += chunk
+        if size is None and len(data) >= HEADER.size:
+            size = HEADER.unpack_from(data)[0] + HEADER.size
+    return data[HEADER.size:]
+
+
+def write_message(fd, data):
+    view = memoryview(HEADER.pack(len(data)) + data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class CodecWorker(object):
+    def __init__(self, inherited=()):
+        """
+        :param inherited: 其他子进程在父进程中的socket, fork后在子进程中关闭,
+                          否则父进程退出后子进程之间互相持有对方的socket, 收不到EOF
+        """
+        self.sock, child = socket.socketpair()
+        self.pid = os.fork()
+        if not self.pid:
+            for sock in inherited:
+                sock.close()
+            self.sock.close()
+            self.serve(child.detach())
+        child.close()
+
+    @staticmethod
+    def serve(fd):
+        """
+        子进程: 只使用阻塞的os.read/os.write, 不切换到gevent事件循环, 不会执行从父进程继承的greenlet
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.set_blocking(fd, True)
+        try:
+            while True:
+                message = read_message(fd)
+                if message is None:
+                    break
+                func, args = pickle.loads(message)
+                try:
+                    reply = (True, func(*args))
+                except Exception as e:
+                    reply = (False, e)
+                try:
+                    data = pickle.dumps(reply, pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    data = pickle.dumps((False, RuntimeError(f'{type(reply[1]).__name__}: {e}')))
+                write_message(fd, data)
+        finally:
+            os._exit(0)
+
+    def call(self, func, args):
+        """
+        发送任务并等待结果, 等待期间事件循环可以处理其他请求
+        :return: (是否成功, 返回值或异常)
+        """
+        data = pickle.dumps((func, args), pickle.HIGHEST_PROTOCOL)
+        self.sock.sendall(HEADER.pack(len(data)) + data)
+        size = HEADER.unpack(self.recv(HEADER.size))[0]
+        return pickle.loads(self.recv(size))
+
+    def recv(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        while view:
+            received = self.sock.recv_into(view)
+            if not received:
+                raise EOFError('codec worker exited')
+            view = view[received:]
+        return bytes(buffer)
+
+    def kill(self):
+        self.sock.close()
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+
+
+class CodecPool(object):
+    def __init__(self, size, max_queue, deadline=None):
+        """
+        :param size: 子进程数
+        :param max_queue: 最多排队等待的任务数
+        :param deadline: 默认的截止时间(秒), None表示不限制
+        """
+        self.size = size
+        self.max_queue = max_queue
+        self.deadline = deadline
+        # 正在执行和排队的任务数上限
+        self._slots = BoundedSemaphore(size + max_queue)
+        self._workers = []
+        self._idle = Queue()
+        self._pid = None
+
+    def _start(self):
+        """在当前进程中第一次使用时fork子进程, fork之后继承来的子进程不能使用"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._workers = []
+        self._idle = Queue()
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = CodecWorker([worker.sock for worker in self._workers])
+        self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker):
+        self._workers.remove(worker)
+        worker.kill()
+        return self._spawn()
+
+    def run(self, func, *args, deadline=None):
+        """
+        在子进程中执行func(*args)并等待结果, func抛出的异常在当前进程中重新抛出
+        :param deadline: 截止时间(秒), 默认使用self.deadline
+        """
+        deadline = deadline or self.deadline
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy(f'more than {self.size + self.max_queue} pending tasks')
+        worker = None
+        timeout = gevent.Timeout(deadline, DeadlineExceeded(f'not finished in {deadline} seconds'))
+        timeout.start()
+        try:
+            self._start()
+            worker = self._idle.get()
+            ok, value = worker.call(func, args)
+        except (DeadlineExceeded, EOFError, OSError):
+            if worker is not None:
+                # 超时或子进程异常退出, 结果不再需要, 重新fork
+                logging.warning(f'replace codec worker {worker.pid}')
+                worker = self._replace(worker)
+            raise
+        finally:
+            timeout.close()
+            if worker is not None:
+                self._idle.put(worker)
+            self._slots.release()
+        if not ok:
+            raise value
+        return value
+
+    def stats(self):
+        return {"workers": self.size, "pending": self.size + self.max_queue - self._slots.counter}
+
+
+def dumps(data):
+    """与jsonify相同的序列化方式(按key排序, 紧凑格式), 返回bytes"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+codec_pool = CodecPool(Config.CODEC_WORKERS, Config.CODEC_QUEUE_SIZE, Config.CODEC_DEADLINE)
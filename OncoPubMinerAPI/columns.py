@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 23:10
+# @File : columns.py
+# @Project : OncoPubMinerAPI
+"""
+以PMID为下标的文献基本信息列(只读)
+
+与 OncoPubMinerMonitor/pub_miner/columns.py 使用同一种格式, 由Monitor写入:
+    BioCJsonDirPATH/COLUMNS/<column>.bin   每列一个文件, 第PMID个元素为该文献的值, 0表示没有数据
+
+每列通过mmap只读映射为numpy数组, 多个进程共享同一份页缓存。在候选PMID数组上向量化取值,
+按年份/是否有全文/是否有摘要过滤, 按年份/被引用数/影响因子取前N篇(argpartition), 不访问数据库。
+"""
+import mmap
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from config import Config
+
+COLUMNS = {
+    'year': np.uint16,
+    'journal_id': np.uint32,
+    'impact_factor': np.float32,
+    'cited_num': np.uint32,
+    'has_pmc': np.uint8,
+    'is_cancer': np.uint8,
+    'has_abstract': np.uint8,
+}
+# sort参数对应的列, 相同时PMID倒序
+SORT_COLUMNS = {'year': 'year', 'cited': 'cited_num', 'if': 'impact_factor'}
+# years: (起始年份, 结束年份)或None; has_pmc/has_abstract: True表示只返回有PMC全文/有摘要的文献
+ColumnFilter = namedtuple('ColumnFilter', ['years', 'has_pmc', 'has_abstract'])
+
+
+class PMIDColumns(object):
+    def __init__(self, root):
+        self.root = root
+        self._arrays = {}
+        self._sizes = {}
+        self._mmaps = {}
+        self._lock = threading.Lock()
+
+    def path(self, column):
+        return os.path.join(self.root, f'{column}.bin')
+
+    @property
+    def ready(self):
+        """Monitor是否已生成PMID列(build_pmid_columns)"""
+        return os.path.exists(self.path('year'))
+
+    def array(self, column):
+        """列数据, 文件被扩容后重新映射"""
+        try:
+            size = os.path.getsize(self.path(column))
+        except OSError:
+            size = 0
+        if size != self._sizes.get(column):
+            with self._lock:
+                if size != self._sizes.get(column):
+                    dtype = np.dtype(COLUMNS[column])
+                    if size:
+                        with open(self.path(column), 'rb') as f:
+                            self._mmaps[column] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        self._arrays[column] = np.frombuffer(self._mmaps[column], dtype=dtype,
+                                                             count=size // dtype.itemsize)
+                    else:
+                        self._arrays[column] = np.zeros(0, dtype=dtype)
+                    self._sizes[column] = size
+        return self._arrays[column]
+
+    def get(self, column, pub_ids):
+        """
+        :param pub_ids: PMID数组
+        :return: 与pub_ids等长的数组, 没有数据的PMID为0
+        """
+        array = self.array(column)
+        pub_ids = np.asarray(pub_ids, dtype=np.int64)
+        values = np.zeros(len(pub_ids), dtype=array.dtype)
+        in_range = pub_ids < len(array)
+        values[in_range] = array[pub_ids[in_range]]
+        return values
+
+    def filter(self, pub_ids, column_filter):
+        """按ColumnFilter过滤, 保持原来的顺序"""
+        mask = np.ones(len(pub_ids), dtype=bool)
+        if column_filter.years:
+            years = self.get('year', pub_ids)
+            mask &= (years >= column_filter.years[0]) & (years <= column_filter.years[1])
+        for column in ('has_pmc', 'has_abstract'):
+            if getattr(column_filter, column):
+                mask &= self.get(column, pub_ids) != 0
+        return pub_ids[mask]
+
+    def sort_keys(self, pub_ids, sort):
+        """倒序排列的键: 高32位为排序列的值, 低32位为PMID"""
+        values = self.get(SORT_COLUMNS[sort], pub_ids)
+        if sort == 'if':
+            # 影响因子保留3位小数
+            values = np.round(values.astype(np.float64) * 1000)
+        return (values.astype(np.int64) << 32) | np.asarray(pub_ids, dtype=np.int64)
+
+    def top(self, pub_ids, sort, offset, limit):
+        """
+        按sort倒序排列后的第offset到offset+limit篇, 只对前offset+limit篇排序
+        :param sort: year/cited/if
+        """
+        end = min(offset + limit, len(pub_ids))
+        if offset >= end:
+            return pub_ids[:0]
+        keys = -self.sort_keys(pub_ids, sort)
+        if end < len(pub_ids):
+            positions = np.argpartition(keys, end - 1)[:end]
+        else:
+            positions = np.arange(len(pub_ids))
+        positions = positions[np.argsort(keys[positions], kind='stable')]
+        return pub_ids[positions[offset:end]]
+
+    def sort(self, pub_ids, sort):
+        """全部按sort倒序排列"""
+        return pub_ids[np.argsort(-self.sort_keys(pub_ids, sort), kind='stable')]
+
+
+pmid_columns = PMIDColumns(Config.PMIDColumnsPATH)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 21:30
+# @File : compress.py
+# @Project : OncoPubMinerAPI
+"""
+响应压缩(gzip/brotli)和条件请求(ETag/If-None-Match)
+
+    压缩: 按Accept-Encoding选择br(安装了brotli时)或gzip, 在after_request中压缩JSON/NDJSON响应,
+          流式响应边输出边压缩
+    gzip响应只包含一个gzip member, 部分客户端(如Chromium)只读取第一个member
+    ETag: 由文献在打包存储中的版本和动态字段计算, 请求的If-None-Match匹配时返回304, 不读取文献
+"""
+import gzip
+import hashlib
+import zlib
+
+from flask import request, Response
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+COMPRESS_MIMETYPES = ['application/json', 'application/x-ndjson']
+
+
+def negotiate_encoding():
+    """
+    根据请求的Accept-Encoding选择压缩方式
+    :return: br/gzip, 不压缩时返回None
+    """
+    if not Config.COMPRESS_RESPONSES:
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag):
+    """
+    请求的If-None-Match与etag(或其压缩后的版本)匹配时返回304响应, 否则返回None
+    """
+    if not etag or not request.if_none_match:
+        return None
+    for tag in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if request.if_none_match.contains_weak(tag):
+            response = Response(status=304)
+            response.set_etag(tag)
+            return response
+    return None
+
+
+def gzip_stream(chunks, level):
+    """整个响应压缩为一个gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response):
+    """after_request: 按Accept-Encoding压缩响应, 流式响应边输出边压缩"""
+    if response.mimetype not in COMPRESS_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding() if response.status_code == 200 else None
+    if response.is_streamed:
+        body = response.response
+        if encoding:
+            response.headers.pop('Content-Length', None)
+        if encoding == 'gzip':
+            response.response = gzip_stream(body, Config.GZIP_LEVEL)
+        elif encoding == 'br':
+            response.response = brotli_stream(body, Config.BROTLI_QUALITY)
+    elif encoding:
+        data = response.get_data()
+        if len(data) < Config.COMPRESS_MIN_BYTES:
+            return response
+        if encoding == 'gzip':
+            response.set_data(gzip.compress(data, Config.GZIP_LEVEL))
+        else:
+            response.set_data(brotli.compress(data, quality=Config.BROTLI_QUALITY))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            # 压缩后的内容不同, 使用不同的强ETag
+            response.set_etag(f'{etag}-{encoding}', weak)
+    return response
@@ -4,6 +4,7 @@
 # @Project : OncoPubMinerAPI
 import logging
 import os
+import tempfile
 
 # Mysql user
 DB_USERNAME = "xxx"
@@ -35,17 +36,88 @@ class Config:
 
     LABEL_DICT = {0: "Gene", 1: "Disease", 2: "Chemical", 3: "Mutation"}
     per_page = 10
-    is_cancer_pub_path = os.path.join(BASE_DIR, "data", 'is_cancer.txt')
-    if os.path.isfile(is_cancer_pub_path):
-        with open(is_cancer_pub_path, 'r', encoding='utf-8') as f:
-            cancer_pubmed_ids = {int(pub_id) for pub_id in f.read().strip().split('|') if pub_id}
-    else:
-        cancer_pubmed_ids = set()
+    # 癌症文献位图(以PMID为下标), 由定时任务update_pub_med_base维护
+    is_cancer_bitmap_path = os.path.join(BASE_DIR, "data", 'is_cancer.bitmap')
+    # 位图尚未生成时按页码(非cursor)翻页最多跳过的癌症文献数, 超过时返回503
+    CANCER_FALLBACK_MAX_OFFSET = 1000
     LOG_LEVEL = logging.DEBUG
+    # 实体倒排表LRU缓存容量(字节)
+    POSTING_CACHE_BYTES = 256 * 1024 * 1024
+    # 多个worker进程共享的倒排表(解码后的PMID数组)目录, 通过mmap读取, None表示不共享
+    POSTING_SHARED_DIR = None
+    # worker进程数, 大于1时以pre-fork方式运行(python manage.py -w N)
+    WORKERS = 1
+    # 输入联想: 单次最多返回个数, 匹配范围超过阈值的前缀预先计算结果, 原生词关联文献数下限
+    SUGGEST_MAX_LIMIT = 50
+    SUGGEST_RANGE_THRESHOLD = 4096
+    SUGGEST_MENTION_MIN_LENGTH = 2
+    # /search /keyword 查询结果(PMID数组)缓存和分页响应缓存的容量(字节)与过期时间(秒)
+    RESULT_CACHE_BYTES = 128 * 1024 * 1024
+    PAGE_CACHE_BYTES = 256 * 1024 * 1024
+    RESULT_CACHE_TTL = 600
+    # 多个worker进程共享的分页响应磁盘缓存目录, None表示不使用
+    PAGE_CACHE_DIR = None
+    # 超过该大小的分页响应不缓存
+    PAGE_CACHE_ENTRY_BYTES = 4 * 1024 * 1024
 
     Entrez_email = "xxx"  # Always tell NCBI who you are
+    # NCBI api key, 有api key时每秒最多10次请求, 否则3次
+    NCBI_API_KEY = None
+    NCBI_REQUESTS_PER_SECOND = 3
+    # 令牌桶状态文件, 同一台机器上的API worker和Monitor共用每秒请求数, None表示每个进程单独限流
+    NCBI_RATE_LIMIT_FILE = os.path.join(tempfile.gettempdir(), 'oncopubminer-eutils.rate')
+    # E-utilities地址(可以指向本地的模拟服务), 超时时间(秒)和重试次数
+    EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+    EUTILS_TIMEOUT = 30
+    EUTILS_RETRIES = 3
+    # E-utilities响应的磁盘缓存目录(None表示不缓存)和有效期(秒)
+    EUTILS_CACHE_DIR = None
+    EUTILS_CACHE_TTL = 24 * 3600
+    # 一次elink请求最多携带的PMID数
+    ELINK_BATCH_SIZE = 100
+    # 相似文献刷新周期(秒), 以及没有任何数据时请求等待刷新的最长时间(秒)
+    SIMILAR_REFRESH_SECONDS = 30 * 24 * 3600
+    ELINK_WAIT_SECONDS = 10
+    # 多个worker进程合并同一PMID刷新的标记文件目录(None表示只在进程内合并), 超过有效期(秒)的标记视为进程已退出
+    ELINK_CLAIM_DIR = os.path.join(tempfile.gettempdir(), 'oncopubminer-elink')
+    ELINK_CLAIM_SECONDS = 120
     # OncoPubMinerMonitor项目中PubMiner.settings.default.yml全局配置中upload:local-directory对应的路径
     BioCJsonDirPATH = 'xxx'
+    # Monitor写入的BioC Json打包存储
+    DocumentStorePATH = os.path.join(BioCJsonDirPATH, 'STORE')
+    # Monitor写入的引用关系图
+    CitationGraphPATH = os.path.join(BioCJsonDirPATH, 'GRAPH')
+    # 远程查询(m=remote)时并发读取文献内容的线程数
+    HYDRATE_THREADS = 8
+    # 全文JSON解析/序列化进程池: 子进程数, 最多排队的请求数, 每个请求的截止时间(秒)
+    CODEC_WORKERS = 4
+    CODEC_QUEUE_SIZE = 32
+    CODEC_DEADLINE = 10
+    # /documents: 单次请求最多的id数, 每批查询数据库的id数, 每个解析任务的文献数和截止时间(秒)
+    BULK_MAX_IDS = 50000
+    BULK_BATCH_SIZE = 500
+    BULK_CODEC_BATCH = 50
+    BULK_DEADLINE = 60
+    # /documents同时占用的解析子进程数(所有请求合计), 小于CODEC_WORKERS, 其余子进程留给/id等请求
+    BULK_CODEC_JOBS = max(1, CODEC_WORKERS - 1)
+    # JSON/NDJSON响应压缩: 是否压缩, 最小压缩字节数(非流式响应), gzip压缩级别, brotli质量(安装了brotli时可用)
+    COMPRESS_RESPONSES = True
+    COMPRESS_MIN_BYTES = 1024
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 4
+    # /ref /cited_by /similar 排序字段
+    CORRELATION_SORTS = ['year', 'if']
+    # Monitor写入的以PMID为下标的文献基本信息列
+    PMIDColumnsPATH = os.path.join(BioCJsonDirPATH, 'COLUMNS')
+    # /search /keyword 排序字段: 年份, 被引用数, 影响因子
+    SEARCH_SORTS = ['year', 'cited', 'if']
+    # /search/facets 杂志和实体返回的最大个数
+    FACET_TOP_MAX = 100
+    # Monitor根据 *_relationship 表生成的标准库共现矩阵
+    RelationMatrixPATH = os.path.join(BioCJsonDirPATH, 'RELATIONS', 'relations.bin')
+    # /relations type参数对应的标准库类型, 返回的最大个数
+    RELATION_TYPES = {'gene': 0, 'cancer': 1, 'disease': 1, 'chemical': 2, 'mutation': 3}
+    RELATION_TOP_MAX = 500
 
 
 
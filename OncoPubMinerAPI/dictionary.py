@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 13:40
+# @File : dictionary.py
+# @Project : OncoPubMinerAPI
+"""
+标准库(Library/CancerLibrary/GeneLibrary/ChemLibrary)的内存词典
+
+启动后首次使用时从数据库加载symbol和全部synonyms, 之后的消歧和联想查询都在内存中完成,
+不再对synonyms TEXT字段执行 LIKE '%query%' 全表扫描。
+key统一转为小写, 与MySQL默认的大小写不敏感排序规则一致:
+    精确匹配/前缀匹配: 有序key数组上二分查找
+    子串匹配: 在以换行符拼接的全部key上做一次C实现的字符串扫描, 再二分定位所属key
+key只保存为一个拼接后的字符串和numpy下标数组, 不为每个key保留一个str对象:
+多进程运行时master加载后fork出的worker查询时不会修改这些对象的引用计数, 内存页在进程间共享, 不会被逐渐复制。
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+import numpy as np
+
+from model import Library, CancerLibrary, GeneLibrary, ChemLibrary
+from PubMiner import db
+
+LibraryEntry = namedtuple('LibraryEntry', ['id', 'identifier', 'symbol', 'synonyms', 'label'])
+
+EMPTY_INDEX = np.zeros(0, dtype=np.int64)
+# 大于任何字符, 用于计算前缀查找的右边界
+MAX_CHAR = '\U0010ffff'
+
+
+def split_synonyms(synonyms):
+    return [synonym for synonym in synonyms.split('|') if synonym.strip()] if synonyms else []
+
+
+class KeySequence(object):
+    """以换行符拼接的有序key文本上的只读序列, 用于二分查找"""
+
+    def __init__(self, keys):
+        self.text = '\n'.join(keys)
+        # 每个key在text中的起始位置, 最后一个元素为text长度+1
+        self.starts = np.cumsum([0] + [len(key) + 1 for key in keys]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        return self.text[int(self.starts[index]):int(self.starts[index + 1]) - 1]
+
+
+class KeyIndex(object):
+    """有序key数组, 查询结果为key所属记录的下标"""
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        self.keys = KeySequence([key for key, _ in pairs])
+        self.owners = np.array([owner for _, owner in pairs], dtype=np.int64)
+        self.text = self.keys.text
+        self.starts = self.keys.starts[:-1]
+
+    def exact(self, query):
+        return self.owners[bisect_left(self.keys, query):bisect_right(self.keys, query)]
+
+    def prefix_range(self, query):
+        """前缀匹配的key下标范围 [lo, hi)"""
+        return bisect_left(self.keys, query), bisect_left(self.keys, query + MAX_CHAR)
+
+    def prefix(self, query):
+        lo, hi = self.prefix_range(query)
+        return self.owners[lo:hi]
+
+    def substring(self, query):
+        if not query or '\n' in query:
+            return EMPTY_INDEX
+        positions = np.fromiter((match.start() for match in re.finditer(re.escape(query), self.text)),
+                                dtype=np.int64)
+        if len(positions) == 0:
+            return EMPTY_INDEX
+        return self.owners[np.searchsorted(self.starts, positions, side='right') - 1]
+
+
+class EntityDictionary(object):
+    def __init__(self, entries):
+        # 记录按id升序, 查询结果的记录下标顺序即数据库主键顺序
+        self.entries = sorted(entries, key=lambda entry: entry.id)
+        self.ids = np.array([entry.id for entry in self.entries], dtype=np.int64)
+        # CancerLibrary/GeneLibrary/ChemLibrary没有label, 记为-1
+        self.labels = np.array([-1 if entry.label is None else entry.label for entry in self.entries], dtype=np.int64)
+        self.identifiers = {entry.identifier: index for index, entry in enumerate(self.entries) if entry.identifier}
+        self.symbols = KeyIndex([(entry.symbol.lower(), index) for index, entry in enumerate(self.entries)
+                                 if entry.symbol])
+        self.synonyms = KeyIndex([(synonym.lower(), index) for index, entry in enumerate(self.entries)
+                                  for synonym in set(split_synonyms(entry.synonyms))])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def by_identifier(self, identifier, label=None):
+        index = self.identifiers.get(identifier)
+        if index is None or (label is not None and self.labels[index] != label):
+            return []
+        return [self.entries[index]]
+
+    def index_of(self, ids):
+        """id数组对应的记录下标, 不存在的id为-1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        indexes = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(self.ids[indexes] == ids, indexes, -1)
+
+    def label_in(self, indexes, labels):
+        return indexes[np.isin(self.labels[indexes], labels)]
+
+    def ranked(self, *groups):
+        """按分组顺序合并查询结果并去重, 组内按主键顺序"""
+        seen, entries = set(), []
+        for group in groups:
+            for index in np.unique(group).tolist():
+                if index not in seen:
+                    seen.add(index)
+                    entries.append(self.entries[index])
+        return entries
+
+
+class DictionaryLoader(object):
+    """首次使用时加载词典, 定时任务触发时重新加载"""
+
+    def __init__(self, name, load_func, builder=EntityDictionary):
+        self.name = name
+        self.load_func = load_func
+        self.builder = builder
+        self.dictionary = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.dictionary is None:
+            with self._lock:
+                if self.dictionary is None:
+                    self.dictionary = self.build()
+        return self.dictionary
+
+    def build(self):
+        start_time = time.time()
+        dictionary = self.builder(self.load_func())
+        logging.info(f'load {self.name} dictionary: {len(dictionary)} entries, takes {time.time() - start_time}')
+        return dictionary
+
+    def reload(self):
+        """重新构建后整体替换, 构建期间的查询仍使用旧词典"""
+        if self.dictionary is not None:
+            self.dictionary = self.build()
+
+
+def load_library_entries():
+    return [LibraryEntry(*row) for row in db.session.query(Library.id, Library.identifier, Library.symbol,
+                                                           Library.synonyms, Library.label)]
+
+
+def load_symbol_entries(model):
+    def load():
+        return [LibraryEntry(row_id, identifier, symbol, synonyms, None) for row_id, identifier, symbol, synonyms
+                in db.session.query(model.id, model.identifier, model.symbol, model.synonyms)]
+    return load
+
+
+dictionaries = {
+    'library': DictionaryLoader('library', load_library_entries),
+    'cancer': DictionaryLoader('cancer', load_symbol_entries(CancerLibrary)),
+    'gene': DictionaryLoader('gene', load_symbol_entries(GeneLibrary)),
+    'chemical': DictionaryLoader('chemical', load_symbol_entries(ChemLibrary)),
+}
+
+
+def reload_dictionaries():
+    for loader in dictionaries.values():
+        loader.reload()
+
+
+def match_library(query_field):
+    """
+    与原 LIKE 查询的匹配规则一致:
+    symbol前缀匹配, 或Gene/Chemical的synonym前缀匹配, 或Disease的synonym子串匹配, 按label倒序
+    """
+    query_field = query_field.strip()
+    dictionary = dictionaries['library'].get()
+    for prefix, label in (('@GE@', 0), ('@CA@', 1), ('@DR@', 2)):
+        if query_field.startswith(prefix):
+            return dictionary.by_identifier(query_field[4:], label)
+    query = query_field.lower()
+    indexes = np.unique(np.concatenate((dictionary.symbols.prefix(query),
+                                        dictionary.label_in(dictionary.synonyms.prefix(query), [0, 2]),
+                                        dictionary.label_in(dictionary.synonyms.substring(query), [1]))))
+    indexes = indexes[np.argsort(-dictionary.labels[indexes], kind='stable')]
+    return [dictionary.entries[index] for index in indexes.tolist()]
+
+
+def sorted_library(query_field):
+    """按匹配度排序: symbol精确匹配 > synonym精确匹配 > symbol前缀匹配 > 子串匹配"""
+    query = query_field.strip().lower()
+    dictionary = dictionaries['library'].get()
+    synonym_prefix = dictionary.synonyms.prefix(query)
+    return dictionary.ranked(dictionary.symbols.exact(query),
+                             dictionary.synonyms.exact(query),
+                             dictionary.symbols.prefix(query),
+                             np.concatenate((dictionary.symbols.substring(query),
+                                             dictionary.label_in(synonym_prefix, [1, 2]),
+                                             dictionary.label_in(dictionary.synonyms.substring(query), [0]))))
+
+
+def match_symbols(library_type, query):
+    """癌症/基因/化合物标准词查询: symbol子串匹配或synonym精确匹配, 按匹配度排序"""
+    query = query.strip().lower()
+    dictionary = dictionaries[library_type].get()
+    entries = dictionary.ranked(dictionary.symbols.exact(query), dictionary.synonyms.exact(query),
+                                dictionary.symbols.prefix(query), dictionary.symbols.substring(query))
+    return [entry.symbol for entry in entries if entry.symbol]
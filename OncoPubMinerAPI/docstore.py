@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 16:40
+# @File : docstore.py
+# @Project : OncoPubMinerAPI
+"""
+BioC Json文献打包存储(只读)
+
+与 OncoPubMinerMonitor/pub_miner/docstore.py 使用同一种格式, 由Monitor写入:
+    BioCJsonDirPATH/STORE/<PUBMED|PMC>/index.bin           以文献id(PMID/PMC id的数字部分)为下标的定长索引
+    BioCJsonDirPATH/STORE/<PUBMED|PMC>/segment-00000.dat   只追加写入的数据段, 每篇文献一条UTF-8 JSON记录
+
+    index entry(16 bytes): segment(H) flags(H) length(I) offset(Q), flags为0表示文献不存在
+    record: [splice(I)] [passages_length(I) passages] [gzip_split(I)] JSON
+        FLAG_SPLICE: 第一个段落infons的拼接位置(相对JSON起始位置)
+        FLAG_PASSAGES: 段落表, JSON数组 [[start, end, section], ...], 每个段落在JSON中的起止位置和章节
+        FLAG_GZIP: JSON以拼接位置为界分为两个gzip member保存, gzip_split为第一个member的长度
+
+索引和数据段都通过mmap只读映射, 读取一篇文献不需要open/stat等系统调用, 多个进程共享同一份页缓存。
+在线程池中并发读取时使用pread(读取磁盘期间释放GIL), 索引同时作为文献是否存在的位图, 可以批量过滤PMID。
+PubMed文献的基本信息(PUBMED_INFOS)已在写入时合并到第一个段落的infons中, 影响因子/引用数等动态字段
+在写入时被去掉, 返回时直接拼接到记录的字节中(get_chunks), 不需要解析和重新序列化JSON。
+按章节/字段裁剪(Projection)时根据段落表只取需要的段落, 其余段落不解析; 只裁剪章节时选中的段落也不解析。
+gzip保存的记录在读取时解压, 响应压缩在compress.py中统一处理。
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from config import Config
+
+ENTRY_DTYPE = np.dtype([('segment', '<u2'), ('flags', '<u2'), ('length', '<u4'), ('offset', '<u8')])
+SPLICE_HEADER = struct.Struct('<I')
+FLAG_PRESENT = 1
+FLAG_SPLICE = 2
+FLAG_PASSAGES = 4
+FLAG_GZIP = 8
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+INDEX_NAME = 'index.bin'
+# 索引文件修改时间的检查间隔(秒), 修改后关闭已被Monitor整理删除的数据段
+SEGMENT_CHECK_SECONDS = 1
+# 被删除数据段的文件描述符延迟关闭(秒), 避免其他线程正在pread时关闭后编号被复用
+FD_RETIRE_SECONDS = 60
+# 段落中可以去掉的字段, 去掉后保留空值, offset和infons始终返回
+PASSAGE_FIELDS = ['text', 'sentences', 'annotations', 'relations']
+EMPTY_VALUES = {'text': '', 'sentences': [], 'annotations': [], 'relations': []}
+# sections: 返回的章节(小写的section_type/type, 如title/abstract/intro/methods), None表示全部,
+#           第一个段落包含标题和文献基本信息, 始终返回
+# fields: 段落中返回的字段(PASSAGE_FIELDS的子集), None表示全部
+Projection = namedtuple('Projection', ['sections', 'fields'])
+# 只读取第一个段落
+FIRST_PASSAGE = Projection(sections=(), fields=None)
+
+
+def segment_name(segment):
+    return f'segment-{segment:05d}.dat'
+
+
+def doc_key(doc_id):
+    """PMID或PMC id转换为索引下标"""
+    doc_id = str(doc_id).strip()
+    return int(doc_id[3:] if doc_id.upper().startswith('PMC') else doc_id)
+
+
+def project_passage(passage, fields):
+    """段落中不在fields中的字段替换为空值"""
+    for field in PASSAGE_FIELDS:
+        if field not in fields and field in passage:
+            passage[field] = EMPTY_VALUES[field]
+    return passage
+
+
+def project_document(document, projection):
+    """已解析的文献按projection裁剪, 用于没有段落表的记录和旧的json文件"""
+    if projection is None or not document.get('passages'):
+        return document
+    passages = document['passages']
+    if projection.sections is not None:
+        passages = passages[:1] + [passage for passage in passages[1:] if passage_section(passage) in
+                                   projection.sections]
+    if projection.fields is not None:
+        passages = [project_passage(passage, projection.fields) for passage in passages]
+    document['passages'] = passages
+    return document
+
+
+def passage_section(passage):
+    """段落所属章节: PMC文献为section_type(TITLE/ABSTRACT/INTRO/METHODS...), PubMed文献为type(title/abstract)"""
+    infons = passage.get('infons') or {}
+    return str(infons.get('section_type') or infons.get('type') or '').lower()
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class DocumentStore(object):
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._index = np.zeros(0, dtype=ENTRY_DTYPE)
+        self._index_mmap = None
+        self._segments = {}
+        self._fds = {}
+        self._retired_fds = []
+        self._index_mtime = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        """索引文件是否已生成"""
+        return os.path.exists(self.index_path)
+
+    def _remap_index(self):
+        """索引文件扩容后重新映射"""
+        try:
+            size = os.path.getsize(self.index_path)
+        except OSError:
+            return
+        with self._lock:
+            if size // ENTRY_DTYPE.itemsize != len(self._index):
+                self._index_mmap = map_file(self.index_path) if size else None
+                self._index = np.frombuffer(self._index_mmap, dtype=ENTRY_DTYPE, count=size // ENTRY_DTYPE.itemsize) \
+                    if size else np.zeros(0, dtype=ENTRY_DTYPE)
+
+    def _entry(self, key):
+        if key >= len(self._index):
+            self._remap_index()
+            if key >= len(self._index):
+                return None
+        entry = self._index[key]
+        return entry if entry['flags'] & FLAG_PRESENT else None
+
+    def _segment(self, segment, end):
+        """数据段被追加写入后, 映射范围不足时重新映射"""
+        segment_mmap = self._segments.get(segment)
+        if segment_mmap is None or len(segment_mmap) < end:
+            with self._lock:
+                segment_mmap = self._segments.get(segment)
+                if segment_mmap is None or len(segment_mmap) < end:
+                    segment_mmap = map_file(os.path.join(self.root, segment_name(segment)))
+                    self._segments[segment] = segment_mmap
+        return segment_mmap
+
+    def _fd(self, segment):
+        fd = self._fds.get(segment)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(segment)
+                if fd is None:
+                    fd = self._fds[segment] = os.open(os.path.join(self.root, segment_name(segment)), os.O_RDONLY)
+        return fd
+
+    def _check_segments(self):
+        """索引文件修改后重新读取数据段列表, 释放已删除数据段的映射和文件描述符"""
+        now = time.time()
+        if now - self._checked < SEGMENT_CHECK_SECONDS:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._index_mtime:
+            self._index_mtime = mtime
+            self._drop_missing_segments()
+        elif self._retired_fds:
+            self._close_retired_fds()
+
+    def _drop_missing_segments(self):
+        existing = set(name for name in os.listdir(self.root) if name.startswith('segment-'))
+        with self._lock:
+            for segment in [segment for segment in self._segments if segment_name(segment) not in existing]:
+                # 其他线程仍在使用的映射在引用释放后自动关闭
+                del self._segments[segment]
+            for segment in [segment for segment in self._fds if segment_name(segment) not in existing]:
+                self._retired_fds.append((time.time(), self._fds.pop(segment)))
+        self._close_retired_fds()
+
+    def _close_retired_fds(self):
+        with self._lock:
+            while self._retired_fds and time.time() - self._retired_fds[0][0] > FD_RETIRE_SECONDS:
+                os.close(self._retired_fds.pop(0)[1])
+
+    def contains(self, doc_id):
+        try:
+            return self._entry(doc_key(doc_id)) is not None
+        except ValueError:
+            return False
+
+    def contains_many(self, doc_ids):
+        """
+        批量判断文献是否存在
+        :param doc_ids: PMID数组
+        :return: 与doc_ids等长的bool数组
+        """
+        keys = np.asarray(doc_ids, dtype=np.int64)
+        if len(keys) and int(keys.max()) >= len(self._index):
+            self._remap_index()
+        index = self._index
+        in_range = (keys >= 0) & (keys < len(index))
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[in_range] = index['flags'][keys[in_range]] & FLAG_PRESENT != 0
+        return mask
+
+    def _locate(self, doc_id, pread=False):
+        """
+        :param pread: 通过pread读取记录, 否则返回数据段mmap
+        :return: (记录所在的buffer, JSON起始位置, 结束位置, infons拼接位置或None, 段落表(bytes)或None),
+                 gzip保存的记录解压后返回, 不存在时返回None
+        """
+        self._check_segments()
+        key = doc_key(doc_id)
+        for retry in (False, True):
+            entry = self._entry(key)
+            if entry is None:
+                return None
+            offset, length = int(entry['offset']), int(entry['length'])
+            flags = int(entry['flags'])
+            try:
+                if pread:
+                    buffer, base = os.pread(self._fd(int(entry['segment'])), length, offset), 0
+                else:
+                    buffer, base = self._segment(int(entry['segment']), offset + length), offset
+                break
+            except FileNotFoundError:
+                # 读取索引后数据段被整理删除, 索引已指向新的数据段, 重新读取一次
+                if retry:
+                    raise
+                self._drop_missing_segments()
+        start, splice, table = base, None, None
+        if flags & FLAG_SPLICE:
+            splice = SPLICE_HEADER.unpack_from(buffer, start)[0]
+            start += SPLICE_HEADER.size
+        if flags & FLAG_PASSAGES:
+            table_end = start + SPLICE_HEADER.size + SPLICE_HEADER.unpack_from(buffer, start)[0]
+            table = bytes(buffer[start + SPLICE_HEADER.size:table_end])
+            start = table_end
+        end = base + length
+        if flags & FLAG_GZIP:
+            split = start + SPLICE_HEADER.size + SPLICE_HEADER.unpack_from(buffer, start)[0]
+            start += SPLICE_HEADER.size
+            head = zlib.decompress(buffer[start:split], GZIP_WBITS)
+            buffer = head + zlib.decompress(buffer[split:end], GZIP_WBITS)
+            return buffer, 0, len(buffer), len(head), table
+        return buffer, start, end, start + splice if splice is not None else None, table
+
+    def version(self, doc_id):
+        """记录在数据段中的位置, 文献重新写入后改变, 用于计算ETag; 不存在时返回None"""
+        try:
+            entry = self._entry(doc_key(doc_id))
+        except ValueError:
+            return None
+        if entry is None:
+            return None
+        return int(entry['segment']), int(entry['offset']), int(entry['length'])
+
+    def get_bytes(self, doc_id):
+        """文献的原始JSON数据, 不存在时返回None"""
+        location = self._locate(doc_id)
+        if location is None:
+            return None
+        buffer, start, end = location[:3]
+        return buffer[start:end]
+
+    @staticmethod
+    def _splice(buffer, start, end, splice, infons):
+        """buffer[start:end]中在splice位置拼接infons"""
+        fields = json.dumps(infons, separators=(',', ':'))[1:-1].encode('utf-8') if infons else b''
+        if not fields:
+            return [buffer[start:end]]
+        if buffer[splice:splice + 1] != b'}':
+            fields += b','
+        return [buffer[start:splice], fields, buffer[splice:end]]
+
+    @staticmethod
+    def _project(location, infons, projection):
+        """
+        根据段落表裁剪: 只取选中的段落; 需要去掉段落中的字段时, 只解析选中的段落
+        """
+        buffer, start, end, splice, table = location
+        passages = json.loads(table.decode('utf-8'))
+        if not passages:
+            return DocumentStore._splice(buffer, start, end, splice, infons)
+        selected = [index for index, (_, _, section) in enumerate(passages)
+                    if not index or projection.sections is None or section in projection.sections]
+        chunks = [buffer[start:start + passages[0][0]]]
+        for index in selected:
+            passage_start, passage_end = start + passages[index][0], start + passages[index][1]
+            if index:
+                chunks.append(b',')
+            if projection.fields is not None:
+                passage = json.loads(bytes(buffer[passage_start:passage_end]).decode('utf-8'))
+                if not index and infons:
+                    passage['infons'].update(infons)
+                chunks.append(dumps(project_passage(passage, projection.fields)))
+            elif not index:
+                chunks.extend(DocumentStore._splice(buffer, passage_start, passage_end, splice, infons))
+            else:
+                chunks.append(buffer[passage_start:passage_end])
+        chunks.append(buffer[start + passages[-1][1]:end])
+        return chunks
+
+    def get_chunks(self, doc_id, infons, pread=False, projection=None):
+        """
+        在第一个段落的infons中拼接动态字段, 返回组成完整JSON的字节片段
+        :param infons: 需要拼接的字段
+        :param pread: 通过pread读取(在线程池中并发读取时使用)
+        :param projection: Projection, None表示返回完整的文献
+        :return: [bytes], 文献不存在, 记录不支持拼接或没有段落表(需要裁剪时)时返回None
+        """
+        location = self._locate(doc_id, pread)
+        if location is None or location[3] is None:
+            return None
+        if projection is None:
+            return self._splice(*location[:4], infons)
+        if location[4] is None:
+            return None
+        return self._project(location, infons, projection)
+
+    def get(self, doc_id, projection=None):
+        """
+        文献BioC Json, 不存在时返回None
+        :param projection: Projection, 有段落表的记录只解析选中的段落
+        """
+        location = self._locate(doc_id)
+        if location is None:
+            return None
+        buffer, start, end, _, table = location
+        if projection is not None and table is not None:
+            return json.loads(b''.join(self._project(location, {}, projection)).decode('utf-8'))
+        return project_document(json.loads(buffer[start:end].decode('utf-8')), projection)
+
+
+pubmed_store = DocumentStore(os.path.join(Config.DocumentStorePATH, 'PUBMED'))
+pmc_store = DocumentStore(os.path.join(Config.DocumentStorePATH, 'PMC'))
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 19:20
+# @File : eutils.py
+# @Project : OncoPubMinerAPI
+"""
+NCBI E-utilities客户端, EutilsClient与 OncoPubMinerMonitor/pub_miner/eutils.py 中的实现相同
+
+    连接池 + keep-alive: 所有请求共用一个requests.Session, 不再每次调用都重新建立TLS连接
+    重试: 连接错误和429/5xx响应按指数退避重试
+    限流: 令牌桶, 每秒请求数不超过NCBI的限制(有api key时10次, 否则3次), 可以通过文件在多个进程间共用
+    延迟加载: requests在第一次请求时才导入并创建Session, 不影响服务启动时间
+    批量: efetch/elink一次请求携带多个id, 按batch_size分批
+    缓存: 可选的磁盘缓存, 相同的请求参数在有效期内直接返回缓存的响应
+
+base_url可以指向本地的模拟服务, 便于在没有外网的环境中测试。
+"""
+import fcntl
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from config import Config
+
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+
+
+class RateLimiter(object):
+    """
+    令牌桶, 限制每秒请求数
+    指定path时桶的状态(令牌数, 更新时间)保存在文件中并加文件锁, 同一台机器上的多个进程(pre-fork的worker,
+    Monitor)共用一个桶, 合计不超过rate
+    """
+    STATE = struct.Struct('<dd')
+
+    def __init__(self, rate, path=None):
+        self.rate = rate
+        self.path = path
+        self.tokens = rate
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens, updated):
+        """
+        :return: (令牌数, 更新时间, 需要等待的秒数), 等待时间为0表示已取得令牌
+        """
+        now = time.time()
+        tokens = min(self.rate, tokens + max(now - updated, 0) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0
+        return tokens, now, (1 - tokens) / self.rate
+
+    def _take_shared(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.pread(fd, self.STATE.size, 0)
+            tokens, updated = self.STATE.unpack(data) if len(data) == self.STATE.size else (self.rate, 0)
+            tokens, updated, wait = self._take(tokens, updated)
+            os.pwrite(fd, self.STATE.pack(tokens, updated), 0)
+            return wait
+        finally:
+            # 关闭文件时释放文件锁
+            os.close(fd)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if self.path:
+                    wait = self._take_shared()
+                else:
+                    self.tokens, self.updated, wait = self._take(self.tokens, self.updated)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class ResponseCache(object):
+    """磁盘缓存, 每个响应一个文件, 按文件修改时间判断是否过期"""
+
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl and os.path.getmtime(path) < time.time() - self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, content):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名, 并发读取时不会读到写了一半的文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class EutilsClient(object):
+    def __init__(self, base_url=EUTILS_URL, email=None, api_key=None, tool='OncoPubMiner', requests_per_second=None,
+                 timeout=30, retries=3, backoff=0.5, batch_size=200, pool_size=10, cache_dir=None, cache_ttl=None,
+                 rate_limit_file=None):
+        """
+        :param requests_per_second: 每秒请求数, 为None时按是否有api_key取NCBI的限制
+        :param retries: 连接错误和429/5xx响应的重试次数
+        :param backoff: 重试间隔为 backoff * 2^(n-1) 秒
+        :param batch_size: efetch/elink单次请求最多携带的id数
+        :param pool_size: 连接池大小
+        :param cache_dir: 磁盘缓存目录, None表示不缓存
+        :param cache_ttl: 缓存有效期(秒), None表示一直有效
+        :param rate_limit_file: 多个进程共用的令牌桶状态文件, None表示只在进程内限流
+        """
+        self.base_url = base_url.rstrip('/') + '/'
+        self.common_params = [(key, value) for key, value in (('tool', tool), ('email', email), ('api_key', api_key))
+                              if value]
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.pool_size = pool_size
+        self.limiter = RateLimiter(requests_per_second or (10 if api_key else 3), rate_limit_file)
+        self.cache = ResponseCache(cache_dir, cache_ttl) if cache_dir else None
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """第一次请求时创建连接池"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+                    session = requests.Session()
+                    # eutils的请求都是幂等的, POST也可以重试
+                    retry = Retry(total=self.retries, backoff_factor=self.backoff,
+                                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=False,
+                                  respect_retry_after_header=True)
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                          max_retries=retry)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, utility, params):
+        """
+        :param utility: esearch/efetch/elink等
+        :param params: [(key, value)], 同一个key可以出现多次
+        :return: 响应内容(bytes)
+        """
+        params = [(key, str(value)) for key, value in params if value is not None]
+        key = utility + '?' + '&'.join(f'{key}={value}' for key, value in params)
+        content = self.cache.get(key) if self.cache else None
+        if content is not None:
+            return content
+        self.limiter.acquire()
+        # 使用POST, id较多时不受URL长度限制
+        resp = self.session.post(f'{self.base_url}{utility}.fcgi', data=params + self.common_params,
+                                 timeout=self.timeout)
+        resp.raise_for_status()
+        content = resp.content
+        if self.cache:
+            self.cache.put(key, content)
+        return content
+
+    def batches(self, ids):
+        ids = [str(doc_id) for doc_id in ids]
+        return [ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size)]
+
+    def esearch(self, db, term, retstart=0, retmax=20, **params):
+        return self.request('esearch', [('db', db), ('term', term), ('retstart', retstart), ('retmax', retmax)] +
+                            sorted(params.items()))
+
+    def efetch(self, db, ids, **params):
+        """
+        一次请求获取多篇文献(以逗号隔开的id)
+        :return: [bytes] 每批一个响应
+        """
+        return [self.request('efetch', [('db', db), ('id', ','.join(batch))] + sorted(params.items()))
+                for batch in self.batches(ids)]
+
+    def elink(self, ids, dbfrom='pubmed', db='pubmed', cmd='neighbor', **params):
+        """
+        一次请求获取多篇文献的关联文献, 每个id单独作为一个参数, 返回结果中每个id对应一个LinkSet
+        :return: [bytes] 每批一个响应
+        """
+        return [self.request('elink', [('dbfrom', dbfrom), ('db', db), ('cmd', cmd)] + sorted(params.items()) +
+                             [('id', doc_id) for doc_id in batch])
+                for batch in self.batches(ids)]
+
+
+eutils_client = EutilsClient(Config.EUTILS_URL, email=Config.Entrez_email, api_key=Config.NCBI_API_KEY,
+                             requests_per_second=Config.NCBI_REQUESTS_PER_SECOND, timeout=Config.EUTILS_TIMEOUT,
+                             retries=Config.EUTILS_RETRIES, batch_size=Config.ELINK_BATCH_SIZE,
+                             cache_dir=Config.EUTILS_CACHE_DIR, cache_ttl=Config.EUTILS_CACHE_TTL,
+                             rate_limit_file=Config.NCBI_RATE_LIMIT_FILE)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 01:00
+# @File : facets.py
+# @Project : OncoPubMinerAPI
+"""
+检索结果的分面统计: 按年份/杂志/共同出现的实体(Gene/Disease/Chemical/Mutation)统计文献数
+
+在候选PMID数组上从PMID列(columns.py)取年份和杂志id, 从GRAPH/library(每篇文献关联的标准库id, CSR格式)
+取实体id, 用bincount计数, 只有排名靠前的杂志名称需要查询数据库。
+"""
+import numpy as np
+
+from columns import pmid_columns
+from citation_graph import library_graph
+from config import Config
+from dictionary import dictionaries
+from model import Journal
+from PubMiner import db
+
+ENTITY_FACETS = {name.lower(): label for label, name in Config.LABEL_DICT.items()}
+FACETS = ['year', 'journal'] + list(ENTITY_FACETS)
+# 每次取出的文献数, 限制实体id数组占用的内存
+GATHER_BATCH_SIZE = 1 << 18
+
+
+def top_counts(ids, counts, top):
+    """按文献数倒序(相同时id升序)的前top个(id, 文献数)"""
+    if top < len(ids):
+        positions = np.argpartition(-counts, top - 1)[:top]
+        ids, counts = ids[positions], counts[positions]
+    order = np.lexsort((ids, -counts))
+    return list(zip(ids[order].tolist(), counts[order].tolist()))
+
+
+def year_facet(pub_ids):
+    years = pmid_columns.get('year', pub_ids)
+    counts = np.bincount(years[years > 0])
+    values = np.flatnonzero(counts)
+    return [{"year": year, "count": count} for year, count in zip(values.tolist(), counts[values].tolist())]
+
+
+def journal_facet(pub_ids, top):
+    journal_ids = pmid_columns.get('journal_id', pub_ids)
+    counts = np.bincount(journal_ids[journal_ids > 0])
+    values = np.flatnonzero(counts)
+    items = top_counts(values, counts[values], top)
+    journals = {row.id: row for row in db.session.query(Journal.id, Journal.name, Journal.impact_factor).
+                filter(Journal.id.in_([journal_id for journal_id, _ in items]))} if items else {}
+    return [{"id": journal_id,
+             "name": journals[journal_id].name if journal_id in journals else None,
+             "impact_factor": journals[journal_id].impact_factor if journal_id in journals else None,
+             "count": count} for journal_id, count in items]
+
+
+def entity_counts(pub_ids):
+    """以标准库id为下标的文献数"""
+    counts = np.zeros(0, dtype=np.int64)
+    for i in range(0, len(pub_ids), GATHER_BATCH_SIZE):
+        library_ids = library_graph.gather(pub_ids[i:i + GATHER_BATCH_SIZE])
+        if not len(library_ids):
+            continue
+        batch = np.bincount(library_ids)
+        if len(batch) > len(counts):
+            counts = np.concatenate((counts, np.zeros(len(batch) - len(counts), dtype=np.int64)))
+        counts[:len(batch)] += batch
+    return counts
+
+
+def entity_facets(pub_ids, names, top, exclude=()):
+    """
+    :param names: gene/disease/chemical/mutation
+    :param exclude: 不统计的标准库id(检索词本身)
+    """
+    counts = entity_counts(pub_ids)
+    for library_id in exclude:
+        if library_id < len(counts):
+            counts[library_id] = 0
+    library_ids = np.flatnonzero(counts)
+    dictionary = dictionaries['library'].get()
+    indexes = dictionary.index_of(library_ids)
+    library_ids, indexes = library_ids[indexes >= 0], indexes[indexes >= 0]
+    labels = dictionary.labels[indexes]
+    facets = {}
+    for name in names:
+        selected = labels == ENTITY_FACETS[name]
+        entries = {library_id: dictionary.entries[index] for library_id, index in
+                   zip(library_ids[selected].tolist(), indexes[selected].tolist())}
+        facets[name] = [{"id": library_id,
+                         "symbol": entries[library_id].symbol,
+                         "identifier": entries[library_id].identifier,
+                         "count": count} for library_id, count in
+                        top_counts(library_ids[selected], counts[library_ids[selected]], top)]
+    return facets
+
+
+def compute_facets(pub_ids, names, top, exclude=()):
+    """
+    :param pub_ids: 升序PMID数组
+    :param names: 需要统计的分面, FACETS的子集
+    :param top: 杂志和实体返回的个数
+    :return: {分面: [{..., "count": 文献数}]}
+    """
+    facets = {}
+    if 'year' in names:
+        facets['year'] = year_facet(pub_ids)
+    if 'journal' in names:
+        facets['journal'] = journal_facet(pub_ids, top)
+    entity_names = [name for name in names if name in ENTITY_FACETS]
+    if entity_names:
+        facets.update(entity_facets(pub_ids, entity_names, top, exclude))
+    return facets
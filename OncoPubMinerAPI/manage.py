@@ -6,12 +6,18 @@ from gevent.pywsgi import WSGIServer
 from gevent import monkey
 
 monkey.patch_all()
+import argparse
+
 from flask import url_for
 from flask_restplus import Api, Resource, fields, reqparse
 
-from PubMiner import create_app, scheduler
+from PubMiner import create_app, scheduler, csrf
 from utils import *
 from aspcheduler_job import AspConfig
+from cache import cache_stats
+from refresher import elink_refresher
+from codec import PoolBusy, DeadlineExceeded
+from compress import compress_response
 
 
 app = create_app('production')
@@ -20,7 +26,22 @@ app.config.from_object(AspConfig())
 # it is also possible to enable the API directly
 # scheduler.api_enabled = True
 scheduler.init_app(app)
-scheduler.start()
+elink_refresher.init_app(app)
+
+
+def start_scheduler():
+    """
+    在当前进程启动全部定时任务, 单进程运行(python manage.py)和被WSGI服务器导入(manage:app)时调用;
+    pre-fork方式(python manage.py -w N)下由master执行LEADER_JOBS, worker在fork后启动其余任务(prefork.py)
+    """
+    if not scheduler.running:
+        scheduler.start()
+
+
+if __name__ != '__main__':
+    start_scheduler()
+# JSON/NDJSON响应按Accept-Encoding压缩
+app.after_request(compress_response)
 
 
 @app.route('/')
@@ -47,6 +68,12 @@ def stat():
     return jsonify(data)
 
 
+@app.route('/cache_stat')
+def cache_stat():
+    """进程内缓存命中率等统计信息, 用于评估缓存容量"""
+    return jsonify({"code": 200, "msg": "Request success", "success": True, "data": cache_stats()})
+
+
 @app.route('/search')
 def search_pub_med_by_library():
     """
@@ -87,6 +114,27 @@ def search_gene_list():
     return result
 
 
+@app.route('/suggest')
+def search_suggest_list():
+    """输入联想 /suggest?q=egf&l=10&t=gene"""
+    result = extract_suggestions()
+    return result
+
+
+@app.route('/search/facets')
+def search_facets():
+    """检索结果分面统计 /search/facets?q=EGFR&facets=year,journal,disease&top=10"""
+    result = extract_facets(by_type='library')
+    return result
+
+
+@app.route('/relations')
+def search_relations():
+    """标准库共现 /relations?entity=EGFR&type=chemical&top=50, /relations?entity=EGFR&with=gefitinib"""
+    result = extract_relations()
+    return result
+
+
 @app.route('/id')
 def search_pub_pmc_info():
     try:
@@ -95,20 +143,34 @@ def search_pub_pmc_info():
             return badRequest()
         if not re.match(r'^PMC\d+$|^\d+$', query):
             return jsonify({"code": 404, "msg": "formal error", "success": True})
+        try:
+            projection = get_projection()
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
         if 'PMC' not in query:
             pub_med = PubMed.query.filter_by(id=query).first()
         else:
             pub_med = PubMed.query.filter_by(pmc_id=query).first()
         if pub_med:
-            document = {}
-            if pub_med.pmc_json_path:
-                document = get_document(pub_med, 'pmc')
-            if not document and pub_med.pubmed_json_path:
-                document = get_document(pub_med)
-            if document:
-                return jsonify({"code": 200, "msg": "Request success", "success": True, "data": document})
+            # ETag只需要动态字段和文献在存储中的版本, If-None-Match匹配时不读取文献
+            infons = PAD_for_document(pub_med)
+            etag = document_etag(pub_med, infons, projection)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            content = document_response(pub_med, projection, infons)
+            if content:
+                response = Response(content, mimetype='application/json')
+                response.set_etag(etag)
+                return response
 
         return jsonify({"code": 200, "msg": "not Found", "success": True, "data": {}})
+    except PoolBusy as e:
+        logging.warning(f"Request Failed {e}")
+        return jsonify({"code": 503, "msg": "Server busy, please retry later", "success": False, "data": {}}), 503
+    except DeadlineExceeded as e:
+        logging.warning(f"Request Failed {e}")
+        return jsonify({"code": 504, "msg": "Request timeout", "success": False, "data": {}}), 504
     except Exception as e:
         logging.info(f"Request Failed {e}")
         return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False, "data": {}})
@@ -147,6 +209,33 @@ def search_similar_pub_med_info():
         return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False})
 
 
+@app.route('/documents', methods=['POST'])
+@csrf.exempt
+def fetch_documents():
+    """批量获取文献, 以NDJSON格式流式返回"""
+    try:
+        params = request.get_json(silent=True) or {}
+        doc_ids = params.get('ids')
+        if not doc_ids or not isinstance(doc_ids, list):
+            return jsonify({"code": 400, "msg": "Bad Request: the request body must carry ids", "success": False})
+        if len(doc_ids) > Config.BULK_MAX_IDS:
+            return jsonify({"code": 400, "msg": f"Bad Request: at most {Config.BULK_MAX_IDS} ids per request",
+                            "success": False})
+        source = params.get('source') or 'pubmed'
+        if source not in ('pubmed', 'pmc'):
+            return jsonify({"code": 400, "msg": "Bad Request: source must be pubmed or pmc", "success": False})
+        try:
+            projection = get_projection(params)
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
+        doc_ids = [str(doc_id).strip().upper() for doc_id in doc_ids]
+        return Response(stream_with_context(bulk_documents(doc_ids, source, projection)),
+                        mimetype='application/x-ndjson')
+    except Exception as e:
+        logging.info(f"Request Failed {e}")
+        return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False})
+
+
 @app.route('/pub_updates')
 def search_new_pub():
     try:
@@ -295,6 +384,9 @@ BioCJsonList = api.model('BioCJsonList', {
     "success": fields.Boolean(required=True, description='Response Info'),
     "page": fields.Integer(required=True, description='page num'),
     "next": fields.Integer(required=True, description='next page num'),
+    "cursor": fields.String(description='opaque cursor of the next page, pass it unchanged as cursor to fetch the '
+                                        'next page; the same format is used by /search, /keyword, /cited_by, /ref '
+                                        'and /similar'),
     "count": fields.Integer(required=True, description='total count'),
     "limit": fields.Integer(required=True, description='page limit count'),
     "type": fields.Integer(required=True, description='1 Library list, 2 BioC list'),
@@ -334,25 +426,139 @@ chemical_library = api.model('chemical_library', {
     "data": fields.List(cls_or_instance=fields.String(required=True, description='Chemical Symbol'),
                         required=True, description='Chemical symbol list'),
 })
+SuggestJson = api.model('SuggestJson', {
+    "text": fields.String(required=True, description='Matched symbol, synonym or mention'),
+    "symbol": fields.String(required=True, description='Library symbol or mention'),
+    "type": fields.String(required=True, description='cancer/gene/chemical/mention'),
+    "count": fields.Integer(required=True, description='related PubMed count')
+})
+suggest_list = api.model('suggest_list', {
+    "code": fields.Integer(required=True, description='Response'),
+    "msg": fields.String(required=True, description='Response Info'),
+    "success": fields.Boolean(required=True, description='Response Info'),
+    "data": fields.List(cls_or_instance=fields.Nested(model=SuggestJson, required=True, description='SuggestJson'),
+                        required=True, description='suggestion list'),
+})
+YearFacetJson = api.model('YearFacetJson', {
+    "year": fields.Integer(required=True, description='publication year'),
+    "count": fields.Integer(required=True, description='PubMed count')
+})
+JournalFacetJson = api.model('JournalFacetJson', {
+    "id": fields.Integer(required=True, description='journal id'),
+    "name": fields.String(description='journal name'),
+    "impact_factor": fields.Float(description='journal impact factor'),
+    "count": fields.Integer(required=True, description='PubMed count')
+})
+EntityFacetJson = api.model('EntityFacetJson', {
+    "id": fields.Integer(required=True, description='library id'),
+    "symbol": fields.String(required=True, description='library symbol'),
+    "identifier": fields.String(description='library identifier'),
+    "count": fields.Integer(required=True, description='co-occurring PubMed count')
+})
+FacetsJson = api.model('FacetsJson', {
+    "year": fields.List(cls_or_instance=fields.Nested(model=YearFacetJson), description='PubMed count by year'),
+    "journal": fields.List(cls_or_instance=fields.Nested(model=JournalFacetJson), description='top journals'),
+    "gene": fields.List(cls_or_instance=fields.Nested(model=EntityFacetJson), description='top co-occurring genes'),
+    "disease": fields.List(cls_or_instance=fields.Nested(model=EntityFacetJson),
+                           description='top co-occurring diseases'),
+    "chemical": fields.List(cls_or_instance=fields.Nested(model=EntityFacetJson),
+                            description='top co-occurring chemicals'),
+    "mutation": fields.List(cls_or_instance=fields.Nested(model=EntityFacetJson),
+                            description='top co-occurring mutations'),
+})
+facets_result = api.model('facets_result', {
+    "code": fields.Integer(required=True, description='Response'),
+    "msg": fields.String(required=True, description='Response Info'),
+    "success": fields.Boolean(required=True, description='Response Info'),
+    "count": fields.Integer(required=True, description='PubMed count of the search result'),
+    "type": fields.Integer(required=True, description='1: library list to disambiguate, 2: facets'),
+    "data": fields.Nested(model=FacetsJson, required=True, description='facet counts'),
+})
+RelatedLibraryJson = api.model('RelatedLibraryJson', {
+    "id": fields.Integer(required=True, description='library id'),
+    "symbol": fields.String(required=True, description='library symbol'),
+    "identifier": fields.String(description='library identifier'),
+    "label": fields.String(description='Gene/Disease/Chemical/Mutation'),
+    "count": fields.Integer(description='co-occurrence count')
+})
+relations_result = api.model('relations_result', {
+    "code": fields.Integer(required=True, description='Response'),
+    "msg": fields.String(required=True, description='Response Info'),
+    "success": fields.Boolean(required=True, description='Response Info'),
+    "entities": fields.List(cls_or_instance=fields.Nested(model=RelatedLibraryJson), description='resolved libraries'),
+    "count": fields.Integer(description='co-occurrence count of the pair or triple'),
+    "type": fields.Integer(required=True, description='1: library list to disambiguate, 2: relations'),
+    "data": fields.List(cls_or_instance=fields.Nested(model=RelatedLibraryJson), required=True,
+                        description='top co-occurring libraries'),
+})
+
+DocumentsRequest = api.model('DocumentsRequest', {
+    "ids": fields.List(cls_or_instance=fields.String, required=True,
+                       description=f'PubMed Id or PMC Id list, max {Config.BULK_MAX_IDS}'),
+    "source": fields.String(description='pubmed (default) or pmc, pmc returns the full text when available'),
+    "sections": fields.List(cls_or_instance=fields.String,
+                            description='passage sections to return, e.g. title/abstract/intro/methods, default all. '
+                                        'The first passage (title and infons) is always returned'),
+    "fields": fields.List(cls_or_instance=fields.String,
+                          description='passage fields to return, subset of text/sentences/annotations/relations, '
+                                      'default all'),
+    "annotations_only": fields.Boolean(description='same as fields=["annotations"]'),
+})
 
 search_keyword_parser = reqparse.RequestParser()  # 参数模型
-search_keyword_parser.add_argument('q', type=str, required=True, help="keyword")
+search_keyword_parser.add_argument('q', type=str, required=True,
+                                   help="keyword, supports AND/OR/NOT, parentheses and gene:/disease:/chemical:/"
+                                        "mention:/year: qualifiers, e.g. gene:egfr AND (lung OR breast) NOT year:2020")
 page = reqparse.Argument('p', type=int, required=False, default=1, help='page num')
 per_page = reqparse.Argument('l', type=str, required=False, default=10, help='per page limit num')
 is_cancer = reqparse.Argument('t', type=str, required=False, default='cancer', help='cancer or all')
 is_remote = reqparse.Argument('m', type=str, required=False, default='local',
                               help='call the remote interface or local interface')
+cursor = reqparse.Argument('cursor', type=str, required=False,
+                           help='opaque cursor returned by the previous page, takes precedence over p. '
+                                'It encodes the paging mode and position (PMID or offset); '
+                                'plain integers from older responses are still accepted')
+sections = reqparse.Argument('sections', type=str, required=False,
+                             help='comma separated passage sections to return, e.g. title,abstract, default all. '
+                                  'The first passage (title and infons) is always returned')
+passage_fields = reqparse.Argument('fields', type=str, required=False,
+                                   help='comma separated passage fields to return, '
+                                        'subset of text,sentences,annotations,relations, default all')
+annotations_only = reqparse.Argument('annotations_only', type=int, required=False,
+                                     help='1: same as fields=annotations')
+year = reqparse.Argument('year', type=str, required=False, help='publication year, YYYY or YYYY-YYYY')
+has_pmc = reqparse.Argument('has_pmc', type=int, required=False, help='1: only documents with PMC full text')
+has_abstract = reqparse.Argument('has_abstract', type=int, required=False, help='1: only documents with abstract')
+search_sort = reqparse.Argument('sort', type=str, required=False, choices=('year', 'cited', 'if'),
+                                help='sort by publication year, cited count or journal impact factor (descending), '
+                                     'default PMID descending')
 search_keyword_parser.add_argument(page)
 search_keyword_parser.add_argument(per_page)
 search_keyword_parser.add_argument(is_cancer)
 search_keyword_parser.add_argument(is_remote)
+search_keyword_parser.add_argument(cursor)
+search_keyword_parser.add_argument(sections)
+search_keyword_parser.add_argument(passage_fields)
+search_keyword_parser.add_argument(annotations_only)
+search_keyword_parser.add_argument(year)
+search_keyword_parser.add_argument(has_pmc)
+search_keyword_parser.add_argument(has_abstract)
+search_keyword_parser.add_argument(search_sort)
 
 keyword_parser = reqparse.RequestParser()
-keyword_parser.add_argument('q', type=str, required=True, help="mention")
+keyword_parser.add_argument('q', type=str, required=True, help="mention, supports the same syntax as /search")
 keyword_parser.add_argument(page)
 keyword_parser.add_argument(per_page)
 keyword_parser.add_argument(is_cancer)
 keyword_parser.add_argument(is_remote)
+keyword_parser.add_argument(cursor)
+keyword_parser.add_argument(sections)
+keyword_parser.add_argument(passage_fields)
+keyword_parser.add_argument(annotations_only)
+keyword_parser.add_argument(year)
+keyword_parser.add_argument(has_pmc)
+keyword_parser.add_argument(has_abstract)
+keyword_parser.add_argument(search_sort)
 
 cancer_parser = reqparse.RequestParser()
 cancer_parser.add_argument('q', type=str, required=True, help="cancer word")
@@ -363,13 +569,49 @@ gene_parser.add_argument('q', type=str, required=True, help="gene word")
 chemical_parser = reqparse.RequestParser()
 chemical_parser.add_argument('q', type=str, required=True, help="chemical word")
 
+suggest_parser = reqparse.RequestParser()
+suggest_parser.add_argument('q', type=str, required=True, help="prefix")
+suggest_parser.add_argument('l', type=int, required=False, default=10, help="limit num, max value: 50")
+suggest_parser.add_argument('t', type=str, required=False, help="cancer/gene/chemical/mention, default all")
+
+facets_parser = reqparse.RequestParser()
+facets_parser.add_argument('q', type=str, required=True, help="keyword, supports the same syntax as /search")
+facets_parser.add_argument(is_cancer)
+facets_parser.add_argument(year)
+facets_parser.add_argument(has_pmc)
+facets_parser.add_argument(has_abstract)
+facets_parser.add_argument('facets', type=str, required=False,
+                           help='comma separated facets, subset of year,journal,gene,disease,chemical,mutation, '
+                                'default all')
+facets_parser.add_argument('top', type=int, required=False, default=10,
+                           help=f'number of journals/entities per facet, max value: {Config.FACET_TOP_MAX}')
+
+relations_parser = reqparse.RequestParser()
+relations_parser.add_argument('entity', type=str, required=True, help="library symbol, or @GE@/@CA@/@DR@identifier")
+relations_parser.add_argument('with', type=str, required=False, action='append',
+                              help='one or two more libraries: pair/triple co-occurrence count, '
+                                   'with one library also returns libraries co-occurring with both')
+relations_parser.add_argument('type', type=str, required=False, choices=tuple(Config.RELATION_TYPES),
+                              help='only return gene/cancer/chemical/mutation libraries, default all')
+relations_parser.add_argument('top', type=int, required=False, default=10,
+                              help=f'number of libraries, max value: {Config.RELATION_TOP_MAX}')
+
 id_parser = reqparse.RequestParser()
 id_parser.add_argument('q', type=str, required=True, help="PubMed Id or PMC Id")
+id_parser.add_argument(sections)
+id_parser.add_argument(passage_fields)
+id_parser.add_argument(annotations_only)
 
 cite_parser = reqparse.RequestParser()
 cite_parser.add_argument('q', type=str, required=True, help="PubMed ID")
 cite_parser.add_argument(page)
 cite_parser.add_argument('l', type=int, required=False, default=10, help="per page limit num, max value: 100")
+cite_parser.add_argument(cursor)
+cite_parser.add_argument('sort', type=str, required=False, choices=('year', 'if'),
+                         help="sort by publication year or journal impact factor (descending), default stored order")
+cite_parser.add_argument(sections)
+cite_parser.add_argument(passage_fields)
+cite_parser.add_argument(annotations_only)
 
 
 @ns.route('/search', endpoint=search_pub_med_by_library)
@@ -447,6 +689,51 @@ class Chemical(Resource):
         return self.params
 
 
+@ns.route('/suggest', endpoint=search_suggest_list)
+class Suggest(Resource):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params = suggest_parser.parse_args()
+
+    @ns.expect(suggest_parser)  # 用于解析对应文档参数，
+    @ns.response(200, "success response", suggest_list)  # 对应解析文档返回值
+    @ns.response(400, "bad request", BadRequest)  # 对应解析文档返回值
+    @ns.response(500, "Failed response", Error)  # 对应解析文档返回值
+    def get(self):
+        """Suggest library symbols and mentions by prefix, ranked by related PubMed count"""
+        return self.params
+
+
+@ns.route('/search/facets', endpoint=search_facets)
+class Facets(Resource):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params = facets_parser.parse_args()
+
+    @ns.expect(facets_parser)  # 用于解析对应文档参数，
+    @ns.response(200, "success response", facets_result)  # 对应解析文档返回值
+    @ns.response(400, "bad request", BadRequest)  # 对应解析文档返回值
+    @ns.response(500, "Failed response", Error)  # 对应解析文档返回值
+    def get(self):
+        """Count the search result by year, journal and co-occurring entities"""
+        return self.params
+
+
+@ns.route('/relations', endpoint=search_relations)
+class Relations(Resource):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params = relations_parser.parse_args()
+
+    @ns.expect(relations_parser)  # 用于解析对应文档参数，
+    @ns.response(200, "success response", relations_result)  # 对应解析文档返回值
+    @ns.response(400, "bad request", BadRequest)  # 对应解析文档返回值
+    @ns.response(500, "Failed response", Error)  # 对应解析文档返回值
+    def get(self):
+        """Top co-occurring libraries of a library, and pair/triple co-occurrence counts"""
+        return self.params
+
+
 @ns.route('/id', endpoint=search_pub_pmc_info)
 class PubID(Resource):
     def __init__(self, *args, **kwargs):
@@ -462,6 +749,17 @@ class PubID(Resource):
         return self.params
 
 
+@ns.route('/documents', endpoint=fetch_documents)
+class Documents(Resource):
+    @ns.expect(DocumentsRequest)  # 用于解析对应文档参数，
+    @ns.response(200, "success response, one BioC-JSON document per line (application/x-ndjson)")
+    @ns.response(400, "bad request", BadRequest)  # 对应解析文档返回值
+    @ns.response(500, "Failed response", Error)  # 对应解析文档返回值
+    def post(self):
+        """Fetch PubMed/PMC BioC-JSON documents in bulk, streamed as NDJSON"""
+        return {}
+
+
 @ns.route('/ref', endpoint=search_ref_pub_med_info)
 class Cite(Resource):
     def __init__(self, *args, **kwargs):
@@ -508,5 +806,14 @@ class Similar(Resource):
 
 
 if __name__ == '__main__':
-    http_server = WSGIServer(('0.0.0.0', 9001), app)
-    http_server.serve_forever()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--workers', type=int, default=Config.WORKERS,
+                        help='number of worker processes, run in a single process when 1')
+    args = parser.parse_args()
+    if args.workers > 1:
+        from prefork import PreforkServer
+        PreforkServer(app, ('0.0.0.0', 9001), args.workers).serve_forever()
+    else:
+        start_scheduler()
+        http_server = WSGIServer(('0.0.0.0', 9001), app)
+        http_server.serve_forever()
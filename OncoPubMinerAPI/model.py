@@ -2,6 +2,8 @@
 # @Time : 2021/10/18 12:26
 # @File : model.py
 # @Project : OncoPubMinerAPI
+from sqlalchemy.dialects.mysql import LONGBLOB
+
 from PubMiner import db
 
 
@@ -166,6 +168,7 @@ class LibraryPubMed(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='自增主键')
     library_id = db.Column(db.Integer, unique=True, comment='library外键')
     pubmeds = db.Column(db.Text, comment='标准库关联的PubMed')
+    postings = db.Column(LONGBLOB, comment='标准库关联的PubMed(压缩倒排表)')
     length = db.Column(db.Integer, comment='关联的PubMed文献个数')
 
 
@@ -176,6 +179,7 @@ class LibraryPubMedSortInfo(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='自增主键')
     library_id = db.Column(db.Integer, unique=True, comment='library外键')
     pubmed_sort_infos = db.Column(db.Text, comment='标准库关联的PubMed排序需要的详细信息')
+    orderings = db.Column(LONGBLOB, comment='按年份/被引用数/影响因子预排序的PubMed(二进制)')
 
 
 class PubMedLibrary(db.Model):
@@ -202,6 +206,7 @@ class MentionPubMed(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='自增主键')
     mention_id = db.Column(db.Integer, unique=True, comment='标准词ID')
     pubmeds = db.Column(db.Text, comment='文章原生词关联的PubMed')
+    postings = db.Column(LONGBLOB, comment='文章原生词关联的PubMed(压缩倒排表)')
     length = db.Column(db.Integer, comment='关联的PubMed文献个数')
 
 
@@ -212,6 +217,7 @@ class MentionPubMedSortInfo(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='自增主键')
     mention_id = db.Column(db.Integer, unique=True, comment='标准词ID')
     pubmed_sort_infos = db.Column(db.Text, comment='标准库关联的PubMed排序需要的详细信息')
+    orderings = db.Column(LONGBLOB, comment='按年份/被引用数/影响因子预排序的PubMed(二进制)')
 
 
 class PubMedMention(db.Model):
@@ -309,3 +315,4 @@ class Stat(db.Model):
     statPMC = db.Column(db.Integer, comment='PUBMED文献总量(包含摘要)')
     statCancers = db.Column(db.Integer, comment='PUBMED文献总量(包含摘要)')
     version = db.Column(db.String(32), comment='当前系统版本号')
+    postingVersion = db.Column(db.Integer, default=0, comment='实体-文献倒排表数据版本号, 每次写入实体识别结果后递增')
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 09:12
+# @File : posting.py
+# @Project : OncoPubMinerAPI
+"""
+PubMed倒排表(posting list)二进制格式
+
+与 OncoPubMinerMonitor/pub_miner/posting.py 保持一致, 采用roaring bitmap的容器划分方式:
+PMID按高16位分桶, 每个桶内的低16位以有序uint16数组(array容器)或65536位的位图(bitmap容器)存储,
+解码时直接得到升序的uint32数组, 不需要逐个做字符串切分和int()转换。
+
+    header:    magic(2s) version(B) reserved(B) containers(I) cardinality(I)
+    directory: containers * [key(H) kind(B) reserved(B) count(I) offset(I)]
+    data:      array容器 count * uint16 / bitmap容器 8192 bytes
+
+两个列表长度相差很大时求交集不遍历长列表: 在长列表上二分查找短列表的元素(contains),
+长列表未解码时只解码与短列表高16位相同的容器(contains_encoded)。
+"""
+import struct
+
+import numpy as np
+
+MAGIC = b'PL'
+VERSION = 1
+HEADER = struct.Struct('<2sBBII')
+DIRECTORY_DTYPE = np.dtype([('key', '<u2'), ('kind', 'u1'), ('reserved', 'u1'), ('count', '<u4'),
+                            ('offset', '<u4')])
+ARRAY_CONTAINER, BITMAP_CONTAINER = 0, 1
+# 桶内元素超过4096个时, 位图(8KB)比有序数组更省空间
+ARRAY_MAX_SIZE = 4096
+BITMAP_BYTES = 65536 // 8
+
+EMPTY = np.zeros(0, dtype=np.uint32)
+# 长列表的长度超过短列表的GALLOP_RATIO倍时, 在长列表上二分查找, 否则归并求交集
+GALLOP_RATIO = 32
+
+
+def to_array(pub_ids):
+    """任意PMID集合转换为升序去重的uint32数组"""
+    if isinstance(pub_ids, np.ndarray):
+        array = pub_ids.astype(np.uint32, copy=False)
+    else:
+        array = np.fromiter((int(pub_id) for pub_id in pub_ids), dtype=np.uint32)
+    return np.unique(array)
+
+
+def encode(pub_ids):
+    """PMID集合编码为倒排表二进制数据"""
+    values = to_array(pub_ids)
+    if len(values) == 0:
+        return HEADER.pack(MAGIC, VERSION, 0, 0, 0)
+    keys = (values >> 16).astype(np.uint16)
+    lows = (values & 0xFFFF).astype('<u2')
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:], [len(values)]))
+    directory = np.zeros(len(starts), dtype=DIRECTORY_DTYPE)
+    chunks, offset = [], 0
+    for index, (start, end) in enumerate(zip(starts, ends)):
+        count = end - start
+        if count > ARRAY_MAX_SIZE:
+            bits = np.zeros(65536, dtype=np.uint8)
+            bits[lows[start:end]] = 1
+            chunk = np.packbits(bits, bitorder='little').tobytes()
+            kind = BITMAP_CONTAINER
+        else:
+            chunk = lows[start:end].tobytes()
+            kind = ARRAY_CONTAINER
+        directory[index] = (keys[start], kind, 0, count, offset)
+        chunks.append(chunk)
+        offset += len(chunk)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(directory), len(values))
+    return header + directory.tobytes() + b''.join(chunks)
+
+
+def read_directory(data):
+    """解析倒排表的容器目录, 返回(目录, 数据区起始位置); 数据不完整时抛出ValueError"""
+    if len(data) < HEADER.size:
+        raise ValueError(f'truncated posting list: {len(data)} bytes')
+    magic, version, _, containers, _ = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'unknown posting list format: {magic!r} v{version}')
+    directory = np.frombuffer(data, dtype=DIRECTORY_DTYPE, count=containers, offset=HEADER.size)
+    return directory, HEADER.size + DIRECTORY_DTYPE.itemsize * containers
+
+
+def cardinality(data):
+    """不解码直接读取倒排表中的PMID数量"""
+    return HEADER.unpack_from(data, 0)[4] if data else 0
+
+
+def decode_container(data, entry, data_start):
+    """解码单个容器, 返回升序uint32数组"""
+    start = data_start + int(entry['offset'])
+    high = np.uint32(int(entry['key']) << 16)
+    if entry['kind'] == BITMAP_CONTAINER:
+        bits = np.frombuffer(data, dtype=np.uint8, count=BITMAP_BYTES, offset=start)
+        lows = np.flatnonzero(np.unpackbits(bits, bitorder='little')).astype(np.uint32)
+    else:
+        lows = np.frombuffer(data, dtype='<u2', count=int(entry['count']), offset=start).astype(np.uint32)
+    return lows | high
+
+
+def decode(data):
+    """倒排表二进制数据解码为升序uint32数组"""
+    if not data:
+        return EMPTY
+    directory, data_start = read_directory(data)
+    if len(directory) == 0:
+        return EMPTY
+    if not (directory['kind'] == BITMAP_CONTAINER).any():
+        # 全部为array容器时数据区是一段连续的uint16, 一次向量化解码
+        total = int(directory['count'].sum())
+        lows = np.frombuffer(data, dtype='<u2', count=total, offset=data_start).astype(np.uint32)
+        highs = np.repeat(directory['key'].astype(np.uint32) << 16, directory['count'])
+        return lows | highs
+    return np.concatenate([decode_container(data, entry, data_start) for entry in directory])
+
+
+def parse_text(pubmeds):
+    """兼容旧数据: 解析以 | 隔开的PubMed id文本"""
+    if not pubmeds or not pubmeds.strip():
+        return EMPTY
+    return np.unique(np.array([pub_id for pub_id in pubmeds.strip().split('|') if pub_id], dtype=np.uint32))
+
+
+def load(postings, pubmeds=None):
+    """优先使用二进制倒排表, 不存在时回退到文本字段"""
+    if postings:
+        return decode(postings)
+    return parse_text(pubmeds)
+
+
+def contains(array, values):
+    """
+    values中的每个PMID是否在升序数组array中, 在array上二分查找, 耗时与len(values)成正比
+    :return: 与values等长的bool数组
+    """
+    values = np.asarray(values, dtype=np.uint32)
+    if len(array) == 0 or len(values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(array, values), len(array) - 1)
+    return array[positions] == values
+
+
+def contains_encoded(data, values):
+    """
+    values中的每个PMID是否在倒排表二进制数据中, 不解码整个倒排表:
+    按高16位在容器目录中查找, 只读取包含values的容器, array容器二分查找, bitmap容器直接取位
+    :param values: 升序PMID数组
+    :return: 与values等长的bool数组
+    """
+    values = np.asarray(values, dtype=np.uint32)
+    mask = np.zeros(len(values), dtype=bool)
+    if not data or len(values) == 0:
+        return mask
+    directory, data_start = read_directory(data)
+    if len(directory) == 0:
+        return mask
+    keys = values >> 16
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:], [len(values)]))
+    positions = np.searchsorted(directory['key'], keys[starts])
+    for start, end, position in zip(starts.tolist(), ends.tolist(), positions.tolist()):
+        if position >= len(directory) or directory['key'][position] != keys[start]:
+            continue
+        entry = directory[position]
+        lows = values[start:end] & 0xFFFF
+        offset = data_start + int(entry['offset'])
+        if entry['kind'] == BITMAP_CONTAINER:
+            bits = np.frombuffer(data, dtype=np.uint8, count=BITMAP_BYTES, offset=offset)
+            mask[start:end] = (bits[lows >> 3] >> (lows & 7).astype(np.uint8)) & 1 == 1
+        else:
+            container = np.frombuffer(data, dtype='<u2', count=int(entry['count']), offset=offset)
+            mask[start:end] = contains(container, lows)
+    return mask
+
+
+def intersect(left, right):
+    """两个升序PMID数组求交集"""
+    if len(left) == 0 or len(right) == 0:
+        return EMPTY
+    if len(left) > len(right):
+        left, right = right, left
+    if len(right) > len(left) * GALLOP_RATIO:
+        return left[contains(right, left)]
+    return np.intersect1d(left, right, assume_unique=True)
+
+
+def union(arrays):
+    """多个升序PMID数组求并集"""
+    arrays = [array for array in arrays if len(array)]
+    if not arrays:
+        return EMPTY
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.unique(np.concatenate(arrays))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 20:10
+# @File : prefork.py
+# @Project : OncoPubMinerAPI
+"""
+多进程(pre-fork)运行方式, python manage.py -w N
+
+master进程:
+    创建监听socket, 加载标准库词典和输入联想索引后fork出N个worker, 所有worker在同一个socket上accept
+    worker异常退出时重新fork
+    作为leader执行只需要运行一次的定时任务(LEADER_JOBS): 更新癌症文献位图;
+    每日重新加载词典后逐个重启worker, 新的worker继承master中新加载的词典
+worker进程:
+    gevent WSGIServer, 只运行进程内的定时任务(检查数据版本号, 清空进程内缓存)
+
+只读索引在worker间共享, 内存中只有一份:
+    词典/联想索引: master加载后fork, 数据为numpy数组和拼接后的字符串, 查询时不会触发写时复制
+    癌症文献位图/BioC打包存储/引用关系图/倒排表共享缓存(POSTING_SHARED_DIR): mmap映射的文件, 共享系统页缓存
+"""
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import time
+from datetime import datetime
+
+import gevent
+from gevent.pywsgi import WSGIServer
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from PubMiner import db, scheduler
+from aspcheduler_job import AspConfig, LEADER_JOBS
+from dictionary import dictionaries
+from suggest import suggest_indexes
+
+# 重启worker时等待请求处理完成的最长时间(秒)
+STOP_TIMEOUT = 30
+
+
+def create_listener(address, backlog=2048):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    return listener
+
+
+def resolve_func(func):
+    """'module:function' 转换为函数"""
+    module_name, func_name = func.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+class LeaderJob(object):
+    """在master中按AspConfig.JOBS中的触发规则执行的任务"""
+
+    def __init__(self, job):
+        self.id = job['id']
+        self.func = resolve_func(job['func'])
+        options = {key: value for key, value in job.items() if key not in ('id', 'func', 'trigger')}
+        trigger_class = IntervalTrigger if job['trigger'] == 'interval' else CronTrigger
+        self.trigger = trigger_class(timezone=AspConfig.SCHEDULER_TIMEZONE, **options)
+        self.next_run_time = self.trigger.get_next_fire_time(None, datetime.now(self.trigger.timezone))
+
+    def due(self, now):
+        return self.next_run_time is not None and now >= self.next_run_time
+
+    def run(self):
+        try:
+            self.func()
+        except Exception as e:
+            logging.error(f'run job {self.id} error: {e}')
+        now = datetime.now(self.trigger.timezone)
+        self.next_run_time = self.trigger.get_next_fire_time(self.next_run_time, now)
+
+
+class PreforkServer(object):
+    def __init__(self, app, address, workers):
+        self.app = app
+        self.address = address
+        self.workers = workers
+        self.listener = None
+        # worker编号 -> pid
+        self.pids = {}
+        self.running = False
+        self.jobs = [LeaderJob(job) for job in AspConfig.JOBS if job['id'] in LEADER_JOBS]
+
+    def preload(self):
+        """在master中加载只读索引, fork后由所有worker共享"""
+        start_time = time.time()
+        with self.app.app_context():
+            for loader in list(dictionaries.values()) + list(suggest_indexes.values()):
+                loader.get()
+        self.freeze()
+        logging.info(f'preload indexes takes {time.time() - start_time}')
+
+    @staticmethod
+    def freeze():
+        """
+        已加载的对象不再参与垃圾回收, 避免worker中的gc遍历触发写时复制
+        gc.freeze需要Python 3.7+, 3.6(Dockerfile中的python:3.6镜像)上跳过并记录警告,
+        此时词典/联想索引的numpy数组和拼接后的字符串仍然共享, 其余对象可能在gc遍历时被复制
+        """
+        freeze = getattr(gc, 'freeze', None)
+        if freeze is None:
+            logging.warning('gc.freeze is not available (Python 3.7+), preloaded objects may be copied by workers')
+            return
+        gc.collect()
+        freeze()
+
+    def spawn(self, index):
+        # 数据库连接不能在进程间共享, fork前关闭master的连接池
+        with self.app.app_context():
+            db.engine.dispose()
+        pid = os.fork()
+        if pid:
+            self.pids[index] = pid
+            logging.info(f'spawn worker {index}, pid: {pid}')
+            return
+        try:
+            self.run_worker()
+        finally:
+            os._exit(0)
+
+    def run_worker(self):
+        """worker进程: 只运行进程内的定时任务, 处理请求直到收到SIGTERM"""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for job_id in LEADER_JOBS:
+            scheduler.remove_job(job_id)
+        scheduler.start()
+        server = WSGIServer(self.listener, self.app)
+        gevent.signal_handler(signal.SIGTERM, server.stop, STOP_TIMEOUT)
+        server.serve_forever()
+
+    def stop_worker(self, index):
+        """停止worker并等待退出, 由主循环重新fork"""
+        pid = self.pids.pop(index, None)
+        if pid is None:
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+    def reap(self):
+        """回收退出的worker, 重新fork"""
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            for index, worker_pid in list(self.pids.items()):
+                if worker_pid == pid:
+                    logging.warning(f'worker {index} (pid: {pid}) exited')
+                    del self.pids[index]
+        if self.running:
+            for index in range(self.workers):
+                if index not in self.pids:
+                    self.spawn(index)
+
+    def run_jobs(self):
+        for job in self.jobs:
+            if job.due(datetime.now(job.trigger.timezone)):
+                job.run()
+                if job.id == 'reload_dictionaries':
+                    self.freeze()
+                    # 逐个重启worker, 其他worker继续处理请求
+                    for index in range(self.workers):
+                        self.stop_worker(index)
+                        self.spawn(index)
+
+    def shutdown(self, *args):
+        self.running = False
+
+    def serve_forever(self):
+        self.listener = create_listener(self.address)
+        self.preload()
+        self.running = True
+        signal.signal(signal.SIGTERM, self.shutdown)
+        signal.signal(signal.SIGINT, self.shutdown)
+        logging.info(f'prefork server listening on {self.address}, workers: {self.workers}')
+        while self.running:
+            self.reap()
+            self.run_jobs()
+            time.sleep(1)
+        for index in list(self.pids):
+            self.stop_worker(index)
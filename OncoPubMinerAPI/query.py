@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 22:40
+# @File : query.py
+# @Project : OncoPubMinerAPI
+"""
+检索语句解析和查询计划
+
+语法(优先级 NOT > AND > OR, 运算符为大写):
+    egfr AND (lung cancer OR breast cancer) NOT gene:kras
+    字段限定: gene:/disease:/chemical: 只匹配对应类型的标准库, mention: 文章原生词前缀, year:2020 或 year:2015-2020,
+             没有限定时按检索类型(library/mention)匹配; 词项中间的空格是词项的一部分, 字段限定开始新的词项,
+             相邻的条件之间为AND(gene:egfr year:2020); year:只包含一个词
+    a NOT b 等同于 a AND NOT b, NOT不能单独使用
+    括号: 单独的 ( ) 和词首/词尾未在词内闭合的括号用于分组, 词内闭合的括号是词项的一部分(IL(6), (S)-ibuprofen);
+         没有运算符时只有单独的括号用于分组, 无法解析时整个语句按词项匹配(p53 (TP53))
+
+执行:
+    词项的文献数从LibraryPubMed/MentionPubMed的length字段估计, 不读取倒排表
+    year: 从PMID列(columns.py)的年份列取值, Monitor尚未生成PMID列时查询PubMed表; 不估计文献数,
+          AND中有其他肯定条件时只作为候选集的过滤条件, 不扫描整个年份列
+    AND: 按估计的文献数从小到大执行, 最小的条件解码为PMID数组作为候选集, 其余条件只在候选集上判断:
+         已缓存或较短的倒排表在解码后的数组上二分查找, 较长的倒排表只解码与候选PMID高16位相同的容器;
+         候选集为空时不再执行后面的条件
+    OR: 在候选集上判断时, 前面的条件已匹配的PMID不再判断
+"""
+import re
+from collections import namedtuple
+
+import numpy as np
+
+import posting
+from cache import posting_cache
+from columns import pmid_columns
+from dictionary import match_library
+from model import PubMed, Mention, LibraryPubMed, MentionPubMed
+from PubMiner import db
+
+Term = namedtuple('Term', ['field', 'text'])
+Year = namedtuple('Year', ['start', 'end'])
+And = namedtuple('And', ['children'])
+Or = namedtuple('Or', ['children'])
+Not = namedtuple('Not', ['child'])
+
+OPERATORS = ('AND', 'OR', 'NOT')
+FIELD_PATTERN = re.compile(r'^(gene|disease|chemical|mention|year):(.*)$', re.I)
+YEAR_PATTERN = re.compile(r'^(\d{4})(?:-(\d{4}))?$')
+# 字段限定对应的标准库label
+FIELD_LABELS = {'gene': 0, 'disease': 1, 'chemical': 2}
+POSTING_TABLES = {'library': (LibraryPubMed, LibraryPubMed.library_id),
+                  'mention': (MentionPubMed, MentionPubMed.mention_id)}
+# 倒排表长度不超过候选集的MATERIALIZE_RATIO倍时解码(并缓存), 否则只解码需要的容器
+MATERIALIZE_RATIO = 8
+# 没有length字段的旧数据
+UNKNOWN_LENGTH = 1 << 31
+# 按年份过滤候选集时每次查询的PMID数
+YEAR_BATCH_SIZE = 1000
+
+
+class QuerySyntaxError(ValueError):
+    """检索语句语法错误"""
+
+
+def split_parentheses(word):
+    """
+    词首未在词内闭合的 ( 和词尾未在词内闭合的 ) 作为分组括号, 词内闭合的括号(如 IL(6), (S)-ibuprofen)保留在词项中
+    :return: (分组的 ( 个数, 词项, 分组的 ) 个数)
+    """
+    opens, closes = [], []
+    for index, char in enumerate(word):
+        if char == '(':
+            opens.append(index)
+        elif char == ')':
+            if opens:
+                opens.pop()
+            else:
+                closes.append(index)
+    leading = len(word) - len(word.lstrip('('))
+    trailing = len(word.rstrip(')'))
+    start = sum(1 for index in opens if index < leading)
+    end = sum(1 for index in closes if index >= trailing)
+    return start, word[start:len(word) - end], end
+
+
+def tokenize(query):
+    """按空格切分, 分组括号作为单独的token"""
+    tokens = []
+    for word in query.split():
+        start, core, end = split_parentheses(word)
+        tokens.extend(['('] * start)
+        if core:
+            tokens.append(core)
+        tokens.extend([')'] * end)
+    return tokens
+
+
+def is_field(token):
+    return token is not None and FIELD_PATTERN.match(token) is not None
+
+
+class QueryParser(object):
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError('empty query')
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f'unexpected {self.peek()!r}')
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.position += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        # 相邻的条件之间为AND(字段限定开始新的词项, year:只包含一个词)
+        while self.peek() not in (None, ')', 'OR'):
+            # a NOT b 等同于 a AND NOT b
+            if self.peek() == 'AND':
+                self.position += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.position += 1
+            return Not(self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError('unexpected end of query')
+        if token == '(':
+            self.position += 1
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise QuerySyntaxError('missing )')
+            self.position += 1
+            return node
+        if token == ')' or token in OPERATORS:
+            raise QuerySyntaxError(f'unexpected {token!r}')
+        words = [token]
+        self.position += 1
+        if not token.lower().startswith('year:'):
+            while self.peek() not in (None, '(', ')') + OPERATORS and not is_field(self.peek()):
+                words.append(self.peek())
+                self.position += 1
+        return make_term(' '.join(words))
+
+
+def make_term(text):
+    match = FIELD_PATTERN.match(text)
+    if not match:
+        return Term(None, text)
+    field, value = match.group(1).lower(), match.group(2).strip()
+    if not value:
+        raise QuerySyntaxError(f'empty {field}:')
+    if field == 'year':
+        year = YEAR_PATTERN.match(value)
+        if not year:
+            raise QuerySyntaxError(f'invalid year: {value!r}')
+        start = int(year.group(1))
+        end = int(year.group(2)) if year.group(2) else start
+        return Year(min(start, end), max(start, end))
+    return Term(field, value)
+
+
+def parse_query(query):
+    """
+    :return: 语法树(Term/Year/And/Or/Not)
+    :raise QuerySyntaxError
+    """
+    words = query.split()
+    if any(word in OPERATORS for word in words):
+        return QueryParser(tokenize(query)).parse()
+    # 没有运算符: 只有单独的括号用于分组, 括号不匹配时忽略
+    try:
+        return QueryParser(words).parse()
+    except QuerySyntaxError:
+        return QueryParser([word for word in words if word not in ('(', ')')]).parse()
+
+
+def load_postings(kind, ids):
+    """
+    批量读取倒排表并解码, 优先使用posting_cache
+    :param kind: library/mention
+    :return: {id: 升序PMID数组}
+    """
+    arrays, missing_ids = {}, []
+    for posting_id in ids:
+        cached = posting_cache.get((kind, posting_id))
+        if cached is None:
+            missing_ids.append(posting_id)
+        else:
+            arrays[posting_id] = cached
+    if not missing_ids:
+        return arrays
+    table, id_column = POSTING_TABLES[kind]
+    rows = db.session.query(id_column, table.postings).filter(id_column.in_(missing_ids)).all()
+    loaded = {posting_id: posting.decode(postings) for posting_id, postings in rows if postings}
+    # 尚未生成二进制倒排表的旧数据回退到文本字段
+    text_ids = [posting_id for posting_id in missing_ids if posting_id not in loaded]
+    if text_ids:
+        loaded.update({posting_id: posting.parse_text(pubmeds) for posting_id, pubmeds in
+                       db.session.query(id_column, table.pubmeds).filter(id_column.in_(text_ids))})
+    for posting_id, pub_ids in loaded.items():
+        posting_cache.put((kind, posting_id), pub_ids)
+    arrays.update(loaded)
+    return arrays
+
+
+def mention_ids(text):
+    """文章原生词前缀匹配"""
+    return [mention_id for mention_id, in
+            db.session.query(Mention.id).filter(Mention.mention.startswith(text.strip()))]
+
+
+class QueryPlanner(object):
+    def __init__(self, by_type='library'):
+        """
+        :param by_type: 没有字段限定的词项的匹配方式, library/mention
+        """
+        self.by_type = by_type
+        self._sources = {}
+        self._costs = {}
+
+    def sources(self, term):
+        """
+        词项对应的倒排表
+        :return: [(library/mention, id, 文献数)]
+        """
+        if term in self._sources:
+            return self._sources[term]
+        field = term.field or ('mention' if self.by_type == 'mention' else None)
+        if field == 'mention':
+            kind, ids = 'mention', mention_ids(term.text)
+        else:
+            kind = 'library'
+            ids = [library.id for library in match_library(term.text)
+                   if field is None or library.label == FIELD_LABELS[field]]
+        lengths = {}
+        if ids:
+            table, id_column = POSTING_TABLES[kind]
+            lengths = dict(db.session.query(id_column, table.length).filter(id_column.in_(ids)).all())
+        sources = self._sources[term] = [(kind, posting_id, UNKNOWN_LENGTH if lengths.get(posting_id) is None
+                                          else lengths[posting_id]) for posting_id in ids
+                                         if posting_id in lengths]
+        return sources
+
+    def cost(self, node):
+        """估计的文献数(上限), 不读取倒排表"""
+        if node in self._costs:
+            return self._costs[node]
+        if isinstance(node, Term):
+            cost = sum(length for _, _, length in self.sources(node))
+        elif isinstance(node, Or):
+            cost = sum(self.cost(child) for child in node.children)
+        elif isinstance(node, And):
+            cost = min([self.cost(child) for child in node.children if not isinstance(child, (Not, Year))] or
+                       [UNKNOWN_LENGTH])
+        else:
+            cost = UNKNOWN_LENGTH
+        self._costs[node] = cost
+        return cost
+
+    def plan(self, node):
+        """AND的执行顺序: 肯定条件按估计的文献数从小到大, year:在其他肯定条件之后, NOT条件在最后"""
+        positives = sorted((child for child in node.children if not isinstance(child, Not)),
+                           key=lambda child: (isinstance(child, Year), self.cost(child)))
+        if not positives:
+            raise QuerySyntaxError('NOT must be combined with another condition')
+        return positives + [child for child in node.children if isinstance(child, Not)]
+
+    def materialize(self, node):
+        """
+        :return: 满足条件的升序PMID数组
+        """
+        if isinstance(node, Term):
+            sources = self.sources(node)
+            if not sources:
+                return posting.EMPTY
+            arrays = load_postings(sources[0][0], [posting_id for _, posting_id, _ in sources])
+            return posting.union(list(arrays.values()))
+        if isinstance(node, Year) and pmid_columns.ready:
+            return np.flatnonzero(self.year_mask(node)).astype(np.uint32)
+        if isinstance(node, Year):
+            return np.array(sorted(pub_id for pub_id, in db.session.query(PubMed.id).
+                                   filter(PubMed.year.between(node.start, node.end))), dtype=np.uint32)
+        if isinstance(node, Or):
+            return posting.union([self.materialize(child) for child in node.children])
+        if isinstance(node, Not):
+            raise QuerySyntaxError('NOT must be combined with another condition')
+        steps = self.plan(node)
+        pub_ids = self.materialize(steps[0])
+        for step in steps[1:]:
+            if len(pub_ids) == 0:
+                break
+            pub_ids = pub_ids[self.match(step, pub_ids)]
+        return pub_ids
+
+    def match(self, node, candidates):
+        """
+        :param candidates: 升序PMID数组
+        :return: 与candidates等长的bool数组, 只判断候选集中的PMID, 不解码整个倒排表
+        """
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=bool)
+        if isinstance(node, Term):
+            return self.match_term(node, candidates)
+        if isinstance(node, Year):
+            return self.match_year(node, candidates)
+        if isinstance(node, Not):
+            return ~self.match(node.child, candidates)
+        mask = np.zeros(len(candidates), dtype=bool) if isinstance(node, Or) else \
+            np.ones(len(candidates), dtype=bool)
+        children = sorted(node.children, key=self.cost, reverse=True) if isinstance(node, Or) else self.plan(node)
+        for child in children:
+            # OR只判断还没有匹配的PMID, AND只判断仍然满足前面条件的PMID
+            pending = ~mask if isinstance(node, Or) else mask
+            if not pending.any():
+                break
+            mask[pending] = self.match(child, candidates[pending])
+        return mask
+
+    def match_term(self, term, candidates):
+        mask = np.zeros(len(candidates), dtype=bool)
+        sources = self.sources(term)
+        if not sources:
+            return mask
+        kind = sources[0][0]
+        # 较短的倒排表解码后缓存, 较长的倒排表只读取需要的容器
+        short_ids = [posting_id for _, posting_id, length in sources
+                     if length <= len(candidates) * MATERIALIZE_RATIO or posting_cache.get((kind, posting_id))
+                     is not None]
+        for pub_ids in load_postings(kind, short_ids).values():
+            mask |= posting.contains(pub_ids, candidates)
+        long_ids = [posting_id for _, posting_id, _ in sources if posting_id not in short_ids]
+        if long_ids:
+            table, id_column = POSTING_TABLES[kind]
+            for posting_id, postings in db.session.query(id_column, table.postings).filter(id_column.in_(long_ids)):
+                if postings:
+                    mask |= posting.contains_encoded(postings, candidates)
+                else:
+                    mask |= posting.contains(load_postings(kind, [posting_id])[posting_id], candidates)
+        return mask
+
+    @staticmethod
+    def year_mask(year):
+        """PMID列中年份在范围内的位置, 下标为PMID"""
+        years = pmid_columns.array('year')
+        return (years >= year.start) & (years <= year.end)
+
+    def match_year(self, year, candidates):
+        if pmid_columns.ready:
+            years = pmid_columns.get('year', candidates)
+            return (years >= year.start) & (years <= year.end)
+        matched = []
+        for start in range(0, len(candidates), YEAR_BATCH_SIZE):
+            batch = candidates[start:start + YEAR_BATCH_SIZE].tolist()
+            matched.extend(pub_id for pub_id, in db.session.query(PubMed.id).
+                           filter(PubMed.id.in_(batch), PubMed.year.between(year.start, year.end)))
+        return posting.contains(np.array(sorted(matched), dtype=np.uint32), candidates)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 00:10
+# @File : ranking.py
+# @Project : OncoPubMinerAPI
+"""
+实体倒排表的预排序结果(只读), 由Monitor生成并保存在LibraryPubMedSortInfo/MentionPubMedSortInfo的orderings字段
+
+与 OncoPubMinerMonitor/pub_miner/ranking.py 保持一致:
+    header:    magic(2s) version(B) orderings(B) length(I)    length为生成时倒排表的文献数
+    directory: orderings * [sort(B) reserved(3x) count(I)]   sort为SORTS中的下标
+    data:      按目录顺序, 每个排序count * uint32 PMID
+
+单个标准库/原生词的检索按sort排序时, 直接从对应的排序结果中取当前页, 不需要对整个倒排表排序。
+倒排表的文献数与length不一致(生成后倒排表已更新)或排序结果不够当前页时返回None, 由调用方回退到PMID列排序。
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from cache import result_cache
+from model import LibraryPubMedSortInfo, MentionPubMedSortInfo
+from PubMiner import db
+
+MAGIC = b'SO'
+VERSION = 1
+HEADER = struct.Struct('<2sBBI')
+ENTRY = struct.Struct('<B3xI')
+SORTS = ['year', 'cited', 'if']
+SORT_TABLES = {'library': (LibraryPubMedSortInfo, LibraryPubMedSortInfo.library_id),
+               'mention': (MentionPubMedSortInfo, MentionPubMedSortInfo.mention_id)}
+# length: 生成时倒排表的文献数; arrays: {sort: 倒序排列的PMID数组}
+Orderings = namedtuple('Orderings', ['length', 'arrays'])
+NO_ORDERINGS = Orderings(-1, {})
+
+
+def decode(data):
+    magic, version, count, length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'unknown orderings format: {magic!r} v{version}')
+    entries = [ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size) for i in range(count)]
+    arrays, offset = {}, HEADER.size + count * ENTRY.size
+    for sort, size in entries:
+        arrays[SORTS[sort]] = np.frombuffer(data, dtype='<u4', count=size, offset=offset)
+        offset += size * 4
+    return Orderings(length, arrays)
+
+
+def load_orderings(kind, entity_id):
+    """
+    读取实体的预排序结果, 缓存在result_cache中
+    :param kind: library/mention
+    :return: Orderings, 没有预排序结果时返回NO_ORDERINGS
+    """
+    key = ('orderings', kind, entity_id)
+    orderings = result_cache.get(key)
+    if orderings is None:
+        table, id_column = SORT_TABLES[kind]
+        data = db.session.query(table.orderings).filter(id_column == entity_id).scalar()
+        orderings = decode(data) if data else NO_ORDERINGS
+        result_cache.put(key, orderings, size=len(data) if data else 64)
+    return orderings
+
+
+def ranked_page(kind, entity_id, length, sort, offset, limit, keep=None):
+    """
+    从预排序结果中取第offset到offset+limit篇
+    :param length: 当前倒排表的文献数
+    :param sort: year/cited/if
+    :param keep: 过滤函数, 输入PMID数组, 按原顺序返回保留的PMID
+    :return: PMID数组, 预排序结果不可用时返回None
+    """
+    orderings = load_orderings(kind, entity_id)
+    if orderings.length != length or sort not in orderings.arrays:
+        return None
+    pub_ids = orderings.arrays[sort]
+    # 只保存了前N篇
+    truncated = len(pub_ids) < length
+    if keep is not None:
+        pub_ids = keep(pub_ids)
+    if truncated and offset + limit > len(pub_ids):
+        return None
+    return pub_ids[offset:offset + limit]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 17:30
+# @File : refresher.py
+# @Project : OncoPubMinerAPI
+"""
+后台刷新相似文献/引用文献/被引用文献(NCBI elink)
+
+/similar 优先返回 cite_cited_similar_relationship 表中已有的数据(即使已超过刷新周期),
+过期的PMID交给后台线程刷新:
+    同一PMID的并发请求合并为一次刷新; pre-fork方式下通过ELINK_CLAIM_DIR中的标记文件在worker间合并:
+        其他worker正在刷新的PMID等待其完成后从数据库读取, 请求之后已被刷新的PMID不再请求
+    一次elink请求携带多个id参数(每个id返回一个LinkSet), 批量获取
+    请求通过eutils_client发送(连接池, 重试, 按NCBI的每秒请求数限流)
+"""
+import logging
+import os
+import re
+import threading
+import time
+import xml.etree.cElementTree as etree
+from collections import OrderedDict
+
+from config import Config
+from eutils import eutils_client
+from model import CiteCitedSimilarPubMed
+from PubMiner import db
+
+
+class RefreshTask(object):
+    """一个PMID的刷新任务, 同一PMID的并发请求共享同一个任务"""
+
+    def __init__(self, pub_id):
+        self.pub_id = pub_id
+        self.similar_ids = None
+        self.created = time.time()
+        self._done = threading.Event()
+
+    def finish(self, similar_ids):
+        self.similar_ids = similar_ids
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """等待刷新完成, 返回相似文献PMID列表, 超时或失败时返回None"""
+        self._done.wait(timeout)
+        return self.similar_ids
+
+
+def parse_link_sets(xml_data):
+    """
+    解析elink(cmd=neighbor)结果, 每个id参数对应一个LinkSet
+    :return: {pub_id: (similarIds, refIds, citedIds)}
+    """
+    links = {}
+    root = etree.fromstring(xml_data)
+    for LinkSet in root.findall('./LinkSet'):
+        source_id = LinkSet.findtext('./IdList/Id')
+        if not source_id:
+            continue
+        similarIds, refIds, citedIds = [], [], []
+        for LinkSetDb in LinkSet.findall('./LinkSetDb'):
+            link_ids = [Id.text for Id in LinkSetDb.findall('./Link/Id')
+                        if Id.text != source_id and re.search(r'^\d+$', Id.text)]
+            link_name = LinkSetDb.findtext('./LinkName')
+            if link_name == 'pubmed_pubmed':
+                similarIds = link_ids
+            elif link_name == 'pubmed_pubmed_refs':
+                refIds = link_ids
+            elif link_name == 'pubmed_pubmed_citedin':
+                citedIds = link_ids
+        links[int(source_id)] = (similarIds, refIds, citedIds)
+    return links
+
+
+def fetch_link_sets(pub_ids):
+    """批量获取多篇文献的相似/引用/被引用文献"""
+    links = {}
+    for content in eutils_client.elink(pub_ids):
+        links.update(parse_link_sets(content))
+    return links
+
+
+def save_link_sets(links):
+    """批量写入cite_cited_similar_relationship表"""
+    now = int(time.time())
+    rows = {row.pubmed_id: row for row in
+            CiteCitedSimilarPubMed.query.filter(CiteCitedSimilarPubMed.pubmed_id.in_(list(links))).all()}
+    for pub_id, (similarIds, refIds, citedIds) in links.items():
+        fields = {"cite": '|'.join(refIds), "cited": '|'.join(citedIds), "cite_num": len(refIds),
+                  "cited_num": len(citedIds), "similar": '|'.join(similarIds), "timestamp": now}
+        if pub_id in rows:
+            for field, value in fields.items():
+                setattr(rows[pub_id], field, value)
+        else:
+            db.session.add(CiteCitedSimilarPubMed(pubmed_id=pub_id, **fields))
+    db.session.commit()
+
+
+def claim_path(pub_id):
+    return os.path.join(Config.ELINK_CLAIM_DIR, f'{pub_id}.claim')
+
+
+def claim(pub_id):
+    """
+    创建PMID的刷新标记, 其他进程正在刷新时返回False; 超过ELINK_CLAIM_SECONDS的标记视为进程已退出, 删除后重新创建
+    """
+    path = claim_path(pub_id)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if os.path.getmtime(path) >= time.time() - Config.ELINK_CLAIM_SECONDS:
+                    return False
+                os.remove(path)
+            except OSError:
+                pass
+    return False
+
+
+def release(pub_ids):
+    for pub_id in pub_ids:
+        try:
+            os.remove(claim_path(pub_id))
+        except OSError:
+            pass
+
+
+def wait_released(pub_ids, timeout):
+    """等待其他进程完成刷新(标记被删除), 最多等待timeout秒"""
+    deadline = time.time() + timeout
+    while time.time() < deadline and any(os.path.exists(claim_path(pub_id)) for pub_id in pub_ids):
+        time.sleep(0.2)
+
+
+def load_similar(pub_ids, since):
+    """
+    数据库中在since之后刷新过的相似文献
+    :return: {pub_id: similarIds}
+    """
+    if not pub_ids:
+        return {}
+    rows = db.session.query(CiteCitedSimilarPubMed.pubmed_id, CiteCitedSimilarPubMed.similar). \
+        filter(CiteCitedSimilarPubMed.pubmed_id.in_(list(pub_ids)),
+               CiteCitedSimilarPubMed.timestamp >= int(since)).all()
+    return {pub_id: [pid for pid in (similar or '').split('|') if pid] for pub_id, similar in rows}
+
+
+class ElinkRefresher(object):
+    def __init__(self):
+        self.app = None
+        # 等待刷新的任务 {pub_id: RefreshTask}, 包括正在请求中的任务
+        self.tasks = OrderedDict()
+        self._queue = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def refresh(self, pub_id):
+        """
+        提交刷新任务, 同一PMID已在刷新中时直接返回已有的任务
+        :return: RefreshTask
+        """
+        with self._condition:
+            task = self.tasks.get(pub_id)
+            if task is None:
+                task = self.tasks[pub_id] = RefreshTask(pub_id)
+                self._queue.append(pub_id)
+                self._condition.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='elink-refresher', daemon=True)
+                self._thread.start()
+        return task
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            batch = self._queue[:Config.ELINK_BATCH_SIZE]
+            del self._queue[:len(batch)]
+        return batch
+
+    def _refresh(self, batch, since):
+        """
+        :param since: 批次中最早的任务的创建时间
+        :return: {pub_id: similarIds}
+        """
+        if Config.ELINK_CLAIM_DIR is None:
+            links = fetch_link_sets(batch)
+            with self.app.app_context():
+                save_link_sets(links)
+            return {pub_id: link[0] for pub_id, link in links.items()}
+        os.makedirs(Config.ELINK_CLAIM_DIR, exist_ok=True)
+        claimed = [pub_id for pub_id in batch if claim(pub_id)]
+        try:
+            with self.app.app_context():
+                results = load_similar(claimed, since)
+            pending = [pub_id for pub_id in claimed if pub_id not in results]
+            if pending:
+                links = fetch_link_sets(pending)
+                with self.app.app_context():
+                    save_link_sets(links)
+                results.update({pub_id: link[0] for pub_id, link in links.items()})
+        finally:
+            release(claimed)
+        others = [pub_id for pub_id in batch if pub_id not in claimed]
+        if others:
+            wait_released(others, Config.ELINK_WAIT_SECONDS)
+            with self.app.app_context():
+                results.update(load_similar(others, since))
+        return results
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            with self._condition:
+                since = min([self.tasks[pub_id].created for pub_id in batch if pub_id in self.tasks] or [time.time()])
+            results = {}
+            try:
+                results = self._refresh(batch, since)
+            except Exception as e:
+                logging.error(f'refresh elink error, pub_ids: {batch}, error: {e}')
+            with self._condition:
+                for pub_id in batch:
+                    task = self.tasks.pop(pub_id, None)
+                    if task is not None:
+                        task.finish(results.get(pub_id))
+
+    def stats(self):
+        return {"pending": len(self.tasks), "queued": len(self._queue)}
+
+
+elink_refresher = ElinkRefresher()
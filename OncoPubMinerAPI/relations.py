@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 01:40
+# @File : relations.py
+# @Project : OncoPubMinerAPI
+"""
+标准库共现矩阵(只读)
+
+与 OncoPubMinerMonitor/pub_miner/relations.py 使用同一种格式, 由Monitor根据 *_relationship 表全量生成:
+    BioCJsonDirPATH/RELATIONS/relations.bin
+
+    header:  magic(2s) version(B) reserved(B) rows(I) nnz(Q) triples(Q)
+    indptr:  (rows + 1) * uint64        CSR行指针, 行号为标准库id
+    indices: nnz * uint32               共现的标准库id, 行内升序
+    counts:  nnz * uint32               共现次数
+    triples: a, b, c, count 四个 triples * uint32 数组   a < b, c为第三个标准库, 按(a, b, c)升序
+
+整个文件通过mmap映射, 一个标准库的共现标准库是indices/counts中连续的一段(numpy视图),
+两个标准库的共现次数在行内二分查找, 与两个标准库共现的第三个标准库在triples上按(a, b)二分查找。
+Monitor生成新文件后整体替换, 根据inode/修改时间重新映射。
+"""
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from config import Config
+
+MAGIC = b'RM'
+VERSION = 1
+HEADER = struct.Struct('<2sBBIQQ')
+EMPTY_IDS = np.zeros(0, dtype=np.uint32)
+
+# triples: (a, b, c, count)
+Matrix = namedtuple('Matrix', ['indptr', 'indices', 'counts', 'triples'])
+EMPTY_MATRIX = Matrix(np.zeros(1, dtype='<u8'), EMPTY_IDS, EMPTY_IDS, (EMPTY_IDS,) * 4)
+
+
+def load_matrix(path):
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, rows, nnz, triples = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'unknown relation matrix format: {magic!r} v{version}')
+    indptr = np.frombuffer(data, dtype='<u8', count=rows + 1, offset=HEADER.size)
+    arrays, offset = [], HEADER.size + indptr.nbytes
+    for count in (nnz, nnz, triples, triples, triples, triples):
+        arrays.append(np.frombuffer(data, dtype='<u4', count=count, offset=offset))
+        offset += count * 4
+    return Matrix(indptr, arrays[0], arrays[1], tuple(arrays[2:]))
+
+
+class RelationMatrix(object):
+    def __init__(self, path):
+        self.path = path
+        self._matrix = EMPTY_MATRIX
+        self._stat = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return os.path.exists(self.path)
+
+    @property
+    def matrix(self):
+        """文件被替换后重新映射"""
+        try:
+            stat = os.stat(self.path)
+            stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return EMPTY_MATRIX
+        if stat != self._stat:
+            with self._lock:
+                if stat != self._stat:
+                    self._matrix = load_matrix(self.path)
+                    self._stat = stat
+        return self._matrix
+
+    def neighbors(self, library_id):
+        """
+        :return: (共现的标准库id数组, 共现次数数组), 只读视图
+        """
+        matrix = self.matrix
+        if library_id + 1 >= len(matrix.indptr):
+            return EMPTY_IDS, EMPTY_IDS
+        start, end = int(matrix.indptr[library_id]), int(matrix.indptr[library_id + 1])
+        return matrix.indices[start:end], matrix.counts[start:end]
+
+    def count(self, library_id, other_id):
+        """两个标准库的共现次数"""
+        ids, counts = self.neighbors(library_id)
+        index = int(np.searchsorted(ids, other_id))
+        return int(counts[index]) if index < len(ids) and ids[index] == other_id else 0
+
+    def thirds(self, library_id, other_id):
+        """
+        与两个标准库同时共现的第三个标准库
+        :return: (标准库id数组(升序), 共现次数数组), 只读视图
+        """
+        a, b = min(library_id, other_id), max(library_id, other_id)
+        first, second, third, counts = self.matrix.triples
+        start, end = int(np.searchsorted(first, a, 'left')), int(np.searchsorted(first, a, 'right'))
+        end = start + int(np.searchsorted(second[start:end], b, 'right'))
+        start += int(np.searchsorted(second[start:end], b, 'left'))
+        return third[start:end], counts[start:end]
+
+    def triple_count(self, library_id, other_id, third_id):
+        ids, counts = self.thirds(library_id, other_id)
+        index = int(np.searchsorted(ids, third_id))
+        return int(counts[index]) if index < len(ids) and ids[index] == third_id else 0
+
+
+relation_matrix = RelationMatrix(Config.RelationMatrixPATH)
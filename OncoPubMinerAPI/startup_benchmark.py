@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 22:10
+# @File : startup_benchmark.py
+# @Project : OncoPubMinerAPI
+"""
+启动时间基准: 在新的子进程中导入manage(创建app, 注册路由和接口文档), 记录耗时和内存
+    python startup_benchmark.py -n 5 --budget 3 --max-rss 300
+导入耗时(多次中的最小值)或内存超过预算, 以及延迟加载的模块在启动时被导入时, 以非零状态码退出,
+可以在镜像构建或部署前执行。词典/位图/打包存储等数据在第一次使用时才加载, 不计入启动时间。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# 只在个别接口中使用, 启动时不应导入的模块
+LAZY_MODULES = ['pandas', 'requests']
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import manage
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+""" % LAZY_MODULES
+
+
+def measure():
+    """
+    :return: {"seconds": 导入manage的耗时, "total": 包括解释器启动的耗时, "max_rss": 内存峰值(MB), "loaded": [...]}
+    """
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.PIPE, check=True).stdout
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    result['total'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs')
+    parser.add_argument('--budget', type=float, default=3.0, help='import time budget in seconds')
+    parser.add_argument('--max-rss', type=float, default=300, help='memory budget in MB')
+    args = parser.parse_args()
+    results = []
+    for _ in range(args.repeat):
+        results.append(measure())
+        print(f"import manage: {results[-1]['seconds']:.3f}s, total: {results[-1]['total']:.3f}s, "
+              f"max rss: {results[-1]['max_rss']:.1f}MB")
+    seconds = min(result['seconds'] for result in results)
+    max_rss = min(result['max_rss'] for result in results)
+    errors = []
+    if seconds > args.budget:
+        errors.append(f'import time {seconds:.3f}s exceeds budget {args.budget}s')
+    if max_rss > args.max_rss:
+        errors.append(f'max rss {max_rss:.1f}MB exceeds budget {args.max_rss}MB')
+    loaded = sorted({name for result in results for name in result['loaded']})
+    if loaded:
+        errors.append(f'modules imported at startup: {", ".join(loaded)}')
+    for error in errors:
+        print(error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 15:10
+# @File : suggest.py
+# @Project : OncoPubMinerAPI
+"""
+输入联想(/suggest)的前缀索引
+
+癌症/基因/化合物标准库的symbol和synonyms, 以及原生词(Mention)各建一个索引, 权重为关联的PubMed文献数
+(LibraryPubMed.length / MentionPubMed.length)。key小写后排序, 前缀查询先二分得到key下标范围,
+再在范围内按权重取前limit个:
+    范围较小时直接argpartition
+    范围较大的前缀(如单个字母)在构建索引时预先计算好前 SUGGEST_MAX_LIMIT 个结果
+"""
+from bisect import bisect_left
+
+import numpy as np
+
+from config import Config
+from dictionary import DictionaryLoader, KeySequence, MAX_CHAR, split_synonyms
+from model import CancerLibrary, GeneLibrary, ChemLibrary, LibraryPubMed, Mention, MentionPubMed
+from PubMiner import db
+
+SUGGEST_TYPES = ['cancer', 'gene', 'chemical', 'mention']
+
+
+class SuggestIndex(object):
+    def __init__(self, items):
+        """
+        :param items: [(key, symbol, weight)] key为用于匹配的symbol/synonym/mention, 同一symbol的多个key只返回一次
+        """
+        rows = sorted((key.lower(), key, symbol, weight or 0) for key, symbol, weight in items
+                      if key and symbol and '\n' not in key)
+        # 与标准库词典相同, key和原文只保存为拼接后的字符串, 多进程时在worker间共享
+        self.keys = KeySequence([row[0] for row in rows])
+        self.texts = KeySequence([row[1] for row in rows])
+        symbols = {}
+        self.owners = np.array([symbols.setdefault(row[2], len(symbols)) for row in rows], dtype=np.int64)
+        self.symbols = list(symbols)
+        self.weights = np.array([row[3] for row in rows], dtype=np.int64)
+        self.lengths = np.array([len(row[0]) for row in rows], dtype=np.int64)
+        # 前缀 -> 预先计算的结果(key下标), 只保存匹配范围超过阈值的前缀
+        self.top_prefixes = {}
+        self._build_top_prefixes(0, len(self.keys), '')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, prefix, lo=0, hi=None):
+        hi = len(self.keys) if hi is None else hi
+        return bisect_left(self.keys, prefix, lo, hi), bisect_left(self.keys, prefix + MAX_CHAR, lo, hi)
+
+    def _build_top_prefixes(self, lo, hi, prefix):
+        """逐层展开匹配范围超过阈值的前缀, 每层各前缀的范围互不重叠, 总开销与key数量成正比"""
+        depth = len(prefix)
+        position = lo
+        while position < hi:
+            key = self.keys[position]
+            if len(key) <= depth:
+                position += 1
+                continue
+            child = key[:depth + 1]
+            child_lo, child_hi = self.prefix_range(child, position, hi)
+            if child_hi - child_lo > Config.SUGGEST_RANGE_THRESHOLD:
+                self.top_prefixes[child] = self._top(child_lo, child_hi, Config.SUGGEST_MAX_LIMIT)
+                self._build_top_prefixes(child_lo, child_hi, child)
+            position = child_hi
+
+    def _top(self, lo, hi, limit):
+        """范围[lo, hi)内按权重倒序(权重相同时key短的优先)取前limit个不同symbol的key下标"""
+        size = hi - lo
+        weights, lengths = self.weights[lo:hi], self.lengths[lo:hi]
+        # 同一symbol可能有多个key落在范围内, 多取一些候选用于去重
+        k = min(size, limit * 4)
+        while True:
+            candidates = np.argpartition(-weights, k - 1)[:k] if k < size else np.arange(size)
+            candidates = candidates[np.lexsort((lengths[candidates], -weights[candidates]))] + lo
+            seen, result = set(), []
+            for index in candidates.tolist():
+                owner = int(self.owners[index])
+                if owner not in seen:
+                    seen.add(owner)
+                    result.append(index)
+                    if len(result) == limit:
+                        return result
+            if k >= size:
+                return result
+            k = min(size, k * 4)
+
+    def suggest(self, prefix, limit):
+        """
+        :return: [(key, symbol, weight)] 按权重倒序
+        """
+        lo, hi = self.prefix_range(prefix)
+        if hi - lo > Config.SUGGEST_RANGE_THRESHOLD and prefix in self.top_prefixes:
+            indexes = self.top_prefixes[prefix][:limit]
+        elif hi > lo:
+            indexes = self._top(lo, hi, limit)
+        else:
+            indexes = []
+        return [(self.texts[index], self.symbols[self.owners[index]], int(self.weights[index])) for index in indexes]
+
+
+def load_library_items(model):
+    def load():
+        rows = db.session.query(model.symbol, model.synonyms, LibraryPubMed.length) \
+            .outerjoin(LibraryPubMed, LibraryPubMed.library_id == model.library_id).all()
+        return [(key, symbol, length) for symbol, synonyms, length in rows
+                for key in set([symbol] + split_synonyms(synonyms))]
+    return load
+
+
+def load_mention_items():
+    # 原生词数量很大, 只保留关联文献数达到阈值的原生词
+    rows = db.session.query(Mention.mention, MentionPubMed.length) \
+        .join(MentionPubMed, MentionPubMed.mention_id == Mention.id) \
+        .filter(MentionPubMed.length >= Config.SUGGEST_MENTION_MIN_LENGTH).all()
+    return [(mention, mention, length) for mention, length in rows]
+
+
+suggest_indexes = {
+    'cancer': DictionaryLoader('cancer suggest', load_library_items(CancerLibrary), SuggestIndex),
+    'gene': DictionaryLoader('gene suggest', load_library_items(GeneLibrary), SuggestIndex),
+    'chemical': DictionaryLoader('chemical suggest', load_library_items(ChemLibrary), SuggestIndex),
+    'mention': DictionaryLoader('mention suggest', load_mention_items, SuggestIndex),
+}
+
+
+def reload_suggest_indexes():
+    for loader in suggest_indexes.values():
+        loader.reload()
+
+
+def suggest(query, suggest_type=None, limit=10):
+    """
+    :param query: 输入的前缀
+    :param suggest_type: cancer/gene/chemical/mention, 为空时查询全部类型
+    :param limit: 返回个数
+    :return: [{"text", "symbol", "type", "count"}] 按关联文献数倒序
+    """
+    prefix = query.strip().lower()
+    if not prefix:
+        return []
+    limit = max(1, min(limit, Config.SUGGEST_MAX_LIMIT))
+    suggestions = []
+    for name in ([suggest_type] if suggest_type else SUGGEST_TYPES):
+        suggestions.extend({"text": text, "symbol": symbol, "type": name, "count": weight}
+                           for text, symbol, weight in suggest_indexes[name].get().suggest(prefix, limit))
+    if not suggest_type:
+        suggestions.sort(key=lambda suggestion: (-suggestion["count"], len(suggestion["text"])))
+    return suggestions[:limit]
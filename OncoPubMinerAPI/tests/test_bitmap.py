@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/20 11:20
+# @File : test_bitmap.py
+# @Project : OncoPubMinerAPI
+"""
+PMID位图文件的单元测试
+
+检查字节/页边界上的PMID, 空集合, 集合缩小, 只写入变化的页, 不完整的文件和其他实例(进程)写入后的读取。
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bitmap import PMIDBitmap, PAGE_SIZE  # noqa: E402
+
+PAGE_BITS = PAGE_SIZE * 8
+BOUNDARY_IDS = [0, 7, 8, 65535, 65536, PAGE_BITS - 1, PAGE_BITS, 3 * PAGE_BITS + 5]
+
+
+class PMIDBitmapTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'bitmap', 'is_cancer.bin')
+
+    def check(self, bitmap, pub_ids):
+        pub_ids = np.array(pub_ids, dtype=np.uint32)
+        probes = np.unique(np.concatenate((pub_ids, pub_ids + 1, [1, 6, 9, 65534, 0xFFFFFFFF])).astype(np.uint32))
+        np.testing.assert_array_equal(bitmap.contains(probes), np.isin(probes, pub_ids))
+        self.assertEqual(bitmap.count(probes), len(np.unique(pub_ids)))
+        np.testing.assert_array_equal(bitmap.filter(probes[::-1]), np.intersect1d(probes, pub_ids)[::-1])
+
+    def test_missing_file(self):
+        bitmap = PMIDBitmap(self.path)
+        self.assertFalse(bitmap.ready)
+        self.assertEqual(bitmap.contains([1, 2]).tolist(), [False, False])
+        self.assertEqual(len(bitmap.contains([])), 0)
+
+    def test_boundaries(self):
+        bitmap = PMIDBitmap(self.path)
+        bitmap.update(BOUNDARY_IDS, version=3)
+        self.assertTrue(bitmap.ready)
+        self.assertEqual(bitmap.version, 3)
+        self.assertEqual(os.path.getsize(self.path), 4 * PAGE_SIZE)
+        self.check(bitmap, BOUNDARY_IDS)
+        # 其他进程只读映射同一个文件
+        self.check(PMIDBitmap(self.path), BOUNDARY_IDS)
+
+    def test_empty_set(self):
+        bitmap = PMIDBitmap(self.path)
+        self.assertEqual(bitmap.update([]), 0)
+        self.assertFalse(bitmap.ready)
+        self.check(bitmap, [])
+        bitmap.update(BOUNDARY_IDS)
+        bitmap.update([])
+        self.check(bitmap, [])
+
+    def test_shrink(self):
+        bitmap = PMIDBitmap(self.path)
+        bitmap.update(BOUNDARY_IDS)
+        self.assertEqual(bitmap.update([7, 65536]), 3)
+        # 文件不会缩小, 超出新集合的部分清零
+        self.assertEqual(os.path.getsize(self.path), 4 * PAGE_SIZE)
+        self.check(bitmap, [7, 65536])
+
+    def test_changed_pages(self):
+        bitmap = PMIDBitmap(self.path)
+        self.assertEqual(bitmap.update(BOUNDARY_IDS), 4)
+        self.assertEqual(bitmap.update(BOUNDARY_IDS), 0)
+        self.assertEqual(bitmap.update(BOUNDARY_IDS + [PAGE_BITS + 1]), 1)
+
+    def test_grow_seen_by_reader(self):
+        writer, reader = PMIDBitmap(self.path), PMIDBitmap(self.path)
+        writer.update([1])
+        self.check(reader, [1])
+        writer.update([1, 10 * PAGE_BITS])
+        self.check(reader, [1, 10 * PAGE_BITS])
+
+    def test_truncated_file(self):
+        # 写了一半的文件: 末尾不完整的页按0读取, 下次更新时补齐到整页
+        PMIDBitmap(self.path).update(BOUNDARY_IDS)
+        with open(self.path, 'r+b') as f:
+            f.truncate(2 * PAGE_SIZE + 100)
+        bitmap = PMIDBitmap(self.path)
+        self.check(bitmap, [pub_id for pub_id in BOUNDARY_IDS if pub_id < (2 * PAGE_SIZE + 100) * 8])
+        bitmap.update(BOUNDARY_IDS)
+        self.assertEqual(os.path.getsize(self.path), 4 * PAGE_SIZE)
+        self.check(bitmap, BOUNDARY_IDS)
+        with open(self.path, 'ab') as f:
+            f.write(b'\xff' * 100)
+        bitmap.update([5])
+        self.assertEqual(os.path.getsize(self.path), 5 * PAGE_SIZE)
+        self.check(bitmap, [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/20 11:50
+# @File : test_citation_graph.py
+# @Project : OncoPubMinerAPI
+"""
+文献引用关系图的往返测试
+
+Monitor(OncoPubMinerMonitor/pub_miner/citation_graph.py)写入, API通过mmap读取, 检查空列表, 索引扩容边界,
+写了一半的edges/索引尾部和覆盖写入后的读取。
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import citation_graph  # noqa: E402
+
+
+def load_monitor_module(name):
+    """Monitor中的模块只依赖pub_miner.Config, 导入时替换为空模块"""
+    path = os.path.join(os.path.dirname(API_DIR), 'OncoPubMinerMonitor', 'pub_miner', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(f'monitor_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {'pub_miner': mock.MagicMock()}):
+        spec.loader.exec_module(module)
+    return module
+
+
+monitor_graph = load_monitor_module('citation_graph')
+GROW = monitor_graph.INDEX_GROW_ENTRIES
+
+
+class CitationGraphTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, 'cite')
+        self.writer = monitor_graph.CitationGraph(self.root)
+
+    def assertEdges(self, graph, pub_id, expected):
+        edges = graph.get(pub_id)
+        self.assertIsNotNone(edges)
+        self.assertEqual(edges.dtype, citation_graph.EDGE_DTYPE)
+        self.assertEqual(edges.tolist(), expected)
+
+    def test_empty_graph(self):
+        graph = citation_graph.CitationGraph(self.root)
+        self.assertIsNone(graph.get(1))
+        self.assertEqual(len(graph.gather([1, 2])), 0)
+        self.assertEqual(len(graph.gather([])), 0)
+        self.writer.put_many([])
+        self.assertFalse(os.path.exists(self.root))
+
+    def test_round_trip(self):
+        items = [(0, [65536, 65535, 0]), (1, '3|1||2|3'), (65535, []), (65536, ''), (GROW - 1, [2 ** 31 - 1]),
+                 (GROW, list(range(1000, 0, -1)))]
+        self.writer.put_many(items)
+        graph = citation_graph.CitationGraph(self.root)
+        expected = {pub_id: monitor_graph.parse_pub_ids(pub_ids) for pub_id, pub_ids in items}
+        for pub_id, pub_ids in expected.items():
+            with self.subTest(pub_id=pub_id):
+                # 空列表与没有数据不同: 返回空数组
+                self.assertEdges(graph, pub_id, pub_ids)
+                self.assertEqual(self.writer.get(pub_id), pub_ids)
+        self.assertIsNone(graph.get(2))
+        self.assertIsNone(graph.get(GROW * 4))
+        keys = [GROW, 2, 0, 65535, 1, GROW * 4]
+        self.assertEqual(graph.gather(keys).tolist(), expected[GROW] + expected[0] + expected[1])
+
+    def test_reader_sees_later_writes(self):
+        graph = citation_graph.CitationGraph(self.root)
+        self.writer.put_many([(5, [1, 2])])
+        self.assertEdges(graph, 5, [1, 2])
+        self.writer.put_many([(5, [3]), (GROW + 5, [4, 5])])
+        self.assertEdges(graph, 5, [3])
+        self.assertEdges(graph, GROW + 5, [4, 5])
+        self.assertEqual(graph.gather([GROW + 5, 5]).tolist(), [4, 5, 3])
+
+    def test_torn_edges_tail(self):
+        # 写入edges后进程退出, 索引没有改写: 不完整的数据对齐后继续追加
+        self.writer.put_many([(1, [10, 11])])
+        with open(self.writer.edges_path, 'ab') as f:
+            f.write(b'\x07\x00\x00\x00\x08\x00')
+        graph = citation_graph.CitationGraph(self.root)
+        self.assertEdges(graph, 1, [10, 11])
+        self.assertIsNone(graph.get(2))
+        self.writer.put_many([(2, [20, 21, 22]), (3, [])])
+        self.assertEqual(os.path.getsize(self.writer.edges_path) % monitor_graph.EDGE_SIZE, 0)
+        self.assertEdges(graph, 1, [10, 11])
+        self.assertEdges(graph, 2, [20, 21, 22])
+        self.assertEdges(graph, 3, [])
+        self.assertEqual(graph.gather([1, 2, 3]).tolist(), [10, 11, 20, 21, 22])
+
+    def test_index_points_past_edges(self):
+        # 索引指向edges中尚未写入的位置时当作没有数据
+        self.writer.put_many([(1, [10, 11]), (2, [20])])
+        with open(self.writer.edges_path, 'r+b') as f:
+            f.truncate(2 * monitor_graph.EDGE_SIZE)
+        graph = citation_graph.CitationGraph(self.root)
+        self.assertEdges(graph, 1, [10, 11])
+        self.assertIsNone(graph.get(2))
+        self.assertEqual(graph.gather([1, 2]).tolist(), [10, 11])
+
+    def test_partial_index_entry(self):
+        # 索引末尾不完整的条目被忽略
+        self.writer.put_many([(1, [10])])
+        entries = os.path.getsize(self.writer.index_path) // monitor_graph.ENTRY.size
+        with open(self.writer.index_path, 'ab') as f:
+            f.write(monitor_graph.ENTRY.pack(0, 1, monitor_graph.FLAG_PRESENT)[:10])
+        graph = citation_graph.CitationGraph(self.root)
+        self.assertEdges(graph, 1, [10])
+        self.assertIsNone(graph.get(entries))
+        self.assertEqual(graph.gather([entries, 1]).tolist(), [10])
+        # 之后写入更大的PMID时索引扩容, 覆盖不完整的条目
+        self.writer.put_many([(entries + 1, [30])])
+        self.assertEdges(graph, entries + 1, [30])
+        self.assertIsNone(graph.get(entries))
+
+    def test_gather_matches_get(self):
+        rng = np.random.RandomState(0)
+        items = [(int(pub_id), rng.randint(0, 2 ** 31 - 1, rng.randint(0, 20)).tolist())
+                 for pub_id in rng.choice(200000, 300, replace=False)]
+        self.writer.put_many(items)
+        graph = citation_graph.CitationGraph(self.root)
+        keys = np.concatenate(([pub_id for pub_id, _ in items], rng.randint(0, 250000, 1000)))
+        rng.shuffle(keys)
+        expected = [edge for key in keys.tolist() if graph.get(key) is not None for edge in graph.get(key).tolist()]
+        self.assertEqual(graph.gather(keys).tolist(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
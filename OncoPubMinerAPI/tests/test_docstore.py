@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/20 10:40
+# @File : test_docstore.py
+# @Project : OncoPubMinerAPI
+"""
+文献打包存储的往返测试
+
+Monitor(OncoPubMinerMonitor/pub_miner/docstore.py)写入, API只读, 检查空存储, 索引扩容边界,
+gzip保存的记录, 写了一半的数据段/索引尾部和整理(compact)之后的读取。
+"""
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import docstore  # noqa: E402
+
+
+def load_monitor_module(name):
+    """Monitor中的模块只依赖pub_miner.Config, 导入时替换为空模块"""
+    path = os.path.join(os.path.dirname(API_DIR), 'OncoPubMinerMonitor', 'pub_miner', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(f'monitor_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {'pub_miner': mock.MagicMock()}):
+        spec.loader.exec_module(module)
+    return module
+
+
+monitor_docstore = load_monitor_module('docstore')
+
+
+def make_document(doc_id, text='text'):
+    return {'source': 'PubMed', 'id': str(doc_id), 'infons': {}, 'passages': [
+        {'infons': {'type': 'title', 'year': '2020', 'citedNums': 3}, 'offset': 0, 'text': f'{text} {doc_id}',
+         'sentences': [], 'annotations': [{'id': '1', 'text': 'EGFR'}], 'relations': []},
+        {'infons': {'type': 'abstract'}, 'offset': 20, 'text': '中文 abstract', 'sentences': [], 'annotations': [],
+         'relations': []}]}
+
+
+def expected_document(doc_id, text='text', infons=None):
+    """写入时去掉动态字段"""
+    document = make_document(doc_id, text)
+    del document['passages'][0]['infons']['citedNums']
+    document['passages'][0]['infons'].update(infons or {})
+    return document
+
+
+class DocumentStoreTest(unittest.TestCase):
+    compress = False
+    DOC_IDS = [0, 1, 65535, 65536, monitor_docstore.INDEX_GROW_ENTRIES - 1, monitor_docstore.INDEX_GROW_ENTRIES]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, 'PUBMED')
+        self.writer = monitor_docstore.DocumentStore(self.root, compress=self.compress)
+
+    def reader(self):
+        return docstore.DocumentStore(self.root)
+
+    def check(self, reader, doc_id, text='text', infons=None):
+        expected = expected_document(doc_id, text)
+        self.assertEqual(reader.get(doc_id), expected)
+        self.assertEqual(json.loads(reader.get_bytes(doc_id).decode('utf-8')), expected)
+        for pread in (False, True):
+            chunks = reader.get_chunks(doc_id, infons or {}, pread=pread)
+            self.assertEqual(json.loads(b''.join(chunks).decode('utf-8')), expected_document(doc_id, text, infons))
+
+    def test_empty_store(self):
+        reader = self.reader()
+        self.assertFalse(reader.ready)
+        self.assertIsNone(reader.get(1))
+        self.assertIsNone(reader.version(1))
+        self.assertEqual(reader.contains_many([0, 1, 2]).tolist(), [False] * 3)
+        self.writer.put_many([])
+        self.assertFalse(reader.ready)
+
+    def test_round_trip(self):
+        self.writer.put_many([(doc_id, make_document(doc_id), None) for doc_id in self.DOC_IDS])
+        reader = self.reader()
+        for doc_id in self.DOC_IDS:
+            with self.subTest(doc_id=doc_id):
+                self.check(reader, doc_id, infons={'citedNums': 5, 'hasPMC': True})
+                self.assertTrue(reader.contains(doc_id))
+        probes = self.DOC_IDS + [2, 65534, 65537, 1 << 40]
+        self.assertEqual(reader.contains_many(probes).tolist(), [True] * len(self.DOC_IDS) + [False] * 4)
+        self.assertIsNone(reader.get(2))
+
+    def test_projection(self):
+        self.writer.put_many([(1, make_document(1), None)])
+        reader = self.reader()
+        document = reader.get(1, docstore.Projection(sections=('title',), fields=['text']))
+        self.assertEqual(len(document['passages']), 1)
+        self.assertEqual(document['passages'][0]['annotations'], [])
+        self.assertEqual(document['passages'][0]['text'], 'text 1')
+
+    def test_document_without_passages(self):
+        self.writer.put_many([('PMC7', {'id': 'PMC7', 'passages': []}, None)])
+        reader = self.reader()
+        self.assertEqual(reader.get('PMC7'), {'id': 'PMC7', 'passages': []})
+        # 没有拼接位置的记录由调用方解析后填充动态字段
+        self.assertIsNone(reader.get_chunks('PMC7', {'citedNums': 1}))
+
+    def test_reader_sees_later_writes(self):
+        reader = self.reader()
+        self.writer.put_many([(1, make_document(1), None)])
+        self.check(reader, 1)
+        version = reader.version(1)
+        self.writer.put_many([(1, make_document(1, 'updated'), None), (70000, make_document(70000), None)])
+        self.check(reader, 1, 'updated')
+        self.check(reader, 70000)
+        self.assertNotEqual(reader.version(1), version)
+
+    def test_torn_segment_tail(self):
+        # 写入数据段后进程退出, 索引没有改写: 尾部的垃圾数据不影响已有记录和之后的写入
+        self.writer.put_many([(1, make_document(1), None)])
+        with open(os.path.join(self.root, docstore.segment_name(0)), 'ab') as f:
+            f.write(b'{"id":"2","passages":[{"inf')
+        reader = self.reader()
+        self.assertIsNone(reader.get(2))
+        self.writer.put_many([(2, make_document(2), None)])
+        self.check(reader, 1)
+        self.check(reader, 2)
+
+    def test_partial_index_entry(self):
+        # 索引末尾不完整的条目被忽略
+        self.writer.put_many([(1, make_document(1), None)])
+        size = os.path.getsize(self.writer.index_path)
+        with open(self.writer.index_path, 'ab') as f:
+            f.write(b'\x01' * (docstore.ENTRY_DTYPE.itemsize // 2))
+        reader = self.reader()
+        self.check(reader, 1)
+        self.assertFalse(reader.contains(size // docstore.ENTRY_DTYPE.itemsize))
+        self.assertIsNone(reader.get(size // docstore.ENTRY_DTYPE.itemsize))
+
+    def test_compact(self):
+        doc_ids = list(range(1, 50)) + [65536]
+        self.writer.put_many([(doc_id, make_document(doc_id, 'old' * 10), None) for doc_id in doc_ids])
+        reader = self.reader()
+        for pread in (False, True):
+            # 整理前已映射/打开旧的数据段
+            reader.get_chunks(1, {}, pread=pread)
+        self.writer.put_many([(doc_id, make_document(doc_id, 'new'), None) for doc_id in doc_ids])
+        self.assertGreater(self.writer.compact(), 0)
+        self.assertEqual(self.writer.segments(), [1])
+        self.assertEqual(self.writer.compact(), 0)
+        for doc_id in doc_ids:
+            self.check(reader, doc_id, 'new')
+        self.check(self.reader(), 65536, 'new')
+        # 索引修改后释放已删除数据段的映射
+        with mock.patch.object(docstore, 'SEGMENT_CHECK_SECONDS', 0):
+            reader.get(1)
+        self.assertEqual(list(reader._segments), [1])
+
+    def test_update_infos(self):
+        self.writer.put_many([(1, make_document(1), None)])
+        self.assertEqual(self.writer.update_infos_many([(1, {'journal': 'Nature'}), (2, {'journal': 'Cell'})]), [2])
+        self.assertEqual(self.reader().get(1)['passages'][0]['infons']['journal'], 'Nature')
+
+
+class CompressedDocumentStoreTest(DocumentStoreTest):
+    compress = True
+
+    def test_gzip_records(self):
+        self.writer.put_many([(1, make_document(1), None)])
+        entry = np.fromfile(self.writer.index_path, dtype=docstore.ENTRY_DTYPE, count=2)[1]
+        self.assertTrue(entry['flags'] & docstore.FLAG_GZIP)
+
+
+if __name__ == '__main__':
+    unittest.main()
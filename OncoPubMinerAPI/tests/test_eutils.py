@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 16:20
+# @File : test_eutils.py
+# @Project : OncoPubMinerAPI
+"""
+E-utilities客户端的单元测试
+
+在本地启动http.server模拟E-utilities, 检查重试(5xx/429), id分批和限流(进程内/共用状态文件);
+Monitor中的同名实现(OncoPubMinerMonitor/pub_miner/eutils.py)使用同样的用例。
+"""
+import http.server
+import importlib.util
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from unittest import mock
+
+import requests
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import eutils  # noqa: E402
+
+
+def load_monitor_eutils():
+    """Monitor的eutils.py只依赖pub_miner.Config, 导入时替换为空模块"""
+    path = os.path.join(os.path.dirname(API_DIR), 'OncoPubMinerMonitor', 'pub_miner', 'eutils.py')
+    spec = importlib.util.spec_from_file_location('monitor_eutils', path)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {'pub_miner': mock.MagicMock()}):
+        spec.loader.exec_module(module)
+    return module
+
+
+class FakeEutils(http.server.BaseHTTPRequestHandler):
+    """
+    模拟E-utilities: 按顺序返回failures中的状态码, 之后返回200;
+    elink为每个id返回一个LinkSet(相似文献为id+1), 其他接口返回固定内容
+    """
+    protocol_version = 'HTTP/1.1'
+    # 响应头和内容一次写出, 避免keep-alive连接上的延迟确认
+    wbufsize = -1
+
+    def do_POST(self):
+        params = urllib.parse.parse_qsl(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, params))
+            status = server.failures.pop(0) if server.failures else 200
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.endswith('/elink.fcgi'):
+            body = '<eLinkResult>' + ''.join(
+                f'<LinkSet><IdList><Id>{doc_id}</Id></IdList><LinkSetDb><LinkName>pubmed_pubmed</LinkName>'
+                f'<Link><Id>{int(doc_id) + 1}</Id></Link></LinkSetDb></LinkSet>'
+                for key, doc_id in params if key == 'id') + '</eLinkResult>'
+        else:
+            body = '<eFetchResult>ok</eFetchResult>'
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_server(test_case):
+    server = ThreadingServer(('127.0.0.1', 0), FakeEutils)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.failures = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test_case.addCleanup(server.server_close)
+    test_case.addCleanup(server.shutdown)
+    return server
+
+
+class EutilsClientTest(unittest.TestCase):
+    module = eutils
+
+    def setUp(self):
+        self.server = start_server(self)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def client(self, **kwargs):
+        kwargs.setdefault('requests_per_second', 1000)
+        kwargs.setdefault('backoff', 0)
+        return self.module.EutilsClient(self.url, **kwargs)
+
+    def test_retry(self):
+        self.server.failures = [503, 429, 500]
+        self.assertEqual(self.client(retries=3).efetch('pubmed', [1]), [b'<eFetchResult>ok</eFetchResult>'])
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_retry_exhausted(self):
+        self.server.failures = [502] * 3
+        with self.assertRaises(requests.exceptions.RetryError):
+            self.client(retries=2).efetch('pubmed', [1])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_batches(self):
+        client = self.client(batch_size=3)
+        self.assertEqual(len(client.efetch('pubmed', range(1, 8), retmode='xml')), 3)
+        self.assertEqual([dict(params)['id'] for _, params in self.server.requests], ['1,2,3', '4,5,6', '7'])
+        del self.server.requests[:]
+        contents = client.elink(range(1, 8))
+        self.assertEqual(len(contents), 3)
+        # 每个id单独作为一个参数
+        self.assertEqual([[value for key, value in params if key == 'id'] for _, params in self.server.requests],
+                         [['1', '2', '3'], ['4', '5', '6'], ['7']])
+        self.assertIn(b'<Id>8</Id>', contents[-1])
+
+    def test_common_params(self):
+        self.client(email='a@b.c', api_key='key').esearch('pubmed', 'egfr')
+        path, params = self.server.requests[0]
+        self.assertTrue(path.endswith('/esearch.fcgi'))
+        self.assertEqual(dict(params)['api_key'], 'key')
+        self.assertEqual(dict(params)['term'], 'egfr')
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            client = self.client(cache_dir=cache_dir)
+            self.assertEqual(client.efetch('pubmed', [1]), client.efetch('pubmed', [1]))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_rate_limit(self):
+        client = self.client(requests_per_second=20)
+        start = time.time()
+        for doc_id in range(30):
+            client.efetch('pubmed', [doc_id])
+        # 初始20个令牌, 其余10个请求按每秒20个发送
+        self.assertGreaterEqual(time.time() - start, 0.45)
+
+
+class MonitorEutilsClientTest(EutilsClientTest):
+    module = load_monitor_eutils()
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_burst(self):
+        limiter = eutils.RateLimiter(10)
+        start = time.time()
+        for _ in range(10):
+            limiter.acquire()
+        self.assertLess(time.time() - start, 0.1)
+        limiter.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+    def test_shared_file(self):
+        # 共用状态文件的两个令牌桶(模拟两个worker)合计不超过rate
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'eutils.rate')
+            limiters = [eutils.RateLimiter(10, path), load_monitor_eutils().RateLimiter(10, path)]
+            start = time.time()
+            for _ in range(10):
+                for limiter in limiters:
+                    limiter.acquire()
+            self.assertGreaterEqual(time.time() - start, 0.9)
+
+    def test_separate(self):
+        limiters = [eutils.RateLimiter(10), eutils.RateLimiter(10)]
+        start = time.time()
+        for _ in range(10):
+            for limiter in limiters:
+                limiter.acquire()
+        self.assertLess(time.time() - start, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
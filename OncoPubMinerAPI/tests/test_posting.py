@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/20 10:10
+# @File : test_posting.py
+# @Project : OncoPubMinerAPI
+"""
+倒排表二进制格式的往返测试
+
+Monitor(OncoPubMinerMonitor/pub_miner/posting.py)编码, API解码, 检查空表, 容器边界(65535/65536),
+array/bitmap容器切换(4096/4097)和截断的数据。
+"""
+import importlib.util
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import posting  # noqa: E402
+
+
+def load_monitor_module(name):
+    """Monitor中的模块只依赖pub_miner.Config, 导入时替换为空模块"""
+    path = os.path.join(os.path.dirname(API_DIR), 'OncoPubMinerMonitor', 'pub_miner', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(f'monitor_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {'pub_miner': mock.MagicMock()}):
+        spec.loader.exec_module(module)
+    return module
+
+
+monitor_posting = load_monitor_module('posting')
+
+CASES = {
+    'empty': [],
+    'zero': [0],
+    'last_low': [65535],
+    'first_high': [65536],
+    'boundary': [65534, 65535, 65536, 65537],
+    'max': [0xFFFFFFFF, 0, 65536],
+    'array_max': range(0, 2 * posting.ARRAY_MAX_SIZE, 2),
+    'bitmap': range(65536, 65536 + posting.ARRAY_MAX_SIZE + 1),
+    'mixed': list(range(3, 30000, 7)) + list(range(70000, 80000)) + [0xFFFFFFFE],
+}
+
+
+class PostingTest(unittest.TestCase):
+    def check(self, encode):
+        for name, values in CASES.items():
+            with self.subTest(name):
+                expected = np.unique(np.array(list(values), dtype=np.uint32))
+                data = encode(values)
+                decoded = posting.decode(data)
+                self.assertEqual(decoded.dtype, np.uint32)
+                np.testing.assert_array_equal(decoded, expected)
+                self.assertEqual(posting.cardinality(data), len(expected))
+                probes = np.unique(np.concatenate((expected, expected + 1, [0, 65535, 65536])).astype(np.uint32))
+                np.testing.assert_array_equal(posting.contains_encoded(data, probes), np.isin(probes, expected))
+
+    def test_monitor_to_api(self):
+        self.check(monitor_posting.encode)
+
+    def test_api_round_trip(self):
+        self.check(posting.encode)
+
+    def test_same_bytes(self):
+        for name, values in CASES.items():
+            with self.subTest(name):
+                self.assertEqual(monitor_posting.encode(values), posting.encode(values))
+
+    def test_container_kind(self):
+        directory, _ = posting.read_directory(posting.encode(CASES['array_max']))
+        self.assertEqual(directory['kind'].tolist(), [posting.ARRAY_CONTAINER])
+        directory, _ = posting.read_directory(posting.encode(CASES['bitmap']))
+        self.assertEqual(directory['kind'].tolist(), [posting.BITMAP_CONTAINER])
+
+    def test_missing(self):
+        self.assertEqual(len(posting.decode(b'')), 0)
+        self.assertEqual(len(posting.decode(None)), 0)
+        self.assertEqual(posting.cardinality(b''), 0)
+
+    def test_truncated(self):
+        # 写入不完整的数据在任意位置截断都抛出ValueError, 不返回部分结果
+        for name in ('boundary', 'bitmap', 'mixed'):
+            data = monitor_posting.encode(CASES[name])
+            for size in sorted({1, posting.HEADER.size - 1, posting.HEADER.size, posting.HEADER.size + 5,
+                                len(data) // 2, len(data) - 1}):
+                with self.subTest(name, size=size):
+                    with self.assertRaises(ValueError):
+                        posting.decode(data[:size])
+
+    def test_unknown_format(self):
+        data = bytearray(posting.encode([1]))
+        data[2] = posting.VERSION + 1
+        with self.assertRaises(ValueError):
+            posting.decode(bytes(data))
+
+    def test_parse_text(self):
+        np.testing.assert_array_equal(posting.parse_text('3|1||65536|1'), [1, 3, 65536])
+        self.assertEqual(len(posting.parse_text(' ')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 10:30
+# @File : test_query.py
+# @Project : OncoPubMinerAPI
+"""
+检索语句解析和查询计划的单元测试
+
+数据库相关的模块(PubMiner/model/dictionary)替换为空模块, 倒排表和年份列使用内存中的数据,
+查询计划的结果与在全部PMID上逐个判断的结果比较。
+"""
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ('PubMiner', 'model', 'dictionary'):
+    sys.modules.setdefault(name, mock.MagicMock())
+
+import query  # noqa: E402
+from query import Term, Year, And, Or, Not, QuerySyntaxError, parse_query, tokenize  # noqa: E402
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_grouping(self):
+        self.assertEqual(tokenize('(egfr OR kras) AND tp53'), ['(', 'egfr', 'OR', 'kras', ')', 'AND', 'tp53'])
+        self.assertEqual(tokenize('((a OR b))'), ['(', '(', 'a', 'OR', 'b', ')', ')'])
+
+    def test_parentheses_in_term(self):
+        self.assertEqual(tokenize('IL(6) AND egfr'), ['IL(6)', 'AND', 'egfr'])
+        self.assertEqual(tokenize('(IL(6) OR egfr)'), ['(', 'IL(6)', 'OR', 'egfr', ')'])
+        self.assertEqual(tokenize('(+)-catechin AND egfr'), ['(+)-catechin', 'AND', 'egfr'])
+        self.assertEqual(tokenize('(a OR (S)-ibuprofen)'), ['(', 'a', 'OR', '(S)-ibuprofen', ')'])
+
+
+class ParseQueryTest(unittest.TestCase):
+    def test_precedence(self):
+        self.assertEqual(parse_query('a OR b AND c'), Or((Term(None, 'a'), And((Term(None, 'b'), Term(None, 'c'))))))
+        self.assertEqual(parse_query('(a OR b) AND c'),
+                         And((Or((Term(None, 'a'), Term(None, 'b'))), Term(None, 'c'))))
+        self.assertEqual(parse_query('NOT a AND b'), And((Not(Term(None, 'a')), Term(None, 'b'))))
+
+    def test_not(self):
+        self.assertEqual(parse_query('a NOT b'), And((Term(None, 'a'), Not(Term(None, 'b')))))
+        self.assertEqual(parse_query('a NOT b OR c'),
+                         Or((And((Term(None, 'a'), Not(Term(None, 'b')))), Term(None, 'c'))))
+
+    def test_multi_word_term(self):
+        self.assertEqual(parse_query('lung cancer AND disease:breast cancer'),
+                         And((Term(None, 'lung cancer'), Term('disease', 'breast cancer'))))
+
+    def test_parentheses_in_term(self):
+        self.assertEqual(parse_query('IL(6)'), Term(None, 'IL(6)'))
+        self.assertEqual(parse_query('IL(6) AND egfr'), And((Term(None, 'IL(6)'), Term(None, 'egfr'))))
+        self.assertEqual(parse_query('(+)-catechin AND egfr'),
+                         And((Term(None, '(+)-catechin'), Term(None, 'egfr'))))
+
+    def test_parentheses_without_operators(self):
+        for text in ('p53 (TP53)', 'vitamin D (25-hydroxy)', 'TNF-alpha (TNFa)', '(S)-ibuprofen', '(lung cancer',
+                     'egfr )'):
+            self.assertEqual(parse_query(text), Term(None, ' '.join(word for word in text.split()
+                                                                    if word not in ('(', ')'))))
+        self.assertEqual(parse_query('( lung cancer )'), Term(None, 'lung cancer'))
+
+    def test_field_ends_term(self):
+        self.assertEqual(parse_query('gene:EGFR year:2020'), And((Term('gene', 'EGFR'), Year(2020, 2020))))
+        self.assertEqual(parse_query('egfr gene:kras'), And((Term(None, 'egfr'), Term('gene', 'kras'))))
+        self.assertEqual(parse_query('year:2015-2020 lung cancer'), And((Year(2015, 2020), Term(None, 'lung cancer'))))
+        self.assertEqual(parse_query('year:2020-2015'), Year(2015, 2020))
+
+    def test_syntax_error(self):
+        for text in ('', 'a AND', '(a OR b', 'a OR b)', 'AND a', 'gene: AND a', 'year:20x', 'NOT'):
+            with self.assertRaises(QuerySyntaxError, msg=text):
+                parse_query(text)
+
+
+class FakeColumns(object):
+    ready = True
+
+    def __init__(self, years):
+        self.years = years
+
+    def array(self, column):
+        return self.years
+
+    def get(self, column, pub_ids):
+        return self.years[np.asarray(pub_ids, dtype=np.int64)]
+
+
+class FakePlanner(query.QueryPlanner):
+    def __init__(self, postings):
+        super().__init__()
+        self.postings = postings
+
+    def sources(self, term):
+        return [('library', term.text, len(self.postings[term.text]))]
+
+
+def brute_force(node, postings, years):
+    universe = set(range(1, len(years)))
+    if isinstance(node, Term):
+        return set(postings[node.text].tolist())
+    if isinstance(node, Year):
+        return {pub_id for pub_id in universe if node.start <= years[pub_id] <= node.end}
+    if isinstance(node, Not):
+        return universe - brute_force(node.child, postings, years)
+    results = [brute_force(child, postings, years) for child in node.children]
+    return set.union(*results) if isinstance(node, Or) else set.intersection(*results)
+
+
+def random_node(rng, depth=0):
+    if depth >= 3 or rng.random() < 0.3:
+        if rng.random() < 0.2:
+            start = rng.randint(2000, 2010)
+            return Year(start, start + rng.randint(0, 4))
+        return Term(None, rng.choice('abcdef'))
+    children = tuple(random_node(rng, depth + 1) for _ in range(rng.randint(2, 3)))
+    if rng.random() < 0.5:
+        return Or(children)
+    # AND中至少保留一个肯定条件
+    return And(children[:1] + tuple(Not(child) if rng.random() < 0.3 else child for child in children[1:]))
+
+
+class QueryPlannerTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.years = np.zeros(2000, dtype=np.uint16)
+        self.years[1:] = rng.randint(2000, 2015, size=len(self.years) - 1)
+        self.postings = {text: np.unique(rng.randint(1, len(self.years), size=size)).astype(np.uint32)
+                         for text, size in zip('abcdef', (5, 50, 300, 800, 1500, 1999))}
+        patches = [mock.patch.object(query, 'pmid_columns', FakeColumns(self.years)),
+                   mock.patch.object(query, 'load_postings',
+                                     lambda kind, ids: {text: self.postings[text] for text in ids}),
+                   mock.patch.object(query, 'MATERIALIZE_RATIO', 1 << 30)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_materialize(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            node = random_node(rng)
+            expected = sorted(brute_force(node, self.postings, self.years))
+            self.assertEqual(FakePlanner(self.postings).materialize(node).tolist(), expected, msg=repr(node))
+
+    def test_match(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            node = random_node(rng)
+            candidates = np.unique(np.asarray([rng.randrange(1, len(self.years)) for _ in range(rng.randint(1, 400))],
+                                              dtype=np.uint32))
+            expected = brute_force(node, self.postings, self.years)
+            mask = FakePlanner(self.postings).match(node, candidates)
+            self.assertEqual(mask.tolist(), [pub_id in expected for pub_id in candidates.tolist()], msg=repr(node))
+
+    def test_plan_order(self):
+        planner = FakePlanner(self.postings)
+        node = And((Not(Term(None, 'a')), Term(None, 'e'), Term(None, 'b')))
+        self.assertEqual(planner.plan(node), [Term(None, 'b'), Term(None, 'e'), Not(Term(None, 'a'))])
+        with self.assertRaises(QuerySyntaxError):
+            planner.plan(And((Not(Term(None, 'a')), Not(Term(None, 'b')))))
+
+    def test_year_filter(self):
+        # year:只在候选集上过滤, 不扫描整个年份列
+        planner = FakePlanner(self.postings)
+        node = And((Year(2003, 2005), Term(None, 'f'), Not(Term(None, 'a'))))
+        self.assertEqual(planner.plan(node), [Term(None, 'f'), Year(2003, 2005), Not(Term(None, 'a'))])
+        with mock.patch.object(FakeColumns, 'array', side_effect=AssertionError('year column scanned')):
+            self.assertEqual(planner.materialize(node).tolist(), sorted(brute_force(node, self.postings, self.years)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 16:50
+# @File : test_refresher.py
+# @Project : OncoPubMinerAPI
+"""
+后台elink刷新的单元测试
+
+在本地启动http.server模拟elink, 数据库读写(save_link_sets/load_similar)替换为内存中的字典,
+检查同一PMID的刷新合并, 批量请求和worker间通过标记文件合并刷新。
+"""
+import http.server
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ('PubMiner', 'model'):
+    sys.modules.setdefault(name, mock.MagicMock())
+
+import refresher  # noqa: E402
+from eutils import EutilsClient  # noqa: E402
+
+
+class FakeElink(http.server.BaseHTTPRequestHandler):
+    """模拟elink: 每个id返回一个LinkSet, 相似文献为id+1; server.gate未打开时等待"""
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def do_POST(self):
+        params = urllib.parse.parse_qsl(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        ids = [doc_id for key, doc_id in params if key == 'id']
+        self.server.requests.append(ids)
+        self.server.gate.wait(10)
+        body = ('<eLinkResult>' + ''.join(
+            f'<LinkSet><IdList><Id>{doc_id}</Id></IdList><LinkSetDb><LinkName>pubmed_pubmed</LinkName>'
+            f'<Link><Id>{int(doc_id) + 1}</Id></Link></LinkSetDb></LinkSet>' for doc_id in ids) +
+            '</eLinkResult>').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class ElinkRefresherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingServer(('127.0.0.1', 0), FakeElink)
+        self.server.requests = []
+        self.server.gate = threading.Event()
+        self.server.gate.set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.gate.set)
+        claim_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(claim_dir.cleanup)
+        self.claim_dir = claim_dir.name
+        # {pub_id: (similarIds, timestamp)}
+        self.rows = {}
+        client = EutilsClient(f'http://127.0.0.1:{self.server.server_address[1]}/', requests_per_second=1000,
+                              backoff=0, batch_size=100)
+        patches = [mock.patch.object(refresher, 'eutils_client', client),
+                   mock.patch.object(refresher, 'save_link_sets', self.save_link_sets),
+                   mock.patch.object(refresher, 'load_similar', self.load_similar),
+                   mock.patch.object(refresher.Config, 'ELINK_CLAIM_DIR', self.claim_dir),
+                   mock.patch.object(refresher.Config, 'ELINK_WAIT_SECONDS', 5)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.refresher = refresher.ElinkRefresher()
+        self.refresher.init_app(mock.MagicMock())
+
+    def save_link_sets(self, links):
+        for pub_id, (similar_ids, _, _) in links.items():
+            self.rows[pub_id] = (similar_ids, int(time.time()))
+
+    def load_similar(self, pub_ids, since):
+        return {pub_id: self.rows[pub_id][0] for pub_id in pub_ids
+                if pub_id in self.rows and self.rows[pub_id][1] >= int(since)}
+
+    def requested_ids(self):
+        return [doc_id for ids in self.server.requests for doc_id in ids]
+
+    def test_refresh(self):
+        self.assertEqual(self.refresher.refresh(1).wait(5), ['2'])
+        self.assertEqual(self.rows[1][0], ['2'])
+        self.assertEqual(os.listdir(self.claim_dir), [])
+        self.assertEqual(self.refresher.stats(), {"pending": 0, "queued": 0})
+
+    def test_coalesce(self):
+        self.server.gate.clear()
+        first = self.refresher.refresh(1)
+        wait_until(lambda: self.server.requests)
+        # 第一个请求进行中时, 同一PMID的请求共用任务, 其他PMID合并到下一次请求
+        self.assertIs(self.refresher.refresh(1), first)
+        tasks = [self.refresher.refresh(pub_id) for pub_id in (2, 3, 3, 4)]
+        self.assertIs(tasks[1], tasks[2])
+        self.server.gate.set()
+        self.assertEqual([first.wait(5)] + [task.wait(5) for task in tasks], [['2'], ['3'], ['4'], ['4'], ['5']])
+        self.assertEqual(self.server.requests, [['1'], ['2', '3', '4']])
+
+    def test_claimed_by_other_worker(self):
+        # 其他worker正在刷新: 等待标记被删除后从数据库读取, 不再请求elink
+        open(os.path.join(self.claim_dir, '5.claim'), 'w').close()
+
+        def other_worker():
+            time.sleep(0.3)
+            self.rows[5] = (['50'], int(time.time()))
+            os.remove(os.path.join(self.claim_dir, '5.claim'))
+
+        threading.Thread(target=other_worker).start()
+        self.assertEqual(self.refresher.refresh(5).wait(5), ['50'])
+        self.assertEqual(self.requested_ids(), [])
+
+    def test_refreshed_after_request(self):
+        # 请求之后其他worker已经刷新过
+        self.rows[6] = (['60'], int(time.time()) + 1)
+        self.assertEqual(self.refresher.refresh(6).wait(5), ['60'])
+        self.assertEqual(self.requested_ids(), [])
+
+    def test_stale_rows_are_refreshed(self):
+        self.rows[6] = (['60'], int(time.time()) - 3600)
+        self.assertEqual(self.refresher.refresh(6).wait(5), ['7'])
+        self.assertEqual(self.requested_ids(), ['6'])
+
+    def test_stale_claim(self):
+        # 超过ELINK_CLAIM_SECONDS的标记视为进程已退出
+        path = os.path.join(self.claim_dir, '7.claim')
+        open(path, 'w').close()
+        os.utime(path, (time.time() - refresher.Config.ELINK_CLAIM_SECONDS - 1,) * 2)
+        self.assertEqual(self.refresher.refresh(7).wait(5), ['8'])
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
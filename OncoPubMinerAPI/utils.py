@@ -8,15 +8,42 @@ import time
 import re
 import xml.etree.cElementTree as etree
 import logging
+from collections import namedtuple
+from types import SimpleNamespace
 
-import pandas as pd
-import requests
-from flask import jsonify, request
+import gevent
+import numpy as np
+from flask import jsonify, request, Response, stream_with_context
+from gevent.lock import BoundedSemaphore
+from gevent.threadpool import ThreadPool
 from sqlalchemy import or_, desc, and_
-from Bio import Entrez
 
 from model import *
 from config import Config
+import posting
+from cache import result_cache, page_cache, sizeof
+from bitmap import cancer_bitmap
+from dictionary import match_library, sorted_library, match_symbols, dictionaries
+from suggest import suggest, SUGGEST_TYPES
+from docstore import pubmed_store, pmc_store, Projection, PASSAGE_FIELDS, FIRST_PASSAGE, project_document
+from refresher import elink_refresher
+from eutils import eutils_client
+from citation_graph import graphs as citation_graphs
+from codec import codec_pool, dumps, PoolBusy, DeadlineExceeded
+from compress import make_etag, not_modified
+from columns import pmid_columns, ColumnFilter
+from ranking import ranked_page
+from facets import compute_facets, top_counts, FACETS
+from relations import relation_matrix
+from query import parse_query, load_postings, mention_ids, QueryPlanner, QuerySyntaxError, Term
+
+# 远程查询结果读取文献内容的线程池
+hydrate_pool = ThreadPool(Config.HYDRATE_THREADS)
+# /documents的解析任务占用的codec_pool子进程数
+bulk_slots = BoundedSemaphore(Config.BULK_CODEC_JOBS)
+# 分页cursor: mode为pmid(上一页最后一篇文献的PMID, 返回PMID更小的文献)或offset(下一页在结果中的起始位置)
+Cursor = namedtuple('Cursor', ['mode', 'position'])
+CURSOR_PREFIXES = {'p': 'pmid', 'o': 'offset'}
 
 
 def get_page(page):
@@ -26,93 +53,138 @@ def get_page(page):
     except Exception as e:
         logging.warning(f'{e}')
         page = 1
-    return page
+    return max(page, 1)
 
 
-def get_limit(per_page):
-    # 判断per_page参数
+def get_limit(per_page, maximum=None):
+    # 判断per_page参数, 不小于1; maximum不为None时不超过maximum
     try:
         per_page = 100 if int(per_page) == 0 else int(per_page)
     except Exception as e:
         logging.warning(f'{e}')
         per_page = Config.per_page
-    return per_page
+    per_page = max(per_page, 1)
+    return per_page if maximum is None else min(per_page, maximum)
+
+
+def get_cursor(cursor, default_mode='offset'):
+    """
+    解析cursor参数, 格式为前缀+位置(p12345/o40), 由上一页的响应返回, 调用方不需要解析;
+    兼容旧版本返回的纯数字cursor, 按default_mode解释
+    :return: Cursor, 没有或无法解析时返回None
+    """
+    if not cursor:
+        return None
+    mode = CURSOR_PREFIXES.get(cursor[0])
+    position = cursor[1:] if mode else cursor
+    if not position.isdigit():
+        logging.warning(f'invalid cursor: {cursor}')
+        return None
+    return Cursor(mode or default_mode, int(position))
+
+
+def encode_cursor(mode, position):
+    return f'{mode[0]}{position}'
+
+
+def page_offset(page, per_page, cursor):
+    """按偏移分页的起始位置, offset cursor优先于页码"""
+    if cursor is not None and cursor.mode == 'offset':
+        return cursor.position
+    return (page - 1) * per_page
+
+
+def descending_window(pub_ids, page, per_page, cursor):
+    """
+    在升序PMID数组上按PMID倒序分页
+    :return: (PMID倒序的候选数组(视图, 不复制), 当前页在候选数组中的偏移量)
+    """
+    if cursor is not None and cursor.mode == 'pmid':
+        return pub_ids[:int(np.searchsorted(pub_ids, cursor.position))][::-1], 0
+    return pub_ids[::-1], page_offset(page, per_page, cursor)
+
+
+def split_param(value):
+    """逗号隔开的字符串或列表转换为小写的元组, 为空时返回None"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(sorted({str(item).strip().lower() for item in value if str(item).strip()})) or None
+
+
+def get_projection(params=None):
+    """
+    解析sections/fields/annotations_only参数
+        sections=title,abstract  只返回这些章节的段落(第一个段落始终返回)
+        fields=annotations       段落中只返回这些字段(PASSAGE_FIELDS), 其余字段为空值
+        annotations_only=1       等同于fields=annotations
+    :param params: 参数字典, 默认为请求的查询参数
+    :return: Projection, 不需要裁剪时返回None
+    """
+    params = request.args if params is None else params
+    sections = split_param(params.get('sections'))
+    fields = split_param(params.get('fields'))
+    if str(params.get('annotations_only', '')).lower() in ('1', 'true'):
+        fields = ('annotations',)
+    if fields is not None and not set(fields) <= set(PASSAGE_FIELDS):
+        raise ValueError(f'fields must be in {PASSAGE_FIELDS}')
+    if sections is None and fields is None:
+        return None
+    return Projection(sections=sections, fields=fields)
+
+
+def get_column_filter(params=None):
+    """
+    解析year/has_pmc/has_abstract参数
+        year=2020 或 year=2015-2020  发表年份范围
+        has_pmc=1                    只返回有PMC全文的文献
+        has_abstract=1               只返回有摘要的文献
+    :return: ColumnFilter, 不需要过滤时返回None
+    """
+    params = request.args if params is None else params
+    years = None
+    if params.get('year'):
+        match = re.match(r'^(\d{4})(?:-(\d{4}))?$', str(params.get('year')).strip())
+        if not match:
+            raise ValueError('year must be YYYY or YYYY-YYYY')
+        start, end = int(match.group(1)), int(match.group(2) or match.group(1))
+        years = (min(start, end), max(start, end))
+    has_pmc = str(params.get('has_pmc', '')).lower() in ('1', 'true')
+    has_abstract = str(params.get('has_abstract', '')).lower() in ('1', 'true')
+    if not (years or has_pmc or has_abstract):
+        return None
+    return ColumnFilter(years=years, has_pmc=has_pmc, has_abstract=has_abstract)
 
 
 def get_library(query_field):
     """根据输入的字符串获取标准库"""
-    query_field = query_field.strip()
-    if query_field.startswith('@GE@'):
-        libraries = Library.query.filter(and_(Library.label == 0,
-                                              Library.identifier == query_field[4:]))
-    elif query_field.startswith('@CA@'):
-        libraries = Library.query.filter(and_(Library.label == 1,
-                                              Library.identifier == query_field[4:]))
-    elif query_field.startswith('@DR@'):
-        libraries = Library.query.filter(and_(Library.label == 2,
-                                              Library.identifier == query_field[4:]))
-    else:
-        libraries = Library.query.filter(or_(Library.symbol.startswith(query_field),
-                                             and_(and_(Library.synonyms.like(f'%|{query_field}%')),
-                                                  Library.label.in_([0, 2])),
-                                             and_(and_(Library.synonyms.like(f'%{query_field}%')),
-                                                  Library.label == 1))).order_by(desc(Library.label))
-    return libraries
+    return match_library(query_field)
 
 
 def get_sorted_library(query_field):
     """根据匹配度排序"""
-    query_field = query_field.strip()
-    libraries_1 = Library.query.filter(Library.symbol == query_field)
-    libraries_2 = Library.query.filter(Library.synonyms.like(f'%|{query_field}|%'))
-    libraries_3 = Library.query.filter(Library.symbol.startswith(query_field))
-    libraries_4 = Library.query.filter(or_(Library.symbol.like(f'%{query_field}%'),
-                                           and_(Library.synonyms.like(f'%|{query_field}%'),
-                                                Library.label.in_([1, 2])),
-                                           and_(Library.synonyms.like(f'%{query_field}%'),
-                                                Library.label == 0)))
-    libraries = libraries_1.all()
-    for library in libraries_2.all() + libraries_3.all() + libraries_4.all():
-        if library not in libraries:
-            libraries.append(library)
-    return libraries
+    return sorted_library(query_field)
 
 
 def get_pub_by_mention(query_field):
     """根据文章涉及词获取PubMed id"""
-    query_field = query_field.strip()
-    mentions = Mention.query.filter(Mention.mention.startswith(query_field))
-    pub_ids = set()
-    mention_ids = [mention.id for mention in mentions]
-    mention_pubs = MentionPubMed.query.filter(MentionPubMed.mention_id.in_(mention_ids))
-    for mention_pub in mention_pubs:
-        pubs_ids = {int(pub_id) for pub_id in mention_pub.pubmeds.split('|') if pub_id}
-        pub_ids |= pubs_ids
-    return pub_ids
+    ids = mention_ids(query_field)
+    if not ids:
+        return posting.EMPTY
+    return posting.union(list(load_postings('mention', ids).values()))
 
 
 def get_pubmed_by_query_field(query_field):
     """通过用户输入的字符串查询PubMed Id"""
     query_field = query_field.strip()
     libraries = get_library(query_field)
-    pub_ids = set()
-    for library in libraries:
-        pub_ids |= get_pubmed_by_library(library)
-    return pub_ids
+    return posting.union([get_pubmed_by_library(library) for library in libraries])
 
 
 def get_pubmed_by_library(library):
-    """通过标准库查询PubMed Id"""
-    pub_ids = set()
-    library_pubs = LibraryPubMed.query.filter(LibraryPubMed.library_id == library.id)
-    for library_pub in library_pubs:
-        pubs_ids = library_pub.pubmeds
-        if pubs_ids.strip():
-            new_pub_ids = {int(pub_id) for pub_id in pubs_ids.strip().split('|')}
-        else:
-            new_pub_ids = set()
-        pub_ids |= new_pub_ids
-    return pub_ids
+    """通过标准库查询PubMed Id, 返回升序的PMID数组"""
+    return load_postings('library', [library.id]).get(library.id, posting.EMPTY)
 
 
 def SelectGetFilename(label):
@@ -126,6 +198,8 @@ def SelectGetFilename(label):
         filename = f'chemical{timestamp}.xlsx'
     filepath = os.path.join(Config.BASE_DIR, 'static', filename)
     if not os.path.exists(filepath):
+        # pandas只在这里使用, 导入较慢, 不在启动时加载
+        import pandas as pd
         results = db.session.query(Library.symbol, LibraryPubMed.length).filter(Library.label == label).join(
             LibraryPubMed, Library.id == LibraryPubMed.library_id).order_by(desc(LibraryPubMed.length)).all()
         results = pd.DataFrame.from_records(list(results))  # mysql查询的结果为元组，需要转换为列表
@@ -134,12 +208,53 @@ def SelectGetFilename(label):
     return filename
 
 
-def PAD_for_document(pub_med):
-    """填充/补充 document 第一个段落的infons信息"""
+def get_pad_infos(pub_meds):
+    """
+    批量查询文献的杂志影响因子和引用/被引用数量, 每张表只查询一次
+    :param pub_meds: PubMed object list
+    :return: {pub_id: (impact_factor, (cite_num, cited_num))}
+    """
+    pub_meds = [pub_med for pub_med in pub_meds if pub_med]
+    if not pub_meds:
+        return {}
+    journal_ids = list({pub_med.journal_id for pub_med in pub_meds if pub_med.journal_id})
+    impact_factors = dict(db.session.query(Journal.id, Journal.impact_factor).
+                          filter(Journal.id.in_(journal_ids)).all()) if journal_ids else {}
+    cite_cited_nums = {pubmed_id: (cite_num, cited_num) for pubmed_id, cite_num, cited_num in
+                       db.session.query(CiteCitedSimilarPubMed.pubmed_id, CiteCitedSimilarPubMed.cite_num,
+                                        CiteCitedSimilarPubMed.cited_num).
+                       filter(CiteCitedSimilarPubMed.pubmed_id.in_([pub_med.id for pub_med in pub_meds])).all()}
+    return {pub_med.id: ((impact_factors[pub_med.journal_id],) if pub_med.journal_id in impact_factors else None,
+                         cite_cited_nums.get(pub_med.id)) for pub_med in pub_meds}
+
+
+def load_pub_meds(pub_ids):
+    """
+    批量加载PubMed基本信息
+    :param pub_ids: PubMed id list
+    :return: ({pub_id: PubMed object}, {pub_id: pad_info})
+    """
+    pub_ids = [int(pub_id) for pub_id in pub_ids]
+    if not pub_ids:
+        return {}, {}
+    pub_meds = {pub_med.id: pub_med for pub_med in PubMed.query.filter(PubMed.id.in_(pub_ids)).all()}
+    return pub_meds, get_pad_infos(pub_meds.values())
+
+
+def PAD_for_document(pub_med, pad_info=None):
+    """
+    填充/补充 document 第一个段落的infons信息
+    :param pub_med: PubMed object
+    :param pad_info: get_pad_infos批量查询的结果, 为None时单独查询数据库
+    :return:
+    """
     infons = {}
-    impact_factor = db.session.query(Journal.impact_factor).filter(Journal.id == pub_med.journal_id).first()
-    cite_cited_num = db.session.query(CiteCitedSimilarPubMed.cite_num, CiteCitedSimilarPubMed.cited_num). \
-        filter(CiteCitedSimilarPubMed.pubmed_id == pub_med.id).first()
+    if pad_info is None:
+        impact_factor = db.session.query(Journal.impact_factor).filter(Journal.id == pub_med.journal_id).first()
+        cite_cited_num = db.session.query(CiteCitedSimilarPubMed.cite_num, CiteCitedSimilarPubMed.cited_num). \
+            filter(CiteCitedSimilarPubMed.pubmed_id == pub_med.id).first()
+    else:
+        impact_factor, cite_cited_num = pad_info
     # 杂志影响因子，名称，关键词
     if pub_med.pmc_id:
         infons['article_id_pmc'] = pub_med.pmc_id[3:]
@@ -151,61 +266,350 @@ def PAD_for_document(pub_med):
     return infons
 
 
-def get_document(pub_med, source='pubmed'):
+def legacy_json_path(pub_med, source='pubmed'):
+    """打包存储之前每篇文献单独保存的json文件路径"""
+    if source == 'pmc':
+        pmc_second_dir = pub_med.pmc_json_path
+        return os.path.join(Config.BioCJsonDirPATH, 'PMC', pmc_second_dir[-1], pmc_second_dir,
+                            f'{pub_med.pmc_id}.json') if pmc_second_dir else ''
+    psd = pub_med.pubmed_json_path
+    return os.path.join(Config.BioCJsonDirPATH, 'PUBMED', psd[-1], psd, f'{pub_med.id}.json') if psd else ''
+
+
+def load_legacy_document(pub_med, source='pubmed'):
+    """读取尚未迁移到打包存储的json文件, 并合并PUBMED_INFOS中的文献基本信息"""
+    json_path = legacy_json_path(pub_med, source)
+    if not (json_path and os.path.exists(json_path)):
+        return {}
+    with open(json_path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    psd = pub_med.pubmed_json_path
+    info_path = os.path.join(Config.BioCJsonDirPATH, 'PUBMED_INFOS', psd[-1], psd, f'{pub_med.id}.json') \
+        if psd else ''
+    if document and info_path and os.path.exists(info_path):
+        with open(info_path, 'r', encoding='utf-8') as f:
+            document['passages'][0]['infons'].update(json.load(f))
+    return document
+
+
+def has_pmc_document(pub_med):
+    """该文献是否有对应的PMC文献"""
+    if not (pub_med.pmc_id and pub_med.pmc_json_path):
+        return False
+    return pmc_store.contains(pub_med.pmc_id) or os.path.exists(legacy_json_path(pub_med, 'pmc'))
+
+
+def store_version(store, doc_id, pub_med, source):
+    """文献在打包存储中的位置, 不在打包存储中时为旧的json文件的修改时间和大小, 都不存在时返回None"""
+    version = store.version(doc_id)
+    if version is None:
+        try:
+            stat = os.stat(legacy_json_path(pub_med, source))
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+    return version
+
+
+def document_version(pub_med):
+    """文献内容的版本(PubMed文献和PMC全文), 用于计算ETag, 文献重新写入后改变"""
+    return (store_version(pubmed_store, pub_med.id, pub_med, 'pubmed'),
+            store_version(pmc_store, pub_med.pmc_id, pub_med, 'pmc') if pub_med.pmc_id else None)
+
+
+def document_etag(pub_med, infons, projection=None):
+    return make_etag(pub_med.id, document_version(pub_med), sorted(infons.items()), projection)
+
+
+def read_document(pub_med, source='pubmed', projection=None):
+    """
+    读取文献BioC Json, 优先读取打包存储, 不存在时回退到旧的json文件, 不包含影响因子/引用数等动态字段
+    不访问数据库, 可以在codec_pool中执行
+    :param pub_med: PubMed object
+    :param source: pubmed/pmc
+    :param projection: Projection, 打包存储中只解析选中的段落
+    :return: 文献不存在或读取失败时返回空字典
+    """
+    if not pub_med:
+        return {}
+    if not (source == 'pmc' and pub_med.pmc_id and pub_med.pmc_json_path):
+        source = 'pubmed'
+    try:
+        if source == 'pmc':
+            document = pmc_store.get(pub_med.pmc_id, projection)
+            if document:
+                # PMC文献合并PubMed文献的基本信息
+                pub_document = pubmed_store.get(pub_med.id, FIRST_PASSAGE)
+                if pub_document:
+                    document['passages'][0]['infons'].update(pub_document['passages'][0]['infons'])
+        else:
+            document = pubmed_store.get(pub_med.id, projection)
+        if document is None:
+            document = project_document(load_legacy_document(pub_med, source), projection)
+        if document:
+            document['passages'][0]['infons'].update({"hasPMC": has_pmc_document(pub_med)})
+        return document
+    except Exception as e:
+        logging.error(f"get document error: {str(e)}")
+        return {}
+
+
+def get_document(pub_med, source='pubmed', pad_info=None, projection=None):
     """
     获取文献BioC Json
     :param pub_med: PubMed object
     :param source: pubmed/pmc
+    :param pad_info: get_pad_infos批量查询的结果
+    :param projection: Projection
     :return:
     """
-    document = {}
-    if pub_med:
-        if not (source == 'pmc' and pub_med.pmc_id and pub_med.pmc_json_path):
-            source = 'pubmed'
-            try:
-                # PubMed文献id
-                pid = pub_med.id
-                psd = pub_med.pubmed_json_path
-                pmc_second_dir = pub_med.pmc_json_path
-                # 文献对应的PubMed文献的路径
-                pub_json_path = os.path.join(Config.BioCJsonDirPATH, 'PUBMED', psd[-1], psd, f'{pid}.json')
-                # 文献对应的PMC文献的路径
-                pmc_json_path = os.path.join(Config.BioCJsonDirPATH, 'PMC', pmc_second_dir[-1], pmc_second_dir,
-                                             f'{pub_med.pmc_id}.json') if pmc_second_dir else ''
-                json_path = pub_json_path if source == 'pubmed' else pmc_json_path
-                # 该文献是否有对应的PMC文献
-                hasPMC = True if os.path.exists(pmc_json_path) else False
-                if json_path and os.path.exists(json_path):
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        document = json.load(f)
-                    if document:
-                        # 获取文献基本信息
-                        info_path = os.path.join(Config.BioCJsonDirPATH, 'PUBMED_INFOS', psd[-1], psd, f'{pid}.json')
-                        if os.path.exists(info_path):
-                            with open(info_path, 'r', encoding='utf-8') as f:
-                                infos = json.load(f)
-                            document['passages'][0]['infons'].update(infos)
-                        document['passages'][0]['infons'].update({"hasPMC": hasPMC})
-            except Exception as e:
-                return logging.error(f"get document error: {str(e)}")
+    document = read_document(pub_med, source, projection)
     if document:
-        document['passages'][0]['infons'].update(PAD_for_document(pub_med))
+        document['passages'][0]['infons'].update(PAD_for_document(pub_med, pad_info))
     return document
 
 
-def get_document_by_pub_ids(pub_ids, page, per_page, count=None):
-    """获取根据 PubMed id PubMed BioC 数据"""
-    document_list = []
-    non_content = []
-    for pub_id in pub_ids:
-        pub_med = PubMed.query.filter(PubMed.id == pub_id).first()
-        document = {}
-        if pub_med:
-            document = get_document(pub_med)
+def read_source_document(pub_med, source='pubmed', projection=None):
+    """source为pmc时优先读取PMC全文, 没有PMC全文时读取PubMed文献"""
+    document = {}
+    if source == 'pmc' and pub_med.pmc_json_path:
+        document = read_document(pub_med, 'pmc', projection)
+    if not document and pub_med.pubmed_json_path:
+        document = read_document(pub_med, projection=projection)
+    return document
+
+
+def build_document_response(fields, infons, projection=None):
+    """
+    在codec_pool的子进程中执行: 读取/解析全文, 合并动态字段后序列化为响应JSON
+    :param fields: PubMed对象中读取文献需要的字段
+    :param infons: 动态字段
+    :param projection: Projection
+    :return: bytes, 文献不存在时返回None
+    """
+    document = read_source_document(SimpleNamespace(**fields), 'pmc', projection)
+    if not document:
+        return None
+    document['passages'][0]['infons'].update(infons)
+    return dumps({"code": 200, "msg": "Request success", "success": True, "data": document})
+
+
+def document_response(pub_med, projection=None, infons=None):
+    """
+    /id 的响应内容, 解析/序列化全文在codec_pool中执行, 不阻塞gevent事件循环
+    :param projection: Projection
+    :param infons: 已查询的动态字段, 为None时查询数据库
+    :return: 响应JSON(bytes), 文献不存在时返回None
+    """
+    # 动态字段需要查询数据库, 在当前进程中获取
+    infons = infons if infons is not None else PAD_for_document(pub_med)
+    return codec_pool.run(build_document_response, document_fields(pub_med), infons, projection)
+
+
+def document_fields(pub_med):
+    """PubMed对象中读取文献需要的字段, 传给codec_pool的子进程"""
+    return {key: getattr(pub_med, key) for key in ('id', 'pmc_id', 'pmc_json_path', 'pubmed_json_path')}
+
+
+def bulk_error(doc_id, error='not found'):
+    return dumps({"id": doc_id, "error": error}) + b'\n'
+
+
+def build_document_lines(items, source, projection):
+    """
+    在codec_pool的子进程中执行: 读取一批文献(只解析projection选中的段落), 序列化为NDJSON的行
+    :param items: [(请求的id, document_fields或None, 动态字段)]
+    :return: [bytes]
+    """
+    lines = []
+    for doc_id, pub_fields, infons in items:
+        document = read_source_document(SimpleNamespace(**pub_fields), source, projection) if pub_fields else None
         if document:
-            document_list.append(document)
+            document['passages'][0]['infons'].update(infons)
+            lines.append(dumps(document) + b'\n')
         else:
-            non_content.append({'id': pub_id, 'nocontent': True})
+            lines.append(bulk_error(doc_id))
+    return lines
+
+
+def read_raw_lines(items, pad_infos, projection):
+    """打包存储中的PubMed文献直接拼接字节, 在hydrate_pool中并发pread"""
+    def load(item):
+        doc_id, pub_med = item
+        chunks = document_chunks(pub_med, pad_infos.get(pub_med.id), True, projection) if pub_med else None
+        return b''.join(chunks) + b'\n' if chunks else bulk_error(doc_id)
+    return list(hydrate_pool.imap(load, items))
+
+
+def run_bulk_codec(func, *args):
+    """等待bulk_slots后在codec_pool中执行, 所有/documents请求合计最多占用BULK_CODEC_JOBS个子进程"""
+    if not bulk_slots.acquire(timeout=Config.BULK_DEADLINE):
+        raise PoolBusy(f'more than {Config.BULK_CODEC_JOBS} bulk tasks running')
+    try:
+        return codec_pool.run(func, *args, deadline=Config.BULK_DEADLINE)
+    finally:
+        bulk_slots.release()
+
+
+def read_codec_lines(items, source, projection):
+    """分成每BULK_CODEC_BATCH篇一个任务, 在codec_pool的子进程中并行解析"""
+    size = Config.BULK_CODEC_BATCH
+    parts = [items[i:i + size] for i in range(0, len(items), size)]
+    jobs = [gevent.spawn(run_bulk_codec, build_document_lines, part, source, projection) for part in parts]
+    lines = []
+    for part, job in zip(parts, jobs):
+        try:
+            lines.extend(job.get())
+        except (PoolBusy, DeadlineExceeded) as e:
+            # 这一批返回错误, 调用方可以只重试这些id
+            logging.warning(f'bulk documents error: {e}')
+            lines.extend(bulk_error(doc_id, 'busy') for doc_id, _, _ in part)
+    return lines
+
+
+def resolve_bulk_ids(doc_ids):
+    """
+    PMID/PMCID批量转换为PMID
+    :param doc_ids: 规范化后的id(数字或PMC+数字)
+    :return: {请求的id: PMID}
+    """
+    resolved = {doc_id: int(doc_id) for doc_id in doc_ids if doc_id.isdigit()}
+    pmc_ids = [doc_id for doc_id in doc_ids if re.match(r'^PMC\d+$', doc_id)]
+    if pmc_ids:
+        resolved.update(db.session.query(PubMed.pmc_id, PubMed.id).filter(PubMed.pmc_id.in_(pmc_ids)).all())
+    return resolved
+
+
+def bulk_documents(doc_ids, source='pubmed', projection=None):
+    """
+    批量获取文献, 返回NDJSON行的迭代器, 每个id一行, 顺序与doc_ids相同
+    不存在的文献返回 {"id": ..., "error": "not found"}, 繁忙或超时返回 {"id": ..., "error": "busy"}
+    输出过程中出错时最后一行为 {"error": ...}(没有id), 之后的id不再返回
+        每BULK_BATCH_SIZE个id查询一次数据库
+        PubMed文献直接拼接打包存储中的字节(按projection裁剪); PMC文献需要合并PubMed的基本信息,
+        在codec_pool的子进程中解析
+        预读: 输出当前一批的同时, 下一批已在后台greenlet中读取
+    :param doc_ids: 规范化后的id列表
+    :param source: pubmed/pmc
+    :param projection: Projection
+    """
+    raw = source == 'pubmed'
+
+    def read(batch):
+        # 数据库查询需要应用上下文, 在当前greenlet中执行
+        resolved = resolve_bulk_ids(batch)
+        pub_meds, pad_infos = load_pub_meds(set(resolved.values()))
+        items = [(doc_id, pub_meds.get(resolved.get(doc_id))) for doc_id in batch]
+        if raw:
+            return gevent.spawn(read_raw_lines, items, pad_infos, projection)
+        items = [(doc_id, document_fields(pub_med), PAD_for_document(pub_med, pad_infos.get(pub_med.id)))
+                 if pub_med else (doc_id, None, None) for doc_id, pub_med in items]
+        return gevent.spawn(read_codec_lines, items, source, projection)
+
+    def generate():
+        pending = None
+        try:
+            for start in range(0, len(doc_ids), Config.BULK_BATCH_SIZE):
+                job = read(doc_ids[start:start + Config.BULK_BATCH_SIZE])
+                if pending is not None:
+                    for line in pending.get():
+                        yield line
+                pending = job
+            if pending is not None:
+                for line in pending.get():
+                    yield line
+        except Exception as e:
+            # 响应头已经发出, 最后一行说明后面的id没有返回
+            logging.error(f'bulk documents error: {e}')
+            yield dumps({"error": f'{e}'}) + b'\n'
+    return generate()
+
+
+def document_chunks(pub_med, pad_info=None, pread=False, projection=None):
+    """
+    单篇文献BioC Json的字节片段, 打包存储中的记录直接拼接动态infons, 不解析JSON
+    :param pread: 通过pread读取打包存储(在线程池中并发读取时使用)
+    :param projection: Projection, 按章节/字段裁剪
+    :return: [bytes], 文献不存在时返回None
+    """
+    if pub_med:
+        infons = PAD_for_document(pub_med, pad_info)
+        infons["hasPMC"] = has_pmc_document(pub_med)
+        chunks = pubmed_store.get_chunks(pub_med.id, infons, pread, projection)
+        if chunks is not None:
+            return chunks
+    document = get_document(pub_med, pad_info=pad_info, projection=projection)
+    return [json.dumps(document).encode('utf-8')] if document else None
+
+
+def page_etag(data, pub_ids, pub_meds, pad_infos, projection=None):
+    """文献列表的ETag: 响应字段, 裁剪方式和每篇文献的版本/动态字段, 不读取文献内容"""
+    versions = [document_etag(pub_meds[pub_id], PAD_for_document(pub_meds[pub_id], pad_infos.get(pub_id)))
+                if pub_id in pub_meds else pub_id for pub_id in pub_ids]
+    return make_etag(data, projection, versions)
+
+
+class StreamError(bytes):
+    """流式响应输出过程中出错时的结尾, 包含这个片段的响应不缓存"""
+
+
+def stream_documents(data, documents, etag=None):
+    """
+    以chunked方式返回文献列表: 先输出除data以外的字段, 再逐篇输出文献,
+    内存占用只与单篇文献的大小有关, 与每页文献数无关
+    第一篇文献在返回响应前读取, 读取出错时由调用方返回错误;
+    之后读取出错时结束data数组并添加error字段, 返回的仍然是完整的JSON
+    :param data: 响应字段
+    :param documents: 可迭代对象, 每个元素为一篇文献JSON的字节片段列表
+    :param etag: 请求的If-None-Match匹配时返回304, documents不会被读取
+    """
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    fields = json.dumps({key: value for key, value in data.items() if key != 'data'})
+    head = fields[:-1] + (', ' if len(fields) > 2 else '') + '"data": ['
+    documents = iter(documents)
+    first = next(documents, None)
+
+    def generate():
+        yield head.encode('utf-8')
+        if first is None:
+            yield b']}'
+            return
+        for chunk in first:
+            yield chunk
+        try:
+            # 每篇文献的字节片段在documents中读取完成后才输出, 出错时不会输出半篇
+            for chunks in documents:
+                yield b','
+                for chunk in chunks:
+                    yield chunk
+        except Exception as e:
+            logging.error(f'stream documents error: {e}')
+            yield StreamError(b'], "error": ' + json.dumps(f'{e}').encode('utf-8') + b'}')
+            return
+        yield b']}'
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def get_document_by_pub_ids(pub_ids, page, per_page, count=None, has_more=None, cursor=None, projection=None):
+    """
+    获取根据 PubMed id PubMed BioC 数据, 没有BioC Json的文献不返回
+    :param has_more: 是否有下一页, 为None时根据page和count计算
+    :param cursor: 下一页的cursor(encode_cursor)
+    :param projection: Projection
+    """
+    pub_ids = [int(pub_id) for pub_id in pub_ids]
+    pub_meds, pad_infos = load_pub_meds(pub_ids)
+
+    def documents():
+        for pub_id in pub_ids:
+            chunks = document_chunks(pub_meds.get(pub_id), pad_infos.get(pub_id), projection=projection)
+            if chunks:
+                yield chunks
 
     count = count if count else len(pub_ids)
     data = {
@@ -216,115 +620,215 @@ def get_document_by_pub_ids(pub_ids, page, per_page, count=None):
         "next": page + 1 if page * per_page < count else None,
         "count": count,
         "limit": 0 if per_page == 1000 else per_page,
-        "data": document_list
     }
-    return data
+    if has_more is not None:
+        data.update({"next": page + 1 if has_more else None, "cursor": cursor if has_more else None})
+    return stream_documents(data, documents(), page_etag(data, pub_ids, pub_meds, pad_infos, projection))
 
 
-def get_document_by_query_field(pub_ids, page, per_page, is_cancer):
-    """获取PubMed BioC 数据"""
+def get_document_by_query_field(pub_ids, page, per_page, is_cancer, cursor=None, projection=None, column_filter=None,
+                                sort=None, entity=None):
+    """
+    获取PubMed BioC 数据, 直接在升序PMID数组上按PMID倒序分页
+    :param pub_ids: 升序的PMID数组
+    :param page: 页码, 没有cursor时按 (page-1)*per_page 偏移
+    :param per_page: 每页数量
+    :param is_cancer: cancer/all
+    :param cursor: Cursor, pmid时返回PMID小于cursor的下一页(指定sort时忽略), offset时从该位置开始;
+                   返回的cursor不指定sort时为pmid, 否则为offset
+    :param projection: Projection
+    :param column_filter: ColumnFilter, 在PMID列上过滤
+    :param sort: year/cited/if, 在PMID列上按年份/被引用数/影响因子倒序取当前页
+    :param entity: (library/mention, id), 单个实体的检索, 排序时优先使用预排序结果
+    :return:
+    """
+    data = {
+        "code": 200,
+        "msg": "Request success",
+        "success": True,
+        "page": page,
+        "next": None,
+        "count": 0,
+        "limit": per_page,
+        "type": 2,
+        "data": []
+    }
     if len(pub_ids) == 0:
-        data = {
-            "code": 200,
-            "msg": "Request success",
-            "success": True,
-            "page": page,
-            "next": None,
-            "count": 0,
-            "limit": per_page,
-            "type": 2,
-            "data": []
-        }
-        return data
-    if is_cancer == 'cancer':
-        pub_med_list = PubMed.query.filter(and_(PubMed.id.in_(pub_ids), PubMed.is_cancer == 1)) \
-            .order_by(desc(PubMed.id)).paginate(1, per_page=per_page, error_out=False)
+        return jsonify(data)
+    candidates, offset = descending_window(pub_ids, page, per_page, cursor)
+    next_cursor = None
+    if column_filter is not None or sort:
+        page_ids, has_more, next_cursor, count = select_column_page(pub_ids, page, per_page, is_cancer, cursor,
+                                                                    column_filter, sort, entity)
+        pub_meds, pad_infos = load_pub_meds(page_ids)
+    elif is_cancer == 'cancer' and not cancer_bitmap.ready:
+        # 癌症文献位图尚未生成时回退到数据库过滤
+        count = len(pub_ids)
+        pub_meds, has_more = get_cancer_pub_meds(candidates, offset, per_page)
+        page_ids = [pub_med.id for pub_med in pub_meds]
+        pub_meds = {pub_med.id: pub_med for pub_med in pub_meds}
+        pad_infos = get_pad_infos(pub_meds.values())
     else:
-        pub_med_list = PubMed.query.filter(PubMed.id.in_(pub_ids)) \
-            .order_by(desc(PubMed.id)).paginate(1, per_page=per_page, error_out=False)
-    count = pub_med_list.total
-    document_list = []
-    for pub_med in pub_med_list.items:
-        document = get_document(pub_med)
-        if document:
-            document_list.append(document)
+        if is_cancer == 'cancer':
+            # 在内存中用癌症文献位图过滤, 只有当前页的PMID会发送到数据库
+            count = cancer_bitmap.count(pub_ids)
+            candidates = cancer_bitmap.filter(candidates)
         else:
-            document_list.append({'id': pub_med.id, 'nocontent': True})
-    if document_list:
-        data = {
-            "code": 200,
-            "msg": "Request success",
-            "success": True,
-            "page": page,
-            "next": page + 1 if page * per_page < count else None,
+            count = len(pub_ids)
+        page_ids = candidates[offset:offset + per_page].tolist()
+        has_more = offset + per_page < len(candidates)
+        pub_meds, pad_infos = load_pub_meds(page_ids)
+
+    def documents():
+        for pub_id in page_ids:
+            chunks = document_chunks(pub_meds.get(pub_id), pad_infos.get(pub_id), projection=projection)
+            yield chunks if chunks else [json.dumps({'id': pub_id, 'nocontent': True}).encode('utf-8')]
+
+    if page_ids:
+        if next_cursor is None:
+            next_cursor = encode_cursor('pmid', page_ids[-1])
+        data.update({
+            "next": page + 1 if has_more else None,
+            "cursor": next_cursor if has_more else None,
             "count": count,
-            "limit": per_page,
-            "type": 2,
-            "data": document_list
-        }
-    else:
-        data = {
-            "code": 200,
-            "msg": "Request success",
-            "success": True,
-            "page": page,
-            "next": None,
-            "count": 0,
-            "limit": per_page,
-            "type": 2,
-            "data": []
-        }
-    return data
+        })
+    return stream_documents(data, documents(), page_etag(data, page_ids, pub_meds, pad_infos, projection))
+
+
+def filter_cancer(pub_ids):
+    """保留癌症文献, 顺序不变"""
+    if cancer_bitmap.ready:
+        return cancer_bitmap.filter(pub_ids)
+    return pub_ids[pmid_columns.get('is_cancer', pub_ids) != 0]
+
+
+def select_column_page(pub_ids, page, per_page, is_cancer, cursor=None, column_filter=None, sort=None, entity=None):
+    """
+    在PMID列上过滤/排序后选出当前页, 不访问数据库
+    :param entity: (library/mention, id), 单个实体的检索按sort排序时优先从预排序结果中取当前页
+    :return: (当前页的PMID列表, 是否有下一页, 下一页的cursor(encode_cursor), 过滤后的文献总数)
+    """
+    offset = page_offset(page, per_page, cursor)
+    if sort and column_filter is None and entity is not None:
+        page_ids = ranked_page(entity[0], entity[1], len(pub_ids), sort, offset, per_page,
+                               filter_cancer if is_cancer == 'cancer' else None)
+        if page_ids is not None:
+            count = len(pub_ids)
+            if is_cancer == 'cancer':
+                count = cancer_bitmap.count(pub_ids) if cancer_bitmap.ready else len(filter_cancer(pub_ids))
+            return page_ids.tolist(), offset + per_page < count, encode_cursor('offset', offset + per_page), count
+    if is_cancer == 'cancer':
+        pub_ids = filter_cancer(pub_ids)
+    if column_filter is not None:
+        pub_ids = pmid_columns.filter(pub_ids, column_filter)
+    if sort:
+        page_ids = pmid_columns.top(pub_ids, sort, offset, per_page).tolist()
+        return page_ids, offset + per_page < len(pub_ids), encode_cursor('offset', offset + per_page), len(pub_ids)
+    candidates, offset = descending_window(pub_ids, page, per_page, cursor)
+    page_ids = candidates[offset:offset + per_page].tolist()
+    next_cursor = encode_cursor('pmid', page_ids[-1]) if page_ids else None
+    return page_ids, offset + per_page < len(candidates), next_cursor, len(pub_ids)
+
+
+def get_cancer_pub_meds(candidates, offset, per_page):
+    """
+    按PMID倒序依次取一页大小的候选PMID到数据库过滤癌症文献, 直到凑满一页
+    :param candidates: PMID倒序的候选数组
+    :param offset: 需要跳过的癌症文献数量
+    :param per_page: 每页数量
+    :return: (PubMed object list, 是否还有下一页)
+    """
+    pub_meds, skipped, index = [], 0, 0
+    while index < len(candidates):
+        window = candidates[index:index + per_page].tolist()
+        index += len(window)
+        rows = PubMed.query.filter(and_(PubMed.id.in_(window), PubMed.is_cancer == 1)) \
+            .order_by(desc(PubMed.id)).all()
+        if skipped < offset:
+            skip = min(offset - skipped, len(rows))
+            rows, skipped = rows[skip:], skipped + skip
+        pub_meds.extend(rows)
+        if len(pub_meds) >= per_page:
+            # 当前窗口剩余的癌症文献或后续候选文献都说明还有下一页
+            return pub_meds[:per_page], len(pub_meds) > per_page or index < len(candidates)
+    return pub_meds, False
+
+
+def get_correlation_pub_ids(pm_id, t='cited_by'):
+    """
+    相关文献PMID数组
+    引用/被引用文献优先从引用关系图读取(mmap视图), 关系图中没有该文献时回退到数据库, 两种方式都按PMID倒序(新的文献在前);
+    相似文献按elink返回的相关度排列
+    :param t: cited_by/ref/similar
+    """
+    if t == 'similar':
+        correlation = db.session.query(CiteCitedSimilarPubMed.similar, CiteCitedSimilarPubMed.timestamp). \
+            filter(CiteCitedSimilarPubMed.pubmed_id == pm_id).first()
+        if not correlation or not correlation[1]:
+            # 从未获取过相似文献时等待后台刷新完成
+            similar_ids = elink_refresher.refresh(pm_id).wait(Config.ELINK_WAIT_SECONDS) or []
+        else:
+            # 超过刷新周期时先返回已有数据, 由后台刷新
+            if correlation[1] < int(time.time()) - Config.SIMILAR_REFRESH_SECONDS:
+                elink_refresher.refresh(pm_id)
+            similar_ids = correlation[0].split('|') if correlation[0] else []
+        return np.array([int(pid) for pid in similar_ids if pid], dtype=np.int64)
+    pub_ids = citation_graphs[t].get(pm_id)
+    if pub_ids is not None:
+        # 关系图中按PMID升序保存
+        return pub_ids[::-1]
+    field = CiteCitedSimilarPubMed.cited if t == 'cited_by' else CiteCitedSimilarPubMed.cite
+    correlation = db.session.query(field).filter(CiteCitedSimilarPubMed.pubmed_id == pm_id).first()
+    pub_ids = {int(pid) for pid in correlation[0].split('|') if pid.strip().isdigit()} \
+        if correlation and correlation[0] else set()
+    return np.array(sorted(pub_ids, reverse=True), dtype=np.int64)
+
+
+def sort_correlation_pub_ids(pub_ids, sort):
+    """
+    按年份或杂志影响因子倒序排列(相同时PMID倒序), 没有基本信息的文献排在最后
+    :param sort: year/if
+    """
+    if pmid_columns.ready:
+        return pmid_columns.sort(pub_ids, sort)
+    keys = {}
+    field = PubMed.year if sort == 'year' else Journal.impact_factor
+    for i in range(0, len(pub_ids), 10000):
+        chunk = pub_ids[i:i + 10000].tolist()
+        keys.update(db.session.query(PubMed.id, field).outerjoin(Journal, Journal.id == PubMed.journal_id).
+                    filter(PubMed.id.in_(chunk)).all())
+    values = np.array([keys.get(pub_id) or 0 for pub_id in pub_ids.tolist()], dtype=np.float64)
+    values[np.array([pub_id not in keys for pub_id in pub_ids.tolist()], dtype=bool)] = -1
+    return pub_ids[np.lexsort((-pub_ids.astype(np.int64), -values))]
 
 
 def search_correlation_pub_med(t='cited_by'):
+    """
+    引用/被引用/相似文献分页
+    :param t: cited_by/ref/similar
+    参数 p/l 按页码偏移分页, cursor为上一页返回的offset cursor(优先于p), sort为year/if时按年份/影响因子倒序
+    """
     pm_id = request.args.get("q")
-    page = request.args.get("p", 1)
-    per_page = request.args.get("l", Config.per_page)
-    # 判断page参数
-    try:
-        page = int(page)
-    except Exception as e:
-        logging.warning(f'{e}')
-        page = 1
-    # 判断per_page参数
-    try:
-        per_page = 100 if int(per_page) == 0 else int(per_page)
-    except Exception as e:
-        logging.warning(f'{e}')
-        per_page = Config.per_page
-    if not pm_id:
+    page = get_page(request.args.get("p", 1))
+    per_page = get_limit(request.args.get("l", Config.per_page))
+    cursor = get_cursor(request.args.get("cursor"))
+    sort = request.args.get("sort")
+    if not pm_id or not pm_id.strip().isdigit() or (sort and sort not in Config.CORRELATION_SORTS):
         return badRequest()
-    if t == 'similar':
-        correlation = db.session.query(CiteCitedSimilarPubMed.similar). \
-            filter(and_(CiteCitedSimilarPubMed.pubmed_id == int(pm_id),
-                        CiteCitedSimilarPubMed.timestamp > int(time.time()) - 2592000)).first()
-        if not correlation:
-            pub_ids, refIds, citedIds = eutilsToXmlSimilarRef(str(pm_id))
-            citeCitedSimilar = CiteCitedSimilarPubMed.query.filter_by(pubmed_id=int(pm_id))
-            if citeCitedSimilar:
-                citeCitedSimilar.update({"cite": '|'.join(refIds), "cited": '|'.join(citedIds),
-                                         "cite_num": len(refIds), "cited_num": len(citedIds),
-                                         "similar": '|'.join(pub_ids), "timestamp": int(time.time())})
-            else:
-                citeCitedSimilar = CiteCitedSimilarPubMed(pubmed_id=int(pm_id), cite='|'.join(refIds),
-                                                          cited='|'.join(citedIds), cite_num=len(refIds),
-                                                          cited_num=len(citedIds), similar='|'.join(pub_ids),
-                                                          timestamp=int(time.time()))
-                db.session.add(citeCitedSimilar)
-
-            db.session.commit()
-        else:
-            pub_ids = [int(pid) for pid in correlation[0].split('|') if pid] if correlation and correlation[0] else []
+    try:
+        projection = get_projection()
+    except ValueError as e:
+        return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
+    pm_id = int(pm_id)
+    if sort:
+        # 排序结果缓存, 翻页时不重复查询数据库
+        key = ('correlation', t, pm_id, sort)
+        pub_ids = result_cache.get(key)
+        if pub_ids is None:
+            pub_ids = sort_correlation_pub_ids(get_correlation_pub_ids(pm_id, t), sort)
+            result_cache.put(key, pub_ids, size=sizeof(pub_ids))
     else:
-        if t == 'cited_by':
-            correlation = db.session.query(CiteCitedSimilarPubMed.cited). \
-                filter(CiteCitedSimilarPubMed.pubmed_id == int(pm_id)).first()
-        else:
-            correlation = db.session.query(CiteCitedSimilarPubMed.cite). \
-                filter(CiteCitedSimilarPubMed.pubmed_id == int(pm_id)).first()
-        # 获取相关文献
-        pub_ids = [int(pid) for pid in correlation[0].split('|') if pid] if correlation and correlation[0] else []
+        pub_ids = get_correlation_pub_ids(pm_id, t)
 
     if len(pub_ids) == 0:
         data = {
@@ -339,32 +843,58 @@ def search_correlation_pub_med(t='cited_by'):
             "data": []
         }
         return jsonify(data)
-    data = get_document_by_pub_ids(pub_ids[:per_page], page, per_page, count=len(pub_ids))
+    offset = page_offset(page, per_page, cursor)
+    has_more = offset + per_page < len(pub_ids)
+    return get_document_by_pub_ids(pub_ids[offset:offset + per_page].tolist(), page, per_page, count=len(pub_ids),
+                                   has_more=has_more, cursor=encode_cursor('offset', offset + per_page),
+                                   projection=projection)
 
-    return jsonify(data)
+
+def hydrate_documents(pub_ids, limit, projection=None):
+    """
+    按顺序从候选PMID中取limit篇本地有BioC Json的文献:
+        1. 用打包存储的索引批量过滤本地不存在的PMID, 不访问数据库和文件系统
+        2. 剩余的PMID一次查询基本信息
+        3. 文献内容在线程池中并发读取(pread读取磁盘期间释放GIL), 并发数为HYDRATE_THREADS
+    打包存储尚未生成(还没有执行pack_json_documents)时不过滤, 逐个检查旧的json文件
+    :param pub_ids: 候选PMID列表
+    :param limit: 文献数量
+    :param projection: Projection
+    :return: ([文献JSON的字节片段列表], 使用的候选PMID数量)
+    """
+    positions = np.arange(len(pub_ids))
+    if pubmed_store.ready:
+        positions = positions[pubmed_store.contains_many(pub_ids)]
+    documents, consumed, index = [], 0, 0
+    # 批量读取还差的文献数量, 存在于打包存储但数据库中没有基本信息的文献很少, 通常一轮即可填满一页
+    while len(documents) < limit and index < len(positions):
+        batch = positions[index:index + limit - len(documents)].tolist()
+        index += len(batch)
+        pub_meds, pad_infos = load_pub_meds([pub_ids[position] for position in batch])
+
+        def load(position):
+            pub_id = pub_ids[position]
+            # pad_info已批量查询, 线程中不访问数据库
+            return document_chunks(pub_meds[pub_id], pad_infos.get(pub_id), True, projection) \
+                if pub_id in pub_meds else None
+
+        for position, chunks in zip(batch, hydrate_pool.imap(load, batch)):
+            if chunks:
+                documents.append(chunks)
+                consumed = position + 1
+    # 没有填满一页时候选PMID已全部使用
+    return documents, consumed if len(documents) >= limit else len(pub_ids)
 
 
-def extract_pub_med_from_remote(query, restart, page, per_page):
+def extract_pub_med_from_remote(query, restart, page, per_page, projection=None):
     try:
-        query_url = f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?term={query}&' \
-                    f'retstart={restart}&retmax=1000&sort='
-        resp = requests.get(query_url)
-        root = etree.fromstring(resp.text)
+        root = etree.fromstring(eutils_client.esearch('pubmed', query, retstart=restart, retmax=1000))
         pub_ids = [int(Id.text) for Id in root.findall('.IdList/Id')]
         count = int(root.find('./Count').text)
     except Exception as e:
         return jsonify({"code": 500, "msg": f"PubMed Remote access error: {e}", "success": False, "data": {}})
-    document_list = []
-    non_content_num = 0
-    for pub_id in pub_ids:
-        document = get_document(PubMed.query.filter(PubMed.id == pub_id).first())
-        if document:
-            document_list.append(document)
-            if len(document_list) == per_page:
-                break
-        else:
-            non_content_num += 1
-    next_restart = restart+per_page+non_content_num
+    documents, consumed = hydrate_documents(pub_ids, per_page, projection)
+    next_restart = restart + consumed
     data = {
         "code": 200,
         "msg": "Request success",
@@ -373,20 +903,111 @@ def extract_pub_med_from_remote(query, restart, page, per_page):
         "next": page + 1 if next_restart < count else None,
         "count": count,
         "limit": 0 if per_page == 1000 else per_page,
-        "data": document_list,
         "restart": next_restart
     }
-    return jsonify(data)
+    return stream_documents(data, documents)
 
 
-def extract_pub_med_by_id(query, page, per_page):
+def extract_pub_med_by_id(query, page, per_page, projection=None):
     if re.search(r'^\d+$', query.replace(" ", "")):
         pub_ids = {int(pm_id) for pm_id in query.split() if re.match(r'^\d+$', pm_id)}
     else:
         pmc_ids = {f"PMC" + re.search(r'\d+', pmc).group() for pmc in query.split() if re.search(r'\d+', pmc)}
         pub_ids = {pub.id for pub in PubMed.query.filter(PubMed.pmc_id.in_(pmc_ids)).all()}
-    data = get_document_by_pub_ids(pub_ids, page, per_page)
-    return jsonify(data)
+    return get_document_by_pub_ids(pub_ids, page, per_page, projection=projection)
+
+
+def normalize_query(query):
+    """去掉多余空格, 作为缓存key"""
+    return ' '.join(query.split())
+
+
+def resolve_query(query, by_type='library'):
+    """
+    解析查询语句, 结果缓存在result_cache中
+    :param query: 规范化后的查询语句
+    :param by_type: library/mention
+    :return: (升序PMID数组, 需要消歧的标准库列表), 单个词匹配到多个标准库时PMID数组为None
+    :raise QuerySyntaxError
+    """
+    key = (by_type, query)
+    result = result_cache.get(key)
+    if result is not None:
+        return result
+    libraries = None
+    node = parse_query(query)
+    if not (isinstance(node, Term) and node.field is None):
+        # AND/OR/NOT/字段限定: 按查询计划执行
+        pub_ids = QueryPlanner(by_type).materialize(node)
+    elif by_type == 'library':
+        # 字符串查询
+        query = node.text
+        libraries = get_library(query)
+        if len(libraries) == 1:
+            pub_ids = get_pubmed_by_library(libraries[0])
+            libraries = None
+        elif len(libraries) > 1:
+            pub_ids = None
+            libraries = get_sorted_library(query)
+        else:
+            pub_ids = posting.EMPTY
+            libraries = None
+    else:
+        pub_ids = get_pub_by_mention(node.text)
+    result = (pub_ids, libraries)
+    result_cache.put(key, result, size=sizeof(pub_ids) + sum(sizeof(library.synonyms) for library in libraries or []))
+    return result
+
+
+def query_entity(query, by_type='library'):
+    """
+    没有运算符和字段限定的单个词只匹配到一个标准库/文章原生词时返回该实体
+    :return: (library/mention, id), 否则返回None
+    """
+    node = parse_query(query)
+    if not (isinstance(node, Term) and node.field is None):
+        return None
+    if by_type == 'library':
+        libraries = get_library(node.text)
+        return ('library', libraries[0].id) if len(libraries) == 1 else None
+    ids = mention_ids(node.text)
+    return ('mention', ids[0]) if len(ids) == 1 else None
+
+
+def cache_page(key, response):
+    """
+    响应输出完成后将完整的响应体(未压缩)和ETag写入分页缓存, 304响应不缓存
+    流式响应在输出过程中收集字节, 超过PAGE_CACHE_ENTRY_BYTES或输出过程中出错(StreamError)时放弃缓存
+    """
+    if response.status_code != 200:
+        return response
+    etag = response.get_etag()[0]
+
+    def put(body):
+        page_cache.put(key, body)
+        if etag:
+            page_cache.put(('etag',) + key, etag.encode('utf-8'))
+
+    if not response.is_streamed:
+        put(response.get_data())
+        return response
+    body = response.response
+
+    def generate():
+        chunks, size = [], 0
+        for chunk in body:
+            if isinstance(chunk, StreamError):
+                chunks = None
+            if chunks is not None:
+                chunks.append(chunk)
+                size += len(chunks[-1])
+                if size > Config.PAGE_CACHE_ENTRY_BYTES:
+                    chunks = None
+            yield chunk
+        if chunks is not None:
+            put(b''.join(chunks))
+    response.response = generate()
+    return response
 
 
 def extract_pub_med(by_type='library'):
@@ -397,133 +1018,286 @@ def extract_pub_med(by_type='library'):
         query = request.args.get("q")
         page = request.args.get("p", 1)
         limit = request.args.get("l", Config.per_page)
-        # 判断page/limit参数
+        cursor = request.args.get("cursor")
+        # 判断page/limit/cursor参数
         page = get_page(page)
         per_page = get_limit(limit)
-        if not query:
+        sort = request.args.get("sort")
+        # 旧版本返回的纯数字cursor: 不排序时为PMID, 排序时为偏移量
+        cursor = get_cursor(cursor, 'offset' if sort else 'pmid')
+        if not query or (sort and sort not in Config.SEARCH_SORTS):
             return badRequest()
+        try:
+            projection = get_projection()
+            column_filter = get_column_filter()
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
+        if (column_filter is not None or sort) and not pmid_columns.ready:
+            return jsonify({"code": 503, "msg": "PMID metadata columns are not built yet", "success": False})
         # 远程访问
         if remote and remote == 'remote':
             restart = int(request.args.get('restart', 0))
-            result = extract_pub_med_from_remote(query, restart, page, per_page)
+            result = extract_pub_med_from_remote(query, restart, page, per_page, projection)
             return result
+        # 位图尚未生成时按偏移翻页每跳过一页需要查询一次数据库, 限制翻页深度(pmid cursor不受限制)
+        if is_cancer == 'cancer' and not cancer_bitmap.ready and column_filter is None and not sort \
+                and (cursor is None or cursor.mode == 'offset') \
+                and page_offset(page, per_page, cursor) > Config.CANCER_FALLBACK_MAX_OFFSET:
+            return jsonify({"code": 503, "msg": "cancer bitmap is not built yet, use cursor for deep pages",
+                            "success": False})
+        query = normalize_query(query)
+        # 分页响应缓存, 命中时不访问数据库和文件
+        page_key = (by_type, query, is_cancer, remote, page, per_page, cursor, projection, column_filter, sort)
+        body = page_cache.get(page_key)
+        if body is not None:
+            etag = page_cache.get(('etag',) + page_key)
+            etag = etag.decode('utf-8') if etag else None
+            response = not_modified(etag)
+            if response is None:
+                response = Response(body, mimetype='application/json')
+                if etag:
+                    response.set_etag(etag)
+            return response
         # 通过PubMed ID或PMC ID查询
         if re.search(r'^\d+$|PMC\d+', query.replace(" ", "")):
-            result = extract_pub_med_by_id(query, page, per_page)
-            return result
-        else:
-            if ' AND ' in query:
-                # 并集查询
-                query_fields = query.replace(' OR ', ' AND ').split(' AND ')
-                pub_ids = set()
-                i = 1
-                for query_field in query_fields:
-                    new_pub_ids = get_pubmed_by_query_field(query_field) if by_type == 'library' else \
-                        get_pub_by_mention(query_field)
-                    if len(new_pub_ids) == 0:
-                        pub_ids = set()
-                        break
-                    pub_ids = new_pub_ids if i == 1 else pub_ids & new_pub_ids
-                    i += 1
-            elif ' OR ' in query:
-                # 或查询
-                query_fields = query.split(' OR ')
-                pub_ids = set()
-                for query_field in query_fields:
-                    new_pub_ids = get_pubmed_by_query_field(query_field) if by_type == 'library' else \
-                        get_pub_by_mention(query_field)
-                    pub_ids = pub_ids | new_pub_ids
-            else:
-                # 字符串查询
-                if by_type == 'library':
-                    libraries = get_library(query.strip())
-                    if len(libraries.all()) == 1:
-                        pub_ids = get_pubmed_by_library(libraries.first())
-                    elif len(libraries.all()) > 1:
-                        libraries = get_sorted_library(query.strip())
-                        data = {
-                            "code": 200,
-                            "msg": "Request success",
-                            "success": True,
-                            "page": page,
-                            "next": page,
-                            "count": 0,
-                            "limit": per_page,
-                            "type": 1,
-                            "data": [{"symbol": library.symbol,
-                                      "identifier": library.identifier,
-                                      "synonyms": library.synonyms,
-                                      "label": Config.LABEL_DICT[library.label]} for library in libraries]
-                        }
-                        return jsonify(data)
-                    else:
-                        pub_ids = set()
-                else:
-                    query_str = query.strip()
-                    pub_ids = get_pub_by_mention(query_str)
-            if len(pub_ids) == 0:
+            return cache_page(page_key, extract_pub_med_by_id(query, page, per_page, projection))
+        try:
+            pub_ids, libraries = resolve_query(query, by_type)
+        except QuerySyntaxError as e:
+            return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
+        if libraries:
+            data = {
+                "code": 200,
+                "msg": "Request success",
+                "success": True,
+                "page": page,
+                "next": page,
+                "count": 0,
+                "limit": per_page,
+                "type": 1,
+                "data": [{"symbol": library.symbol,
+                          "identifier": library.identifier,
+                          "synonyms": library.synonyms,
+                          "label": Config.LABEL_DICT[library.label]} for library in libraries]
+            }
+            return cache_page(page_key, jsonify(data))
+        if len(pub_ids) == 0:
+            data = {
+                "code": 200,
+                "msg": "Request success",
+                "success": True,
+                "page": page,
+                "next": None,
+                "count": 0,
+                "limit": per_page,
+                "type": 2,
+                "data": []
+            }
+            return cache_page(page_key, jsonify(data))
+        # 单个实体按sort排序时使用Monitor生成的预排序结果
+        entity = query_entity(query, by_type) if sort and column_filter is None else None
+        return cache_page(page_key, get_document_by_query_field(pub_ids, page, per_page, is_cancer, cursor,
+                                                                projection, column_filter, sort, entity))
+
+    except Exception as e:
+        logging.error(f"Request Failed {e}")
+        return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False})
+
+
+def extract_library_symbols(library_type='cancer'):
+    try:
+        query = request.args.get("q")
+        if not query:
+            return badRequest()
+        if library_type not in ['cancer', 'gene']:
+            library_type = 'chemical'
+        data = {
+            "code": 200,
+            "msg": "Request success",
+            "success": True,
+            "data": match_symbols(library_type, query),
+        }
+        return jsonify(data)
+    except Exception as e:
+        logging.error(f"Request Failed {e}")
+        return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False})
+
+
+def extract_facets(by_type='library'):
+    """
+    检索结果的分面统计 /search/facets?q=EGFR&facets=year,journal,disease&top=10
+    q/t/year/has_pmc/has_abstract 与 /search 相同, 返回年份/杂志/共同出现的实体的文献数
+    """
+    try:
+        query = request.args.get("q")
+        is_cancer = request.args.get("t", "cancer")
+        if not query:
+            return badRequest()
+        names = request.args.get("facets")
+        names = [name.strip().lower() for name in names.split(',') if name.strip()] if names else FACETS
+        unknown = [name for name in names if name not in FACETS]
+        if unknown:
+            return jsonify({"code": 400, "msg": f"Bad Request: unknown facets {','.join(unknown)}", "success": False})
+        top = get_limit(request.args.get("top", Config.per_page), Config.FACET_TOP_MAX)
+        try:
+            column_filter = get_column_filter()
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
+        if not pmid_columns.ready:
+            return jsonify({"code": 503, "msg": "PMID metadata columns are not built yet", "success": False})
+        query = normalize_query(query)
+        key = ('facets', by_type, query, is_cancer, column_filter, tuple(names), top)
+        body = page_cache.get(key)
+        if body is not None:
+            return Response(body, mimetype='application/json')
+        try:
+            pub_ids, libraries = resolve_query(query, by_type)
+        except QuerySyntaxError as e:
+            return jsonify({"code": 400, "msg": f"Bad Request: {e}", "success": False})
+        if libraries:
+            # 需要消歧, 与/search相同返回匹配到的标准库
+            data = {
+                "code": 200,
+                "msg": "Request success",
+                "success": True,
+                "count": 0,
+                "type": 1,
+                "data": [{"symbol": library.symbol,
+                          "identifier": library.identifier,
+                          "synonyms": library.synonyms,
+                          "label": Config.LABEL_DICT[library.label]} for library in libraries]
+            }
+            return cache_page(key, jsonify(data))
+        if is_cancer == 'cancer':
+            pub_ids = filter_cancer(pub_ids)
+        if column_filter is not None:
+            pub_ids = pmid_columns.filter(pub_ids, column_filter)
+        # 检索词本身不作为共同出现的实体
+        entity = query_entity(query, by_type)
+        exclude = [entity[1]] if entity and entity[0] == 'library' else []
+        data = {
+            "code": 200,
+            "msg": "Request success",
+            "success": True,
+            "count": len(pub_ids),
+            "type": 2,
+            "data": compute_facets(pub_ids, names, top, exclude),
+        }
+        return cache_page(key, jsonify(data))
+    except Exception as e:
+        logging.error(f"Request Failed {e}")
+        return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False})
+
+
+def library_json(library, count=None):
+    data = {"id": library.id,
+            "symbol": library.symbol,
+            "identifier": library.identifier,
+            "label": Config.LABEL_DICT.get(library.label)}
+    if count is not None:
+        data["count"] = count
+    return data
+
+
+def top_relations(library_ids, counts, label, top):
+    """
+    共现次数最多的标准库
+    :param library_ids: 升序的标准库id数组
+    :param label: 只返回该类型的标准库, None表示全部
+    """
+    dictionary = dictionaries['library'].get()
+    indexes = dictionary.index_of(library_ids)
+    keep = indexes >= 0
+    indexes, counts = indexes[keep], counts[keep].astype(np.int64)
+    if label is not None:
+        keep = dictionary.labels[indexes] == label
+        indexes, counts = indexes[keep], counts[keep]
+    # library_ids升序, 按下标排序即按标准库id排序
+    return [library_json(dictionary.entries[indexes[position]], count)
+            for position, count in top_counts(np.arange(len(indexes)), counts, top)]
+
+
+def extract_relations():
+    """
+    标准库共现查询
+        /relations?entity=EGFR&type=chemical&top=50         与EGFR共现次数最多的化合物
+        /relations?entity=EGFR&with=gefitinib              两个标准库的共现次数, 以及与二者同时共现的标准库
+        /relations?entity=EGFR&with=gefitinib&with=NSCLC   三个标准库的共现次数
+    entity/with 与/search的单个词相同, 匹配到多个标准库时返回标准库列表用于消歧(可以使用@GE@/@CA@/@DR@加identifier)
+    """
+    try:
+        names = [request.args.get("entity")] + request.args.getlist("with")
+        if not all(name and name.strip() for name in names) or len(names) > 3:
+            return jsonify({"code": 400, "msg": "Bad Request: entity is required, with can be given at most twice",
+                            "success": False})
+        names = [normalize_query(name) for name in names]
+        relation_type = (request.args.get("type") or '').lower() or None
+        if relation_type and relation_type not in Config.RELATION_TYPES:
+            return jsonify({"code": 400, "msg": f"Bad Request: unknown type {relation_type}", "success": False})
+        label = Config.RELATION_TYPES.get(relation_type)
+        top = get_limit(request.args.get("top", Config.per_page), Config.RELATION_TOP_MAX)
+        if not relation_matrix.ready:
+            return jsonify({"code": 503, "msg": "relation matrix is not built yet", "success": False})
+        key = ('relations', tuple(names), relation_type, top)
+        body = page_cache.get(key)
+        if body is not None:
+            return Response(body, mimetype='application/json')
+        libraries = []
+        for name in names:
+            matched = get_library(name)
+            if len(matched) != 1:
+                # 没有匹配或匹配到多个标准库
                 data = {
                     "code": 200,
                     "msg": "Request success",
                     "success": True,
-                    "page": page,
-                    "next": None,
+                    "entity": name,
                     "count": 0,
-                    "limit": per_page,
-                    "type": 2,
-                    "data": []
+                    "type": 1,
+                    "data": [library_json(library) for library in (get_sorted_library(name) if matched else [])]
                 }
-                return jsonify(data)
-            data = get_document_by_query_field(pub_ids, page, per_page, is_cancer)
-            return jsonify(data)
-
+                return cache_page(key, jsonify(data))
+            libraries.append(matched[0])
+        library_ids = [library.id for library in libraries]
+        if len(library_ids) == 3:
+            count = relation_matrix.triple_count(*library_ids)
+            related = []
+        elif len(library_ids) == 2:
+            count = relation_matrix.count(*library_ids)
+            related = top_relations(*relation_matrix.thirds(*library_ids), label, top)
+        else:
+            count = None
+            related = top_relations(*relation_matrix.neighbors(library_ids[0]), label, top)
+        data = {
+            "code": 200,
+            "msg": "Request success",
+            "success": True,
+            "entities": [library_json(library) for library in libraries],
+            "count": count,
+            "type": 2,
+            "data": related,
+        }
+        return cache_page(key, jsonify(data))
     except Exception as e:
         logging.error(f"Request Failed {e}")
         return jsonify({"code": 500, "msg": f"Request Failed {e}", "success": False})
 
 
-def eutilsToXmlSimilarRef(document_id):
-    """调用PubMed远程接口获取相似文献/引用文献/被引用文献的接口"""
-    Entrez.email = Config.Entrez_email
-    handle = Entrez.elink(db='pubmed', dbfrom='pubmed', cmd='neighbor', id=document_id)
-    xml = handle.read()
-    xml_data = xml.decode('utf-8') if isinstance(xml, bytes) else xml
-    root = etree.fromstring(xml_data)
-    LinkSetDbs = root.findall('./LinkSet/LinkSetDb')
-    similarIds, refIds, citedIds = [], [], []
-    for LinkSetDb in LinkSetDbs:
-        link_name = LinkSetDb.find('./LinkName')
-        if link_name.text == 'pubmed_pubmed':
-            similarIds = [Id.text for Id in LinkSetDb.findall('./Link/Id')
-                          if Id.text != str(document_id) and re.search(r'^\d+$', Id.text)]
-        elif link_name.text == 'pubmed_pubmed_refs':
-            refIds = [Id.text for Id in LinkSetDb.findall('./Link/Id')
-                      if Id.text != str(document_id) and re.search(r'^\d+$', Id.text)]
-        elif link_name.text == 'pubmed_pubmed_citedin':
-            citedIds = [Id.text for Id in LinkSetDb.findall('./Link/Id')
-                        if Id.text != str(document_id) and re.search(r'^\d+$', Id.text)]
-    return similarIds, refIds, citedIds
-
-
-def extract_library_symbols(library_type='cancer'):
+def extract_suggestions():
+    """输入联想, 按关联文献数倒序返回匹配前缀的标准词/原生词"""
     try:
         query = request.args.get("q")
         if not query:
             return badRequest()
-        if library_type == 'cancer':
-            libraries = CancerLibrary.query.filter(or_(CancerLibrary.symbol.like(f'%{query}%'),
-                                                       CancerLibrary.synonyms.like(f'%{"|" + query + "|"}%'))).all()
-        elif library_type == 'gene':
-            libraries = GeneLibrary.query.filter(or_(GeneLibrary.symbol.contains(query),
-                                                     GeneLibrary.synonyms.like(f'%{"|" + query + "|"}%'))).all()
-        else:
-            libraries = ChemLibrary.query.filter(or_(ChemLibrary.symbol.contains(query),
-                                                     ChemLibrary.synonyms.like(f'%{"|" + query + "|"}%'))).all()
+        suggest_type = request.args.get("t")
+        if suggest_type not in SUGGEST_TYPES:
+            suggest_type = None
+        limit = get_limit(request.args.get("l", Config.per_page))
         data = {
             "code": 200,
             "msg": "Request success",
             "success": True,
-            "data": [library.symbol for library in libraries if library.symbol],
+            "data": suggest(query, suggest_type, limit),
         }
         return jsonify(data)
     except Exception as e:
@@ -2,7 +2,6 @@
 # @Time : 2022/8/20 12:34
 # @File : NER.py
 # @Project : OncoPubMinerMonitor
-import math
 import multiprocessing
 import os
 import re
@@ -12,7 +11,7 @@ import time
 import bioc
 from bioc import BioCAnnotation, BioCLocation
 
-from pub_miner import PubMinerDB, Config, save_json_data
+from pub_miner import PubMinerDB, Config, get_document_store, parse_infos
 
 
 def progressIsSuccessfullyExecuted(task_name, input_dir, output_dir, execute_failure_xml_dir):
@@ -343,7 +342,6 @@ def mergerXmlFileAnnotations(identifier_symbols, mesh_cancer_id, do_identifier_s
     """
     resultDir = os.path.expanduser(global_setting["storage"]["result"])
     nerDir = os.path.expanduser(global_setting["storage"]["ner"])
-    BioCPath = os.path.expanduser(global_setting["storage"]["upload"]["local-directory"])
     document_annotations = []
     try:
         for task_name in ['chemical_ner', 'mutation_ner', 'disease_ner', 'gene_ner']:
@@ -407,12 +405,9 @@ def mergerXmlFileAnnotations(identifier_symbols, mesh_cancer_id, do_identifier_s
         with bioc.BioCXMLDocumentWriter(os.path.join(resultDir, resource, second_dir, BioCXmlFile)) \
                 as writer:
             writer.write_document(document)
-        # BioC结果上传
-        pid = document.id
-        psd = str(math.ceil(int(pid) / 10000))
-        BioCDocJsonFilePath = os.path.join(BioCPath, resource, f'{psd[-1]}/{psd}/'
-                                                               f'{"PMC" if resource == "PMC" else ""}{pid}.json')
-        save_json_data(BioCDocJsonFilePath, bioc.toJSON(document))
+        # BioC结果写入打包存储, PubMed文献同时合并基本信息
+        get_document_store(resource).put(document.id, bioc.toJSON(document),
+                                         parse_infos(document.passages[0].infons) if resource == 'PUBMED' else None)
         for task_name in ['chemical_ner', 'mutation_ner', 'disease_ner', 'gene_ner']:
             # 依次删除chemical/mutation/disease/gene实体识别工具的识别结果文件
             OutPutDir = f'{tools_info[task_name]["toolName"]}_OUTPUT'
@@ -5,7 +5,7 @@
 
 import pymysql
 
-from pub_miner import Config
+from pub_miner import Config, posting
 
 
 class PubMinerDB:
@@ -310,6 +310,14 @@ class PubMinerDB:
         except Exception as e:
             Config.Logger.error(f"update stat abstract fullText fields error: {e}")
 
+    def update_stat_posting_version(self):
+        """实体-文献倒排表更新后递增版本号, API据此清空缓存"""
+        try:
+            sql = 'update stat set postingVersion=IFNULL(postingVersion, 0)+1'
+            self.update(sql)
+        except Exception as e:
+            Config.Logger.error(f"update stat postingVersion error: {e}")
+
     def search_cancer_library_info(self):
         try:
             sql = f"select identifier, symbol, other_identifiers from cancer_library"
@@ -386,6 +394,70 @@ class PubMinerDB:
         except Exception as e:
             Config.Logger.error(f"cite_cited_similar_relationship pid: {pid} insert or update error, ErrorInfo: {e}")
 
+    def search_citation_rows(self, last_id=0, limit=10000):
+        """按自增id分批查询引用/被引用关系, 用于生成引用关系图"""
+        try:
+            sql = f"select id, pubmed_id, cite, cited from cite_cited_similar_relationship where id > {last_id} " \
+                  f"order by id limit {limit};"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search cite_cited_similar_relationship citation rows Error: {e}')
+            return ()
+
+    def search_refreshed_citation_rows(self, timestamp=0, last_id=0, limit=10000):
+        """
+        按(timestamp, id)分批查询API通过elink刷新过的引用/被引用关系(timestamp由API写入)
+        :return: ((id, pubmed_id, cite, cited, timestamp), ...)
+        """
+        try:
+            sql = f"select id, pubmed_id, cite, cited, timestamp from cite_cited_similar_relationship " \
+                  f"where timestamp > {int(timestamp)} or (timestamp = {int(timestamp)} and id > {int(last_id)}) " \
+                  f"order by timestamp, id limit {limit};"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search cite_cited_similar_relationship refreshed rows Error: {e}')
+            return ()
+
+    def search_citation_rows_by_pub_ids(self, pub_ids):
+        """查询指定文献的引用/被引用关系"""
+        try:
+            if not pub_ids:
+                return ()
+            sql = f"select pubmed_id, cite, cited from cite_cited_similar_relationship " \
+                  f"where pubmed_id in ({','.join(str(int(pub_id)) for pub_id in pub_ids)});"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search cite_cited_similar_relationship by pubmed ids Error: {e}')
+            return ()
+
+    COLUMN_ROWS_SQL = 'select p.id, p.year, p.journal_id, j.impact_factor, c.cited_num, p.pmc_id, p.is_cancer, ' \
+                      'p.has_abstract from pubmed p left join journal j on j.id = p.journal_id ' \
+                      'left join cite_cited_similar_relationship c on c.pubmed_id = p.id '
+
+    def search_column_rows(self, last_id=0, limit=10000):
+        """按PMID分批查询文献基本信息, 用于生成PMID列"""
+        try:
+            self.cursor.execute(f"{self.COLUMN_ROWS_SQL}where p.id > {int(last_id)} order by p.id limit {limit};")
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search pubmed column rows Error: {e}')
+            return ()
+
+    def search_column_rows_by_pub_ids(self, pub_ids):
+        """查询指定文献的基本信息"""
+        try:
+            if not pub_ids:
+                return ()
+            self.cursor.execute(f"{self.COLUMN_ROWS_SQL}where p.id in "
+                                f"({','.join(str(int(pub_id)) for pub_id in pub_ids)});")
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search pubmed column rows by pubmed ids Error: {e}')
+            return ()
+
     def batch_insert_ref_pub_info(self, batch_data):
         try:
             sql = f'INSERT IGNORE INTO cite_cited_similar_relationship (cite, cite_num, pubmed_id) values(%s, %s, %s)'
@@ -410,18 +482,17 @@ class PubMinerDB:
 
     def update_library_pub(self, lib_id, Ids):
         try:
-            Ids, num = "|".join([str(Id) for Id in Ids]), len(Ids)
-            sql = f'update library_pubmed set pubmeds="{Ids}", length="{num}"' \
-                  f'  where library_id={lib_id};'
-            self.update(sql)
+            Ids, num, postings = "|".join([str(Id) for Id in Ids]), len(Ids), posting.encode(Ids)
+            sql = f'update library_pubmed set pubmeds=(%s), postings=(%s), length=(%s) where library_id=(%s);'
+            self.update_data(sql, [Ids, postings, num, lib_id])
         except Exception as e:
             Config.Logger.error(f"Library id: {lib_id}, update library_pubmed pubmeds fields ErrorInfo: {e}")
 
     def insert_library_pub(self, lib_id, pub_ids):
         try:
-            Ids, num = "|".join([str(Id) for Id in pub_ids]), len(pub_ids)
-            sql = f'INSERT IGNORE INTO library_pubmed (library_id, pubmeds, length) values(%s, %s, %s)'
-            self.insert_data(sql, [lib_id, Ids, num])
+            Ids, num, postings = "|".join([str(Id) for Id in pub_ids]), len(pub_ids), posting.encode(pub_ids)
+            sql = f'INSERT IGNORE INTO library_pubmed (library_id, pubmeds, postings, length) values(%s, %s, %s, %s)'
+            self.insert_data(sql, [lib_id, Ids, postings, num])
         except Exception as e:
             Config.Logger.error(f"Library id: {lib_id}, insert library_pubmed ErrorInfo: {e}")
 
@@ -472,18 +543,17 @@ class PubMinerDB:
 
     def update_mention_pub(self, mention_id, Ids):
         try:
-            Ids, num = "|".join([str(Id) for Id in Ids]), len(Ids)
-            sql = f'update mention_pubmed set pubmeds="{Ids}", length="{num}"' \
-                  f'  where mention_id={mention_id};'
-            self.update(sql)
+            Ids, num, postings = "|".join([str(Id) for Id in Ids]), len(Ids), posting.encode(Ids)
+            sql = f'update mention_pubmed set pubmeds=(%s), postings=(%s), length=(%s) where mention_id=(%s);'
+            self.update_data(sql, [Ids, postings, num, mention_id])
         except Exception as e:
             Config.Logger.error(f"Mention id: {mention_id}, update mention_pubmed pubmeds fields ErrorInfo: {e}")
 
     def insert_mention_pub(self, mention_id, pub_ids):
         try:
-            Ids, num = "|".join([str(Id) for Id in pub_ids]), len(pub_ids)
-            sql = f'INSERT IGNORE INTO mention_pubmed (mention_id, pubmeds, length) values(%s, %s, %s)'
-            self.insert_data(sql, [mention_id, Ids, num])
+            Ids, num, postings = "|".join([str(Id) for Id in pub_ids]), len(pub_ids), posting.encode(pub_ids)
+            sql = f'INSERT IGNORE INTO mention_pubmed (mention_id, pubmeds, postings, length) values(%s, %s, %s, %s)'
+            self.insert_data(sql, [mention_id, Ids, postings, num])
         except Exception as e:
             Config.Logger.error(f"Mention id: {mention_id}, insert mention_pubmed ErrorInfo: {e}")
 
@@ -501,6 +571,68 @@ class PubMinerDB:
         except Exception as e:
             Config.Logger.error(f"update_insert mention_pubmed mention_id: {mention_id}, ErrorInfo: {e}")
 
+    def search_text_postings(self, table_name, last_id=0, limit=1000):
+        """分批查询尚未生成二进制倒排表的数据"""
+        try:
+            sql = f"select id, pubmeds from {table_name} where postings is null and id > {last_id} " \
+                  f"order by id limit {limit};"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search {table_name} text postings Error: {e}')
+            return ()
+
+    def batch_update_postings(self, table_name, batch_data):
+        try:
+            sql = f'update {table_name} set postings=(%s) where id=(%s);'
+            self.update_many(sql, batch_data)
+        except Exception as e:
+            Config.Logger.error(f'batch update {table_name} postings Error: {e}')
+
+    def search_postings(self, table_name, id_column, last_id=0, limit=1000, min_length=0):
+        """按实体ID分批查询文献数不少于min_length的二进制倒排表"""
+        try:
+            sql = f"select {id_column}, postings from {table_name} where {id_column} > {int(last_id)} " \
+                  f"and length >= {int(min_length)} and postings is not null order by {id_column} limit {limit};"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search {table_name} postings Error: {e}')
+            return ()
+
+    def search_postings_by_ids(self, table_name, id_column, ids, min_length=0):
+        """查询指定实体的二进制倒排表"""
+        try:
+            if not ids:
+                return ()
+            sql = f"select {id_column}, postings from {table_name} where {id_column} in " \
+                  f"({','.join(str(int(Id)) for Id in ids)}) and length >= {int(min_length)} and postings is not null;"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search {table_name} postings by ids Error: {e}')
+            return ()
+
+    def search_relation_rows(self, table_name, fields, last_id=0, limit=10000):
+        """按id分批查询标准库关联表"""
+        try:
+            sql = f"select id, {', '.join(fields)} from {table_name} where id > {int(last_id)} " \
+                  f"order by id limit {limit};"
+            self.cursor.execute(sql)
+            return self.cursor.fetchall()
+        except Exception as e:
+            Config.Logger.error(f'search {table_name} rows Error: {e}')
+            return ()
+
+    def batch_save_orderings(self, table_name, id_column, batch_data):
+        """写入预排序结果, batch_data: [[实体ID, orderings]]"""
+        try:
+            sql = f'INSERT INTO {table_name} ({id_column}, orderings) values(%s, %s) ' \
+                  f'ON DUPLICATE KEY UPDATE orderings=values(orderings);'
+            self.update_many(sql, batch_data)
+        except Exception as e:
+            Config.Logger.error(f'batch save {table_name} orderings Error: {e}')
+
     # 关闭游标和数据库的连接
     def close(self):
         self.cursor.close()
@@ -5,11 +5,18 @@
 
 from pub_miner.global_settings import loadYAML, get_global_settings
 from pub_miner.config import Config
+from pub_miner.eutils import EutilsClient, get_eutils_client
 from pub_miner.utils import eutilsToXmlData, save_json_data, save_data, read_json_data, read_data
+from pub_miner.docstore import DocumentStore, get_document_store, document_exists, update_document_infos, \
+    update_documents_infos, parse_infos
+from pub_miner.citation_graph import CitationGraph, get_citation_graph, save_citation_rows, save_library_rows
+from pub_miner.columns import PMIDColumns, get_pmid_columns, save_column_rows
 from pub_miner.PubMinerDatabase import PubMinerDB
 from pub_miner.get_resource import eutilsData, getResource, calcSHA256, download, getResourceInfo
 from pub_miner.convert import processMedLineFile, splitBioC2ToolsDir, converts
-from pub_miner.update_database import update_pub_base_info, update_pub_ner_result
+from pub_miner.update_database import update_pub_base_info, update_pub_ner_result, update_posting_lists, \
+    pack_json_documents, build_citation_graph, upgrade_document_store, build_pmid_columns, build_entity_orderings, \
+    build_library_graph, build_relation_matrix, sync_refreshed_citations, compact_document_store
 from pub_miner.NER import diseaseNER, chemicalNER, mutationNER, geneNER, merger
 from pub_miner.FTPClient import FTPClient
 from pub_miner.pubmed_hash import pubMedHash
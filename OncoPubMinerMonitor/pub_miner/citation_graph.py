@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 18:10
+# @File : citation_graph.py
+# @Project : OncoPubMinerMonitor
+"""
+文献引用关系图(邻接表), 数据来自cite_cited_similar_relationship表的cite/cited字段
+
+与 OncoPubMinerAPI/citation_graph.py 使用同一种格式, Monitor写入, API通过mmap只读:
+    <local-directory>/GRAPH/<cite|cited>/index.bin   以PMID为下标的定长索引
+    <local-directory>/GRAPH/<cite|cited>/edges.bin   只追加写入的int32 PMID数组
+
+    index entry(16 bytes): offset(Q) count(I) flags(I), offset/count以PMID个数为单位, flags为0表示没有数据
+
+与CSR相同, 一篇文献的相关文献是edges中连续的一段, 按PMID升序保存。更新时追加新的一段并改写索引,
+API分页时直接在这一段上切片, 不需要解析 | 隔开的文本。
+GRAPH/library 使用相同的格式保存每篇文献关联的标准库id(升序), API用于统计共同出现的实体。
+"""
+import fcntl
+import os
+import struct
+
+import pub_miner
+
+ENTRY = struct.Struct('<QII')
+EDGE_SIZE = 4
+FLAG_PRESENT = 1
+INDEX_NAME = 'index.bin'
+EDGES_NAME = 'edges.bin'
+LOCK_NAME = '.lock'
+# 索引文件按100万条(16MB)为单位扩容, 未写入的部分为稀疏文件空洞
+INDEX_GROW_ENTRIES = 1 << 20
+RELATIONS = ['cite', 'cited']
+
+
+def parse_pub_ids(pub_ids):
+    """| 隔开的文本或PMID列表转换为去重后升序的PMID列表"""
+    if isinstance(pub_ids, str):
+        pub_ids = pub_ids.split('|')
+    return sorted({int(pub_id) for pub_id in pub_ids if str(pub_id).strip().isdigit()})
+
+
+class CitationGraph(object):
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.edges_path = os.path.join(root, EDGES_NAME)
+
+    def _read_entry(self, key):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = os.pread(f.fileno(), ENTRY.size, key * ENTRY.size)
+        except OSError:
+            return None
+        if len(data) < ENTRY.size:
+            return None
+        offset, count, flags = ENTRY.unpack(data)
+        return (offset, count) if flags & FLAG_PRESENT else None
+
+    def get(self, pub_id):
+        """相关文献PMID列表, 没有数据时返回None"""
+        entry = self._read_entry(int(pub_id))
+        if entry is None:
+            return None
+        offset, count = entry
+        if not count:
+            return []
+        with open(self.edges_path, 'rb') as f:
+            data = os.pread(f.fileno(), count * EDGE_SIZE, offset * EDGE_SIZE)
+        return list(struct.unpack(f'<{count}i', data))
+
+    def put_many(self, items):
+        """
+        批量写入(覆盖)相关文献, 一次加锁
+        :param items: [(pub_id, | 隔开的文本或PMID列表)]
+        """
+        records = [(int(pub_id), parse_pub_ids(pub_ids)) for pub_id, pub_ids in items]
+        if not records:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                entries = self._append(records)
+                self._write_index(entries)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, records):
+        """先写edges, 全部写入后再改写索引, 读取方不会读到写了一半的数据"""
+        entries = []
+        with open(self.edges_path, 'ab') as f:
+            position = f.tell()
+            if position % EDGE_SIZE:
+                # 上次写入中断留下的不完整数据, 对齐后继续追加
+                position += EDGE_SIZE - position % EDGE_SIZE
+                f.write(b'\x00' * (position - f.tell()))
+            for key, pub_ids in records:
+                f.write(struct.pack(f'<{len(pub_ids)}i', *pub_ids))
+                entries.append((key, ENTRY.pack(position // EDGE_SIZE, len(pub_ids), FLAG_PRESENT)))
+                position += len(pub_ids) * EDGE_SIZE
+        return entries
+
+    def _write_index(self, entries):
+        size = (max(key for key, _ in entries) + 1) * ENTRY.size
+        fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                grow = INDEX_GROW_ENTRIES * ENTRY.size
+                os.ftruncate(fd, -(-size // grow) * grow)
+            for key, entry in entries:
+                os.pwrite(fd, entry, key * ENTRY.size)
+        finally:
+            os.close(fd)
+
+
+graphs = {}
+
+
+def get_citation_graph(relation):
+    """
+    :param relation: cite(引用的文献)/cited(被引用的文献)/library(关联的标准库)
+    """
+    if relation not in graphs:
+        global_setting = pub_miner.get_global_settings(True)
+        BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
+        graphs[relation] = CitationGraph(os.path.join(BioCPath, 'GRAPH', relation))
+    return graphs[relation]
+
+
+def save_citation_rows(rows):
+    """
+    cite_cited_similar_relationship的数据写入引用关系图
+    :param rows: [(pubmed_id, cite, cited)]
+    """
+    for index, relation in enumerate(RELATIONS):
+        get_citation_graph(relation).put_many([(row[0], row[index + 1]) for row in rows if row[index + 1] is not None])
+
+
+def save_library_rows(items, merge=False):
+    """
+    文献关联的标准库写入GRAPH/library
+    :param items: [(pubmed_id, 标准库id列表)]
+    :param merge: True: 与已有的标准库合并(增量更新只包含本批次的标注结果); False: 覆盖
+    """
+    graph = get_citation_graph('library')
+    if merge:
+        items = [(pub_id, sorted(set(library_ids).union(graph.get(pub_id) or []))) for pub_id, library_ids in items]
+    graph.put_many(items)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 23:10
+# @File : columns.py
+# @Project : OncoPubMinerMonitor
+"""
+以PMID为下标的文献基本信息列(列式存储), 数据来自pubmed/journal/cite_cited_similar_relationship表
+
+与 OncoPubMinerAPI/columns.py 使用同一种格式, Monitor写入, API通过mmap只读:
+    <local-directory>/COLUMNS/<column>.bin   每列一个文件, 第PMID个元素为该文献的值, 0表示没有数据
+
+API在候选PMID数组上直接取值, 按年份/是否有全文等条件过滤和按年份/被引用数/影响因子排序不需要访问数据库。
+文件按100万个元素为单位扩容, 未写入的部分为稀疏文件空洞。
+"""
+import fcntl
+import os
+
+import numpy as np
+
+import pub_miner
+
+# 列名: 类型
+COLUMNS = {
+    'year': np.uint16,
+    'journal_id': np.uint32,
+    'impact_factor': np.float32,
+    'cited_num': np.uint32,
+    'has_pmc': np.uint8,
+    'is_cancer': np.uint8,
+    'has_abstract': np.uint8,
+}
+LOCK_NAME = '.lock'
+GROW_ENTRIES = 1 << 20
+
+
+def column_value(value):
+    return value if value else 0
+
+
+class PMIDColumns(object):
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, column):
+        return os.path.join(self.root, f'{column}.bin')
+
+    def put_many(self, pub_ids, values):
+        """
+        批量写入(覆盖), 一次加锁
+        :param pub_ids: PMID列表
+        :param values: {列名: 与pub_ids等长的值列表}, 只写入给出的列
+        """
+        if not len(pub_ids):
+            return
+        keys = np.asarray(pub_ids, dtype=np.int64)
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                for column, column_values in values.items():
+                    self._write(column, keys, np.asarray(column_values, dtype=COLUMNS[column]))
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def get(self, column, pub_ids):
+        """
+        :param pub_ids: PMID数组
+        :return: 与pub_ids等长的数组, 没有数据的PMID为0
+        """
+        dtype = np.dtype(COLUMNS[column])
+        pub_ids = np.asarray(pub_ids, dtype=np.int64)
+        values = np.zeros(len(pub_ids), dtype=dtype)
+        if not os.path.exists(self.path(column)) or not os.path.getsize(self.path(column)):
+            return values
+        array = np.memmap(self.path(column), dtype=dtype, mode='r')
+        in_range = pub_ids < len(array)
+        values[in_range] = array[pub_ids[in_range]]
+        del array
+        return values
+
+    def _write(self, column, keys, values):
+        dtype = np.dtype(COLUMNS[column])
+        path = self.path(column)
+        count = int(keys.max()) + 1
+        with open(path, 'ab') as f:
+            size = f.tell()
+            if size < count * dtype.itemsize:
+                f.truncate(-(-count // GROW_ENTRIES) * GROW_ENTRIES * dtype.itemsize)
+        array = np.memmap(path, dtype=dtype, mode='r+')
+        array[keys] = values
+        array.flush()
+        del array
+
+
+columns = {}
+
+
+def get_pmid_columns():
+    if 'pubmed' not in columns:
+        global_setting = pub_miner.get_global_settings(True)
+        BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
+        columns['pubmed'] = PMIDColumns(os.path.join(BioCPath, 'COLUMNS'))
+    return columns['pubmed']
+
+
+def save_column_rows(rows):
+    """
+    文献基本信息写入PMID列
+    :param rows: [(pubmed_id, year, journal_id, impact_factor, cited_num, pmc_id, is_cancer, has_abstract)]
+    """
+    if not rows:
+        return
+    pub_ids = [int(row[0]) for row in rows]
+    values = {
+        'year': [int(row[1]) if str(row[1] or '').isdigit() else 0 for row in rows],
+        'journal_id': [column_value(row[2]) for row in rows],
+        'impact_factor': [column_value(row[3]) for row in rows],
+        'cited_num': [column_value(row[4]) for row in rows],
+        'has_pmc': [1 if row[5] else 0 for row in rows],
+        'is_cancer': [1 if row[6] else 0 for row in rows],
+        'has_abstract': [1 if row[7] else 0 for row in rows],
+    }
+    get_pmid_columns().put_many(pub_ids, values)
@@ -4,6 +4,7 @@
 # @Project : OncoPubMinerMonitor
 import logging
 import os
+import tempfile
 
 
 def get_logger(filename):
@@ -35,6 +36,18 @@ class Config:
     LogPath = os.path.join(BASE_DIR, "logs", "result.log")
 
     Entrez_email = "xxx"  # Always tell NCBI who you are
+    # NCBI api key, 有api key时每秒最多10次请求, 否则3次
+    NCBI_API_KEY = None
+    NCBI_REQUESTS_PER_SECOND = 3
+    # 令牌桶状态文件, 同一台机器上的API worker和Monitor共用每秒请求数, None表示每个进程单独限流
+    NCBI_RATE_LIMIT_FILE = os.path.join(tempfile.gettempdir(), 'oncopubminer-eutils.rate')
+    # E-utilities地址(可以指向本地的模拟服务), 超时时间(秒)和重试次数
+    EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+    EUTILS_TIMEOUT = 60
+    EUTILS_RETRIES = 3
+    # E-utilities响应的磁盘缓存目录(None表示不缓存)和有效期(秒)
+    EUTILS_CACHE_DIR = None
+    EUTILS_CACHE_TTL = 24 * 3600
     # mysql username
     DB_USERNAME = "xxx"
     # mysql password
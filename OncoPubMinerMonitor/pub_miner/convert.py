@@ -20,7 +20,8 @@ from html import unescape
 import six
 from nltk.tokenize import sent_tokenize
 
-from pub_miner import eutilsToXmlData, save_json_data, Config, PubMinerDB, get_global_settings, getResourceInfo
+from pub_miner import eutilsToXmlData, save_json_data, Config, PubMinerDB, get_global_settings, getResourceInfo, \
+    get_document_store, document_exists
 from pub_miner.pubrun import getToolsYamlInfo
 
 
@@ -621,15 +622,13 @@ def PubMedXml2BioC(PubMedXmlPath, PubMedBioCXMLPaths, deleteSource):
     :return:
     """
     basename = os.path.basename(PubMedXmlPath)
-    global_setting = get_global_settings(True)
-    BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
-    resourceBioCPath = os.path.join(BioCPath, 'PUBMED')
     Config.Logger.info(f'starting convert PubMedXml to BioC: {basename}')
     try:
         PubMedBioCXMLPaths = [PubMedBioCXMLPaths] if isinstance(PubMedBioCXMLPaths, six.string_types) else \
             PubMedBioCXMLPaths
         BioCXml_dict = {}
-        new_num = 0
+        # 新文献BioC数据, 全部转换后批量写入打包存储
+        new_documents = {}
         for pmDoc in processMedLineFile(PubMedXmlPath):
             pid = pmDoc["pid"]
             if pid:
@@ -638,19 +637,18 @@ def PubMedXml2BioC(PubMedXmlPath, PubMedBioCXMLPaths, deleteSource):
                     if pid not in BioCXml_dict or (pid in BioCXml_dict and version > BioCXml_dict[pid][1]):
                         # 计算当前PubMed数据的二级存储路径
                         psd = str(math.ceil(int(pid) / 10000))
-                        BioCDocJsonFilePath = os.path.join(resourceBioCPath, f'{psd[-1]}/{psd}/{pid}.json')
 
-                        is_new = 0 if os.path.exists(BioCDocJsonFilePath) else 1
+                        is_new = 0 if document_exists('PUBMED', pid) else 1
 
                         PubMedInfos = per_PubMedInfo(pmDoc, source=basename, psd=psd, is_new=is_new)
                         BioC_xml = per_PubMed2BioC(pmDoc, PubMedInfos)
                         if is_new:
-                            save_json_data(BioCDocJsonFilePath, bioc.toJSON(BioC_xml))
-                            new_num += 1
+                            new_documents[pid] = bioc.toJSON(BioC_xml)
 
                         BioCXml_dict[pid] = (BioC_xml, version)
                 except Exception as e:
                     Config.Logger.error(f'convert PubMedXml to BioC basename: {basename}, Pid: {pid}, Error {str(e)}')
+        get_document_store('PUBMED').put_many([(pid, document, None) for pid, document in new_documents.items()])
         # 写入PubMed数据
         for PubMedBioCXMLPath in PubMedBioCXMLPaths:
             PubMedBioCXMLFilePath = os.path.join(PubMedBioCXMLPath, basename)
@@ -658,7 +656,7 @@ def PubMedXml2BioC(PubMedXmlPath, PubMedBioCXMLPaths, deleteSource):
                 for BioCXml, _ in BioCXml_dict.values():
                     writer.write_document(BioCXml)
         Config.Logger.info(f'convert PubMedXml to BioC: {basename}, '
-                           f'{new_num}(New)/{len(BioCXml_dict)}(Total) PubMed article')
+                           f'{len(new_documents)}(New)/{len(BioCXml_dict)}(Total) PubMed article')
         # 删除源文件
         if deleteSource:
             os.remove(PubMedXmlPath)
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/18 16:05
+# @File : docstore.py
+# @Project : OncoPubMinerMonitor
+"""
+BioC Json文献打包存储, 代替每篇文献一个json文件(以及PUBMED_INFOS下单独的基本信息文件)
+
+与 OncoPubMinerAPI/docstore.py 使用同一种格式, Monitor写入, API只读:
+    <local-directory>/STORE/<PUBMED|PMC>/index.bin           以文献id(PMID/PMC id的数字部分)为下标的定长索引
+    <local-directory>/STORE/<PUBMED|PMC>/segment-00000.dat   只追加写入的数据段, 每篇文献一条UTF-8 JSON记录
+
+    index entry(16 bytes): segment(H) flags(H) length(I) offset(Q), flags为0表示文献不存在
+    record: [splice(I)] [passages_length(I) passages] [gzip_split(I)] JSON
+        FLAG_SPLICE: 第一个段落infons的拼接位置(相对JSON起始位置)
+        FLAG_PASSAGES: 段落表, JSON数组 [[start, end, section], ...], 每个段落在JSON中的起止位置和章节,
+                       API按章节/字段裁剪时只解析需要的段落
+        FLAG_GZIP: JSON以拼接位置为界分成两个gzip member保存, gzip_split为第一个member的长度,
+                   减少磁盘占用, API读取时解压(compress-documents选项)
+
+文献更新时追加新记录并改写索引, 旧记录成为垃圾数据, 超过一半时由compact把有效记录复制到新的数据段并删除旧的数据段。
+多个进程(NER合并时的子进程)通过flock串行写入。
+PubMed文献的基本信息(authors/keywords/refIds等)在写入时合并到第一个段落的infons中,
+由API根据数据库填充的动态字段(DYNAMIC_INFONS)在写入时去掉, API直接在拼接位置插入这些字段, 不需要解析JSON。
+"""
+import fcntl
+import json
+import os
+import struct
+import zlib
+from ast import literal_eval
+from collections import OrderedDict
+
+import numpy as np
+
+import pub_miner
+
+ENTRY = struct.Struct('<HHIQ')
+ENTRY_DTYPE = np.dtype([('segment', '<u2'), ('flags', '<u2'), ('length', '<u4'), ('offset', '<u8')])
+SPLICE_HEADER = struct.Struct('<I')
+FLAG_PRESENT = 1
+FLAG_SPLICE = 2
+FLAG_PASSAGES = 4
+FLAG_GZIP = 8
+GZIP_LEVEL = 6
+INDEX_NAME = 'index.bin'
+LOCK_NAME = '.lock'
+# 单个数据段文件的大小上限
+SEGMENT_MAX_BYTES = 1 << 30
+# 索引文件按100万条(16MB)为单位扩容, 未写入的部分为稀疏文件空洞, 不占用磁盘
+INDEX_GROW_ENTRIES = 1 << 20
+# 压缩时每次读取/改写的索引条数
+COMPACT_CHUNK_ENTRIES = 1 << 16
+# 数据段中被覆盖的旧记录超过该比例时压缩
+COMPACT_MIN_GARBAGE = 0.5
+# 基本信息中以字符串形式保存在BioC infons里的列表字段
+LIST_INFO_FIELDS = ['authors', 'keywords', 'refIds']
+# API返回文献时根据数据库填充的infons字段
+DYNAMIC_INFONS = ['article_id_pmc', 'article_id_pmid', 'if2020', 'citedNums', 'refNums', 'hasPMC', 'hasAnnotation']
+# 用于定位拼接位置的临时key, 序列化后为 "\u0000splice", 不会与正文内容冲突
+SPLICE_MARK = '\x00splice'
+# 序列化时代替段落列表的占位符
+PASSAGES_MARK = '\x00passages'
+
+
+def segment_name(segment):
+    return f'segment-{segment:05d}.dat'
+
+
+def doc_key(doc_id):
+    """PMID或PMC id转换为索引下标"""
+    doc_id = str(doc_id).strip()
+    return int(doc_id[3:] if doc_id.upper().startswith('PMC') else doc_id)
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def passage_section(passage):
+    """段落所属章节: PMC文献为section_type(TITLE/ABSTRACT/INTRO/METHODS...), PubMed文献为type(title/abstract)"""
+    infons = passage.get('infons') or {}
+    return str(infons.get('section_type') or infons.get('type') or '').lower()
+
+
+def gzip_member(data):
+    """gzip格式压缩(头部的修改时间为0, 相同的内容压缩结果相同)"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def serialize(document, compress=False):
+    """
+    文献序列化为存储记录, 每个段落单独序列化, 记录段落的起止位置
+    :param compress: 是否以gzip保存
+    :return: (flags, record)
+    """
+    passages = document.get('passages')
+    if not passages:
+        return FLAG_PRESENT, dumps(document)
+    infons = passages[0].get('infons') or {}
+    passages[0]['infons'] = OrderedDict([(SPLICE_MARK, 0)] + [(key, value) for key, value in infons.items()
+                                                              if key not in DYNAMIC_INFONS])
+    try:
+        chunks = [dumps(passage) for passage in passages]
+    finally:
+        passages[0]['infons'] = infons
+    marker = b'{' + dumps(SPLICE_MARK) + b':0'
+    splice = chunks[0].index(marker) + 1
+    end = splice + len(marker) - 1
+    if chunks[0][end:end + 1] == b',':
+        end += 1
+    chunks[0] = chunks[0][:splice] + chunks[0][end:]
+    document['passages'] = [PASSAGES_MARK]
+    try:
+        skeleton = dumps(document)
+    finally:
+        document['passages'] = passages
+    placeholder = dumps(PASSAGES_MARK)
+    start = skeleton.index(placeholder)
+    table, position = [], start
+    for passage, chunk in zip(passages, chunks):
+        table.append([position, position + len(chunk), passage_section(passage)])
+        position += len(chunk) + 1
+    data = skeleton[:start] + b','.join(chunks) + skeleton[start + len(placeholder):]
+    table = dumps(table)
+    flags, header = FLAG_PRESENT | FLAG_SPLICE | FLAG_PASSAGES, SPLICE_HEADER.pack(start + splice)
+    header += SPLICE_HEADER.pack(len(table)) + table
+    if compress:
+        head, tail = gzip_member(data[:start + splice]), gzip_member(data[start + splice:])
+        return flags | FLAG_GZIP, header + SPLICE_HEADER.pack(len(head)) + head + tail
+    return flags, header + data
+
+
+def record_json(flags, data):
+    """存储记录中的JSON部分"""
+    start = SPLICE_HEADER.size if flags & FLAG_SPLICE else 0
+    if flags & FLAG_PASSAGES:
+        start += SPLICE_HEADER.size + SPLICE_HEADER.unpack_from(data, start)[0]
+    if flags & FLAG_GZIP:
+        split = start + SPLICE_HEADER.size + SPLICE_HEADER.unpack_from(data, start)[0]
+        start += SPLICE_HEADER.size
+        return zlib.decompress(data[start:split], 16 + zlib.MAX_WBITS) + \
+            zlib.decompress(data[split:], 16 + zlib.MAX_WBITS)
+    return data[start:]
+
+
+def parse_infos(infons):
+    """BioC第一个段落的infons转换为文献基本信息(列表字段由字符串还原)"""
+    infos = dict(infons)
+    for field in LIST_INFO_FIELDS:
+        if isinstance(infos.get(field, '[]'), str):
+            infos[field] = literal_eval(infos.get(field) or '[]')
+    return infos
+
+
+class DocumentStore(object):
+    def __init__(self, root, compress=False):
+        """
+        :param compress: 新写入的记录是否以gzip保存
+        """
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.compress = compress
+
+    def _read_entry(self, key):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = os.pread(f.fileno(), ENTRY.size, key * ENTRY.size)
+        except OSError:
+            return None
+        if len(data) < ENTRY.size:
+            return None
+        segment, flags, length, offset = ENTRY.unpack(data)
+        return (segment, flags, length, offset) if flags & FLAG_PRESENT else None
+
+    def contains(self, doc_id):
+        return self._read_entry(doc_key(doc_id)) is not None
+
+    def get(self, doc_id):
+        """读取文献BioC Json, 不存在时返回None"""
+        entry = self._read_entry(doc_key(doc_id))
+        if entry is None:
+            return None
+        segment, flags, length, offset = entry
+        with open(os.path.join(self.root, segment_name(segment)), 'rb') as f:
+            data = os.pread(f.fileno(), length, offset)
+        return json.loads(record_json(flags, data).decode('utf-8'))
+
+    def put(self, doc_id, document, infos=None):
+        self.put_many([(doc_id, document, infos)])
+
+    def put_many(self, items):
+        """
+        批量写入文献, 一次加锁
+        :param items: [(doc_id, BioC Json dict, 需要合并到第一个段落infons的基本信息或None)]
+        """
+        records = []
+        for doc_id, document, infos in items:
+            if infos and document.get('passages'):
+                document['passages'][0]['infons'].update(infos)
+            records.append((doc_key(doc_id),) + serialize(document, self.compress))
+        if not records:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                entries = self._append(records)
+                self._write_index(entries)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, records):
+        """先写数据段, 全部写入后再改写索引, 读取方不会读到写了一半的记录"""
+        segments = [int(name[8:13]) for name in os.listdir(self.root) if name.startswith('segment-')]
+        segment = max(segments) if segments else 0
+        entries = []
+        f = open(os.path.join(self.root, segment_name(segment)), 'ab')
+        try:
+            for key, flags, data in records:
+                offset = f.tell()
+                if offset and offset + len(data) > SEGMENT_MAX_BYTES:
+                    f.close()
+                    segment += 1
+                    f = open(os.path.join(self.root, segment_name(segment)), 'ab')
+                    offset = 0
+                f.write(data)
+                entries.append((key, ENTRY.pack(segment, flags, len(data), offset)))
+        finally:
+            f.close()
+        return entries
+
+    def _write_index(self, entries):
+        size = (max(key for key, _ in entries) + 1) * ENTRY.size
+        fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                grow = INDEX_GROW_ENTRIES * ENTRY.size
+                os.ftruncate(fd, -(-size // grow) * grow)
+            for key, entry in entries:
+                os.pwrite(fd, entry, key * ENTRY.size)
+        finally:
+            os.close(fd)
+
+    def upgrade(self, batch_size=1000):
+        """
+        没有段落表的旧记录, 以及压缩方式与compress选项不同的记录重新序列化写入
+        :return: 更新的文献数
+        """
+        keys = []
+        try:
+            with open(self.index_path, 'rb') as f:
+                key = 0
+                while True:
+                    data = f.read(ENTRY.size * 65536)
+                    if not data:
+                        break
+                    for _, flags, _, _ in ENTRY.iter_unpack(data):
+                        if flags & FLAG_PRESENT and flags & FLAG_SPLICE and \
+                                (not flags & FLAG_PASSAGES or bool(flags & FLAG_GZIP) != self.compress):
+                            keys.append(key)
+                        key += 1
+        except OSError:
+            return 0
+        total = 0
+        for i in range(0, len(keys), batch_size):
+            documents = [(key, self.get(key)) for key in keys[i:i + batch_size]]
+            documents = [(key, document, None) for key, document in documents if document is not None]
+            self.put_many(documents)
+            total += len(documents)
+        return total
+
+    def update_infos(self, doc_id, infos):
+        """已存在的PubMed文献只更新基本信息"""
+        return not self.update_infos_many([(doc_id, infos)])
+
+    def update_infos_many(self, items):
+        """
+        已存在的PubMed文献批量更新基本信息, 一次加锁写入
+        :param items: [(doc_id, 基本信息)]
+        :return: 不存在的doc_id列表
+        """
+        documents, missing = [], []
+        for doc_id, infos in items:
+            document = self.get(doc_id)
+            if document is None:
+                missing.append(doc_id)
+            else:
+                documents.append((doc_id, document, infos))
+        self.put_many(documents)
+        return missing
+
+    def segments(self):
+        return sorted(int(name[8:13]) for name in os.listdir(self.root) if name.startswith('segment-'))
+
+    def _index_chunks(self, fd):
+        """按COMPACT_CHUNK_ENTRIES条读取索引: (起始下标, 索引条目数组)"""
+        size = os.fstat(fd).st_size // ENTRY.size
+        for start in range(0, size, COMPACT_CHUNK_ENTRIES):
+            count = min(COMPACT_CHUNK_ENTRIES, size - start)
+            data = os.pread(fd, count * ENTRY.size, start * ENTRY.size)
+            yield start, np.frombuffer(data, dtype=ENTRY_DTYPE).copy()
+
+    def compact(self, min_garbage=COMPACT_MIN_GARBAGE):
+        """
+        文献更新时旧记录留在数据段中, 旧记录超过min_garbage时把有效记录复制到新的数据段,
+        逐段改写索引(每个索引条目都指向完整的记录, API读取不受影响), 最后删除旧的数据段
+        :return: 回收的字节数, 不需要压缩时返回0
+        """
+        if not os.path.exists(self.index_path):
+            return 0
+        with open(os.path.join(self.root, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                return self._compact(min_garbage)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _compact(self, min_garbage):
+        old_segments = self.segments()
+        total = sum(os.path.getsize(os.path.join(self.root, segment_name(segment))) for segment in old_segments)
+        index_fd = os.open(self.index_path, os.O_RDWR)
+        segment_fds = {}
+        try:
+            live = sum(int(entries['length'][entries['flags'] & FLAG_PRESENT != 0].sum())
+                       for _, entries in self._index_chunks(index_fd))
+            if not total or (total - live) / total < min_garbage:
+                return 0
+            for segment in old_segments:
+                segment_fds[segment] = os.open(os.path.join(self.root, segment_name(segment)), os.O_RDONLY)
+            segment = old_segments[-1] + 1
+            f = open(os.path.join(self.root, segment_name(segment)), 'ab')
+            try:
+                for start, entries in self._index_chunks(index_fd):
+                    positions = np.flatnonzero(entries['flags'] & FLAG_PRESENT)
+                    if not len(positions):
+                        continue
+                    for position in positions.tolist():
+                        length, offset = int(entries['length'][position]), int(entries['offset'][position])
+                        data = os.pread(segment_fds[int(entries['segment'][position])], length, offset)
+                        if f.tell() and f.tell() + length > SEGMENT_MAX_BYTES:
+                            f.close()
+                            segment += 1
+                            f = open(os.path.join(self.root, segment_name(segment)), 'ab')
+                        entries['segment'][position], entries['offset'][position] = segment, f.tell()
+                        f.write(data)
+                    # 记录写入后再改写这一段索引
+                    f.flush()
+                    os.fsync(f.fileno())
+                    os.pwrite(index_fd, entries.tobytes(), start * ENTRY.size)
+            finally:
+                f.close()
+        finally:
+            os.close(index_fd)
+            for fd in segment_fds.values():
+                os.close(fd)
+        # 已映射旧数据段的API进程在解除映射前仍可以读取, 删除文件不影响
+        for old_segment in old_segments:
+            os.remove(os.path.join(self.root, segment_name(old_segment)))
+        return total - live
+
+
+stores = {}
+
+
+def get_document_store(resource):
+    """
+    :param resource: PUBMED/PMC
+    """
+    if resource not in stores:
+        global_setting = pub_miner.get_global_settings(True)
+        BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
+        stores[resource] = DocumentStore(os.path.join(BioCPath, 'STORE', resource),
+                                         compress=bool(global_setting["upload"].get("compress-documents")))
+    return stores[resource]
+
+
+def legacy_json_path(resource, doc_id):
+    """打包存储之前每篇文献单独保存的json文件路径"""
+    global_setting = pub_miner.get_global_settings(True)
+    BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
+    key = doc_key(doc_id)
+    psd = str(-(-key // 10000))
+    return os.path.join(BioCPath, resource, psd[-1], psd, f'{"PMC" if resource == "PMC" else ""}{key}.json')
+
+
+def document_exists(resource, doc_id):
+    """文献是否已保存(打包存储或旧的json文件)"""
+    return get_document_store(resource).contains(doc_id) or os.path.exists(legacy_json_path(resource, doc_id))
+
+
+def update_document_infos(resource, doc_id, infos):
+    """更新已保存文献的基本信息, 旧的json文件在更新时迁移到打包存储"""
+    return not update_documents_infos(resource, [(doc_id, infos)])
+
+
+def update_documents_infos(resource, items):
+    """
+    批量更新已保存文献的基本信息, 打包存储和旧的json文件中的文献各一次加锁写入
+    :param items: [(doc_id, 基本信息)]
+    :return: 没有保存的doc_id列表
+    """
+    store = get_document_store(resource)
+    infos = dict(items)
+    legacy, missing = [], []
+    for doc_id in store.update_infos_many(items):
+        json_path = legacy_json_path(resource, doc_id)
+        if not os.path.exists(json_path):
+            missing.append(doc_id)
+            continue
+        with open(json_path, 'r', encoding='utf-8') as f:
+            legacy.append((doc_id, json.load(f), infos[doc_id]))
+    store.put_many(legacy)
+    return missing
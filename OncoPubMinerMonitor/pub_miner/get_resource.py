@@ -16,9 +16,8 @@ import glob
 import json
 import time
 
-from Bio import Entrez
-
 import pub_miner
+from pub_miner.eutils import get_eutils_client
 
 
 def eutilsData(db, document_id):
@@ -28,13 +27,7 @@ def eutilsData(db, document_id):
     :param document_id: 指定id
     :return:
     """
-    # Entrez.email = "jlever@bcgsc.ca"  # Always tell NCBI who you are
-    Entrez.email = "2571032993@qq.com"  # Always tell NCBI who you are
-    handle = Entrez.efetch(db=db, id=document_id, rettype="gb", retmode="xml")
-    xml_data = handle.read()
-    if isinstance(xml_data, bytes):
-        xml_data = xml_data.decode('utf-8')
-    return xml_data
+    return get_eutils_client().efetch(db, [document_id], rettype="gb", retmode="xml")[0].decode('utf-8')
 
 
 def calcSHA256(filename):
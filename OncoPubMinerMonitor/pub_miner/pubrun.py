@@ -195,6 +195,10 @@ def pub_run():
     pub_miner.splitBioC2ToolsDir(resName, toolsInfo)
     pub_miner.Config.Logger.info(f"Running update_database_base_info {resName}")
     pub_miner.update_pub_base_info(resName)
+    pub_miner.Config.Logger.info("Running sync_refreshed_citations")
+    pub_miner.sync_refreshed_citations()
+    pub_miner.Config.Logger.info(f"Running compact_document_store {resName}")
+    pub_miner.compact_document_store(resName)
     pub_miner.Config.Logger.info(f"Running NER {resName}")
     pool_list = []
     for task_name in ['gene_ner', 'mutation_ner', 'disease_ner', 'chemical_ner', 'merger']:
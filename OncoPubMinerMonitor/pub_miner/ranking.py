@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 00:10
+# @File : ranking.py
+# @Project : OncoPubMinerMonitor
+"""
+实体倒排表的预排序结果: 按年份/被引用数/影响因子倒序的前N篇PMID(相同时PMID倒序)
+
+与 OncoPubMinerAPI/ranking.py 保持一致, 保存在library_pubmed_sort_info/mention_pubmed_sort_info表的orderings字段,
+排序值从PMID列(columns.py)读取, API按sort参数直接取第一页, 不需要对整个倒排表排序。
+
+    header:    magic(2s) version(B) orderings(B) length(I)    length为生成时倒排表的文献数, API据此判断是否过期
+    directory: orderings * [sort(B) reserved(3x) count(I)]   sort为SORTS中的下标
+    data:      按目录顺序, 每个排序count * uint32 PMID
+
+倒排表不变时length不能反映排序值的变化, PMID列中的被引用数等更新后由update_database.refresh_orderings重新生成。
+"""
+import struct
+
+import numpy as np
+
+MAGIC = b'SO'
+VERSION = 1
+HEADER = struct.Struct('<2sBBI')
+ENTRY = struct.Struct('<B3xI')
+SORTS = ['year', 'cited', 'if']
+SORT_COLUMNS = {'year': 'year', 'cited': 'cited_num', 'if': 'impact_factor'}
+# 每种排序保存的PMID个数
+ORDERING_SIZE = 1000
+# 文献数少于该值的倒排表在查询时排序即可, 不生成预排序结果
+ORDERING_MIN_LENGTH = 1000
+
+
+def sort_keys(columns, pub_ids, sort):
+    """倒序排列的键: 高32位为排序列的值(影响因子保留3位小数), 低32位为PMID"""
+    values = columns.get(SORT_COLUMNS[sort], pub_ids)
+    if sort == 'if':
+        values = np.round(values.astype(np.float64) * 1000)
+    return (values.astype(np.int64) << 32) | pub_ids.astype(np.int64)
+
+
+def rank(pub_ids, columns, size=ORDERING_SIZE):
+    """
+    :param pub_ids: PMID数组
+    :param columns: PMIDColumns
+    :return: {sort: 倒序排列的前size个PMID}
+    """
+    pub_ids = np.asarray(pub_ids, dtype=np.uint32)
+    orderings = {}
+    for sort in SORTS:
+        keys = -sort_keys(columns, pub_ids, sort)
+        if size < len(pub_ids):
+            positions = np.argpartition(keys, size - 1)[:size]
+        else:
+            positions = np.arange(len(pub_ids))
+        orderings[sort] = pub_ids[positions[np.argsort(keys[positions])]]
+    return orderings
+
+
+def encode(orderings, length):
+    """
+    :param orderings: {sort: PMID数组}
+    :param length: 倒排表的文献数
+    """
+    sorts = [sort for sort in SORTS if sort in orderings]
+    directory = b''.join(ENTRY.pack(SORTS.index(sort), len(orderings[sort])) for sort in sorts)
+    data = b''.join(np.asarray(orderings[sort], dtype='<u4').tobytes() for sort in sorts)
+    return HEADER.pack(MAGIC, VERSION, len(sorts), length) + directory + data
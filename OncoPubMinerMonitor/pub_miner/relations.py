@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# @Time : 2026/10/19 01:40
+# @File : relations.py
+# @Project : OncoPubMinerMonitor
+"""
+标准库共现矩阵, 数据来自 *_relationship 表(两两共现)和three_library_relationship表(三个标准库共现)
+
+与 OncoPubMinerAPI/relations.py 使用同一种格式, Monitor全量生成, API通过mmap只读:
+    <local-directory>/RELATIONS/relations.bin
+
+    header:  magic(2s) version(B) reserved(B) rows(I) nnz(Q) triples(Q)
+    indptr:  (rows + 1) * uint64        CSR行指针, 行号为标准库id
+    indices: nnz * uint32               共现的标准库id, 行内升序
+    counts:  nnz * uint32               共现次数
+    triples: a, b, c, count 四个 triples * uint32 数组   a < b, c为第三个标准库, 按(a, b, c)升序
+
+两两共现按标准库id保存为对称的稀疏矩阵, 一个标准库的共现标准库是indices中连续的一段;
+三个标准库的共现对每个组合保存三条记录(任意两个标准库作为a, b), 按(a, b)二分查找即可得到第三个标准库。
+生成后写入临时文件再整体替换, API根据文件的inode/修改时间重新映射。
+"""
+import os
+import struct
+
+import numpy as np
+
+import pub_miner
+
+MAGIC = b'RM'
+VERSION = 1
+HEADER = struct.Struct('<2sBBIQQ')
+TRIPLE_DTYPE = np.dtype([('a', '<u4'), ('b', '<u4'), ('c', '<u4'), ('count', '<u4')])
+FILE_NAME = 'relations.bin'
+# 两两共现表: (表名, 第一个标准词字段, 类型, 第二个标准词字段, 类型), 类型 0: 基因 1: 癌种 2: 化合物
+PAIR_TABLES = [
+    ('gene_cancer_relationship', 'gene', 0, 'cancer', 1),
+    ('gene_chemical_relationship', 'gene', 0, 'chemical', 2),
+    ('cancer_chemical_relationship', 'cancer', 1, 'chemical', 2),
+    ('gene_gene_relationship', 'gene_1', 0, 'gene_2', 0),
+    ('cancer_cancer_relationship', 'cancer_1', 1, 'cancer_2', 1),
+    ('chemical_chemical_relationship', 'chemical_1', 2, 'chemical_2', 2),
+]
+
+
+def sum_duplicates(keys, counts):
+    """相同key的计数相加, 返回按key升序去重后的(keys, counts)"""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.uint64)
+
+
+def build_pairs(a, b, counts):
+    """
+    两两共现转换为对称的CSR矩阵
+    :return: (indptr, indices, counts)
+    """
+    a, b, counts = (np.asarray(values, dtype=np.int64) for values in (a, b, counts))
+    keep = a != b
+    a, b, counts = a[keep], b[keep], counts[keep]
+    rows = np.concatenate((a, b))
+    columns = np.concatenate((b, a))
+    keys, counts = sum_duplicates((rows << 32) | columns, np.concatenate((counts, counts)))
+    rows, columns = keys >> 32, keys & 0xFFFFFFFF
+    indptr = np.zeros(int(rows.max()) + 2 if len(rows) else 1, dtype='<u8')
+    np.cumsum(np.bincount(rows, minlength=len(indptr) - 1), out=indptr[1:])
+    return indptr, columns.astype('<u4'), np.minimum(counts, 0xFFFFFFFF).astype('<u4')
+
+
+def build_triples(a, b, c, counts):
+    """三个标准库的共现, 每个组合展开为三条(a < b, c)记录"""
+    ids = np.sort(np.stack([np.asarray(values, dtype=np.int64) for values in (a, b, c)], axis=1), axis=1)
+    counts = np.asarray(counts, dtype=np.int64)
+    keep = (ids[:, 0] != ids[:, 1]) & (ids[:, 1] != ids[:, 2])
+    ids, counts = ids[keep], counts[keep]
+    if not len(ids):
+        return np.zeros(0, dtype=TRIPLE_DTYPE)
+    rotations = np.concatenate((ids[:, [0, 1, 2]], ids[:, [0, 2, 1]], ids[:, [1, 2, 0]]))
+    counts = np.concatenate((counts, counts, counts))
+    order = np.lexsort((rotations[:, 2], rotations[:, 1], rotations[:, 0]))
+    rotations, counts = rotations[order], counts[order]
+    # 相同(a, b, c)的计数相加
+    starts = np.concatenate(([0], np.flatnonzero((np.diff(rotations, axis=0) != 0).any(axis=1)) + 1))
+    triples = np.zeros(len(starts), dtype=TRIPLE_DTYPE)
+    triples['a'], triples['b'], triples['c'] = rotations[starts, 0], rotations[starts, 1], rotations[starts, 2]
+    triples['count'] = np.minimum(np.add.reduceat(counts, starts), 0xFFFFFFFF)
+    return triples
+
+
+def write_relations(path, indptr, indices, counts, triples):
+    """写入临时文件后整体替换"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(indptr) - 1, len(indices), len(triples)))
+        for array in (indptr, indices, counts) + tuple(triples[field] for field in TRIPLE_DTYPE.names):
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def get_relations_path():
+    global_setting = pub_miner.get_global_settings(True)
+    BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
+    return os.path.join(BioCPath, 'RELATIONS', FILE_NAME)
@@ -5,38 +5,29 @@
 import math
 import os
 import shutil
+import tempfile
 import time
 from ast import literal_eval
 
 import bioc
+import numpy as np
 
 import pub_miner
+from pub_miner import ranking, relations
 
-
-def makeDirs(resource):
-    """
-    生成指定目录
-    :param resource: PUBMED/PMC
-    :return:
-    """
-    global_setting = pub_miner.get_global_settings(True)
-    # 最终NER生成的BioC的存放路径
-    BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
-    resourceBioCPath = os.path.join(BioCPath, resource)
-    if not os.path.isdir(resourceBioCPath):
-        os.makedirs(resourceBioCPath)
-
-    resourceInfoDir = 'PUBMED_INFOS'
-    resourceBioCInfoPath = os.path.join(BioCPath, resourceInfoDir)
-    if resource == 'PUBMED':
-        if not os.path.isdir(resourceBioCInfoPath):
-            os.makedirs(resourceBioCInfoPath)
-    return resourceBioCPath, resourceBioCInfoPath
+# 预排序结果: 倒排表, 排序表, 实体ID字段
+ORDERING_TABLES = {
+    'library': ('library_pubmed', 'library_pubmed_sort_info', 'library_id'),
+    'mention': ('mention_pubmed', 'mention_pubmed_sort_info', 'mention_id'),
+}
 
 
 def update_pub_med_info(PubMedBioCFilePath, deleteBioC=True):
     """PubMed基本信息上传Mysql数据库"""
-    resourceBioCPath, resourceBioCInfoPath = makeDirs('PUBMED')
+    store = pub_miner.get_document_store('PUBMED')
+    # 新文献BioC数据(合并基本信息后)批量写入打包存储
+    batch_new_documents = []
+    batch_update_infos = []
     # 获取数据库中所有杂志名和杂志id
     db = pub_miner.PubMinerDB()
     journals = {journal[1].lower(): journal[0] for journal in
@@ -103,13 +94,13 @@ def update_pub_med_info(PubMedBioCFilePath, deleteBioC=True):
         new_pub_data = [pub_title, pub_authors, journal_iso or journal, year, str(pid)]
         pub_data = [pmc_id, doi, journal_id, year, pub_keywords, has_abstract, psd, pmc_second_dir, int(pid)]
         ref_data = ['|'.join(set(refs)), len(set(refs)), pid]
+        # PubMed基本信息
+        document_infos['keywords'] = literal_eval(document_infos.get('keywords', '[]'))
+        document_infos['authors'] = literal_eval(document_infos.get('authors', '[]'))
+        document_infos['refIds'] = refs
         # 在数据表中插入或者更新一条数据
         if is_new:
-            dir_path = os.path.join(resourceBioCPath, f'{psd[-1]}/{psd}')
-            if not os.path.exists(dir_path):
-                os.makedirs(dir_path)
-            BioCDocJsonFilePath = os.path.join(resourceBioCPath, f'{psd[-1]}/{psd}/{pid}.json')
-            pub_miner.save_json_data(BioCDocJsonFilePath, bioc.toJSON(document))
+            batch_new_documents.append((pid, bioc.toJSON(document), None))
             batch_insert_pubs.append(pub_data)
             batch_insert_new_pubs.append([int(time.time()), '1'] + new_pub_data)
             batch_insert_ref_pubs.append(ref_data)
@@ -117,12 +108,8 @@ def update_pub_med_info(PubMedBioCFilePath, deleteBioC=True):
             batch_update_pubs.append(pub_data)
             batch_update_new_pubs.append([int(time.time()), '0'] + new_pub_data)
             batch_update_ref_pubs.append(ref_data)
-        # 保存PubMed基本信息
-        PubMedInfoJsonFilePath = os.path.join(resourceBioCInfoPath, f'{psd[-1]}/{psd}/{pid}.json')
-        document_infos['keywords'] = literal_eval(document_infos.get('keywords', '[]'))
-        document_infos['authors'] = literal_eval(document_infos.get('authors', '[]'))
-        document_infos['refIds'] = refs
-        pub_miner.save_json_data(PubMedInfoJsonFilePath, document_infos)
+            # 已有文献只更新基本信息
+            batch_update_infos.append((pid, document_infos))
         if refs:
             pid_str = str(pid)
             for pub_id in refs:
@@ -131,6 +118,8 @@ def update_pub_med_info(PubMedBioCFilePath, deleteBioC=True):
                         cited_by_infos[pub_id].append(pid_str)
                 else:
                     cited_by_infos[pub_id] = [pid_str]
+    store.put_many(batch_new_documents)
+    pub_miner.update_documents_infos('PUBMED', batch_update_infos)
     statistic_time = time.time()
     pub_miner.Config.Logger.info(f'upload PubMed: {len(batch_update_pubs)} PubMed data items to be updated and '
                                  f'{len(batch_insert_pubs)} PubMed data items to be created')
@@ -153,6 +142,16 @@ def update_pub_med_info(PubMedBioCFilePath, deleteBioC=True):
     # 更新文献被引用信息
     for pub_id, citedIds in cited_by_infos.items():
         db.insert_or_update_cite_cited_similar_table(int(pub_id), citedIds, field='cited')
+    # 引用/被引用信息有变化的文献同步到引用关系图, 以数据库中合并后的结果为准
+    changed_pub_ids = {int(ref_data[-1]) for ref_data in batch_insert_ref_pubs + batch_update_ref_pubs}
+    changed_pub_ids = list(changed_pub_ids | {int(pub_id) for pub_id in cited_by_infos})
+    for i in range(0, len(changed_pub_ids), 10000):
+        pub_miner.save_citation_rows(db.search_citation_rows_by_pub_ids(changed_pub_ids[i:i + 10000]))
+    # 基本信息或被引用数有变化的文献同步到PMID列
+    for i in range(0, len(changed_pub_ids), 10000):
+        pub_miner.save_column_rows(db.search_column_rows_by_pub_ids(changed_pub_ids[i:i + 10000]))
+    # 被引用数变化后, 包含这些文献的实体的预排序结果需要重新生成
+    refresh_orderings(db, changed_pub_ids)
     db.close()
     pub_miner.Config.Logger.info(f'takes time to upload PubMed data: {time.time() - statistic_time}')
     # 是否删除源文件
@@ -162,7 +161,7 @@ def update_pub_med_info(PubMedBioCFilePath, deleteBioC=True):
 
 def update_pmc_info(PMCBioCDirPath, deleteBioC=True):
     """PMC基本信息上传Mysql数据库"""
-    resourceBioCPath, _ = makeDirs('PMC')
+    store = pub_miner.get_document_store('PMC')
     db = pub_miner.PubMinerDB()
     new_pmc = 0
     for BioCXmlFile in os.listdir(PMCBioCDirPath):
@@ -187,17 +186,10 @@ def update_pmc_info(PMCBioCDirPath, deleteBioC=True):
             # PMC文献基本数据
             pub_data = [pub_title, pub_authors, journal_iso or journal, year, str(pid)]
 
-            # 计算当前PMC数据的存储目录
-            psd = str(math.ceil(int(pid[3:]) / 10000))
-            # PMC BioC数据的存储路径
-            dest_dir_path = os.path.join(resourceBioCPath, f'{psd[-1]}/{psd}')
-            if not os.path.isdir(dest_dir_path):
-                os.makedirs(dest_dir_path, exist_ok=True)
-            dest_path = os.path.join(dest_dir_path, f'{pid}.json')
-            # 如果当前PMC数据不存在，保存BioC数据到存储路径用于查询并更新new pub数据表信息，否则只更新new pub数据表信息
-            if not os.path.exists(dest_path):
+            # 如果当前PMC数据不存在，保存BioC数据到打包存储用于查询并更新new pub数据表信息，否则只更新new pub数据表信息
+            if not pub_miner.document_exists('PMC', pid):
                 db.insert_new_pub_info([int(time.time()), '1'] + pub_data)
-                pub_miner.save_json_data(dest_path, bioc.toJSON(document))
+                store.put(pid, bioc.toJSON(document))
                 new_pmc += 1
             else:
                 db.update_new_pub_info([int(time.time()), '0'] + pub_data)
@@ -282,10 +274,20 @@ def update_pub_ner_result(resource, second_dir):
     db = pub_miner.PubMinerDB()
     # 批量更新pub基本信息（是否是癌症文献）
     db.batch_update_pub_med_is_cancer(list(pubs_infos.values()))
+    pub_ids = [pub_id for _, pub_id in pubs_infos.values()]
+    for i in range(0, len(pub_ids), 10000):
+        pub_miner.save_column_rows(db.search_column_rows_by_pub_ids(pub_ids[i:i + 10000]))
     for library_id, pubs in library_pub.items():
         db.insert_or_update_library_pub(library_id, pubs)
+    update_orderings(db, 'library', list(library_pub))
+    # 每篇文献关联的标准库, 用于API的分面统计
+    pub_libraries = {int(pub_id): set() for pub_id in pubs_infos}
+    for library_id, pubs in library_pub.items():
+        for pub_id in pubs:
+            pub_libraries[int(pub_id)].add(library_id)
+    pub_miner.save_library_rows(list(pub_libraries.items()), merge=True)
     mention_id_dict = {mention.lower(): mention_id for mention, mention_id in db.search_mentions('mention', 'id')}
-
+    mention_ids = set()
     for mention, pubs in mention_pub.items():
         if mention.lower() in mention_id_dict:
             mention_id = mention_id_dict[mention.lower()]
@@ -295,11 +297,325 @@ def update_pub_ner_result(resource, second_dir):
             mention_id = result[0]
             mention_id_dict[mention.lower()] = mention_id
         db.insert_or_update_mention_pub(mention_id, pubs)
+        mention_ids.add(mention_id)
+    update_orderings(db, 'mention', list(mention_ids))
+    # 通知API倒排表已更新
+    db.update_stat_posting_version()
     db.close()
     shutil.rmtree(resourceResultDir)
     pub_miner.Config.Logger.info(f'update pub ner result finished')
 
 
+def update_posting_lists(table_name='library_pubmed', batch_size=1000):
+    """为旧数据(只有 | 隔开的pubmeds文本)补充生成二进制倒排表"""
+    db = pub_miner.PubMinerDB()
+    last_id, total = 0, 0
+    while True:
+        rows = db.search_text_postings(table_name, last_id, batch_size)
+        if not rows:
+            break
+        batch_data = [[pub_miner.posting.encode(pub_miner.posting.parse_text(pubmeds)), row_id]
+                      for row_id, pubmeds in rows]
+        db.batch_update_postings(table_name, batch_data)
+        last_id = rows[-1][0]
+        total += len(rows)
+    db.close()
+    pub_miner.Config.Logger.info(f'update {table_name} postings finished, total: {total}')
+
+
+def save_orderings(db, kind, rows):
+    """
+    根据倒排表生成按年份/被引用数/影响因子倒序的预排序结果, 写入*_sort_info表
+    :param rows: [(实体ID, 二进制倒排表)]
+    """
+    if not rows:
+        return
+    _, sort_table, id_column = ORDERING_TABLES[kind]
+    columns = pub_miner.get_pmid_columns()
+    batch_data = []
+    for entity_id, postings in rows:
+        pub_ids = pub_miner.posting.decode(postings)
+        batch_data.append([entity_id, ranking.encode(ranking.rank(pub_ids, columns), len(pub_ids))])
+    db.batch_save_orderings(sort_table, id_column, batch_data)
+
+
+def update_orderings(db, kind, entity_ids, batch_size=1000):
+    """倒排表更新后重新生成这些实体的预排序结果"""
+    posting_table, _, id_column = ORDERING_TABLES[kind]
+    for i in range(0, len(entity_ids), batch_size):
+        save_orderings(db, kind, db.search_postings_by_ids(posting_table, id_column, entity_ids[i:i + batch_size],
+                                                           ranking.ORDERING_MIN_LENGTH))
+
+
+def refresh_orderings(db, pub_ids, batch_size=1000):
+    """
+    PMID列中的排序值(被引用数/影响因子等)变化后, 重新生成倒排表包含这些文献的实体的预排序结果
+    只有文献数不少于ORDERING_MIN_LENGTH的实体有预排序结果, 按批读取这些倒排表判断; 有更新时通知API清空缓存
+    """
+    changed = np.unique(np.asarray(pub_ids, dtype=np.uint32))
+    if not len(changed):
+        return
+    refreshed = 0
+    for kind, (posting_table, _, id_column) in ORDERING_TABLES.items():
+        last_id, total = 0, 0
+        while True:
+            rows = db.search_postings(posting_table, id_column, last_id, batch_size, ranking.ORDERING_MIN_LENGTH)
+            if not rows:
+                break
+            rows_changed = [(entity_id, postings) for entity_id, postings in rows
+                            if pub_miner.posting.contains(pub_miner.posting.decode(postings), changed).any()]
+            save_orderings(db, kind, rows_changed)
+            last_id = rows[-1][0]
+            total += len(rows_changed)
+        refreshed += total
+        pub_miner.Config.Logger.info(f'refresh {kind} orderings finished, total: {total}')
+    if refreshed:
+        db.update_stat_posting_version()
+
+
+def build_entity_orderings(kind='library', batch_size=1000):
+    """
+    全量生成library/mention的预排序结果, 需要先生成PMID列(build_pmid_columns)
+    首次部署时执行, 之后定期执行以更新被引用数和影响因子的变化
+    """
+    posting_table, _, id_column = ORDERING_TABLES[kind]
+    db = pub_miner.PubMinerDB()
+    last_id, total = 0, 0
+    while True:
+        rows = db.search_postings(posting_table, id_column, last_id, batch_size, ranking.ORDERING_MIN_LENGTH)
+        if not rows:
+            break
+        save_orderings(db, kind, rows)
+        last_id = rows[-1][0]
+        total += len(rows)
+    db.close()
+    pub_miner.Config.Logger.info(f'build {kind} orderings finished, total: {total}')
+
+
+def build_library_graph(batch_size=1000, pmid_range=10000000):
+    """
+    根据library_pubmed的倒排表全量生成GRAPH/library(每篇文献关联的标准库id)
+    只读取一遍倒排表, (PMID, 标准库id)按PMID范围写入临时文件, 再逐个范围排序转置,
+    内存中只保留一个范围内的数据
+    """
+    db = pub_miner.PubMinerDB()
+    total = 0
+    # 临时文件与引用关系图放在同一目录下, 全部倒排表的大小可能超过/tmp的容量
+    graph_dir = os.path.dirname(pub_miner.get_citation_graph('library').root)
+    os.makedirs(graph_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=graph_dir) as spill_dir:
+        spill_files = {}
+        try:
+            last_id = 0
+            while True:
+                rows = db.search_postings('library_pubmed', 'library_id', last_id, batch_size)
+                if not rows:
+                    break
+                pub_ids = [pub_miner.posting.decode(postings) for _, postings in rows]
+                pairs = np.empty((sum(len(array) for array in pub_ids), 2), dtype='<u4')
+                pairs[:, 0] = np.concatenate(pub_ids)
+                pairs[:, 1] = np.repeat([library_id for library_id, _ in rows], [len(array) for array in pub_ids])
+                ranges = pairs[:, 0] // pmid_range
+                for pmid_start in np.unique(ranges).tolist():
+                    if pmid_start not in spill_files:
+                        spill_files[pmid_start] = open(os.path.join(spill_dir, f'{pmid_start}.bin'), 'wb')
+                    spill_files[pmid_start].write(pairs[ranges == pmid_start].tobytes())
+                last_id = rows[-1][0]
+        finally:
+            for f in spill_files.values():
+                f.close()
+        for pmid_start in sorted(spill_files):
+            pairs = np.fromfile(os.path.join(spill_dir, f'{pmid_start}.bin'), dtype='<u4').reshape(-1, 2)
+            pub_ids, library_ids = pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64)
+            del pairs
+            order = np.lexsort((library_ids, pub_ids))
+            pub_ids, library_ids = pub_ids[order], library_ids[order]
+            bounds = np.flatnonzero(np.diff(pub_ids)) + 1
+            keys = pub_ids[np.concatenate(([0], bounds))].tolist()
+            groups = [group.tolist() for group in np.split(library_ids, bounds)]
+            for i in range(0, len(keys), 10000):
+                pub_miner.save_library_rows(list(zip(keys[i:i + 10000], groups[i:i + 10000])))
+            total += len(keys)
+    db.close()
+    pub_miner.Config.Logger.info(f'build library graph finished, total: {total}')
+
+
+def build_relation_matrix(batch_size=10000):
+    """
+    根据 *_relationship 和three_library_relationship表全量生成标准库共现矩阵(RELATIONS/relations.bin)
+    关联表中的标准词按(类型, 小写symbol)对应到library表的id, 对应不到的记录跳过
+    """
+    db = pub_miner.PubMinerDB()
+    library_ids = {}
+    for library_id, symbol, label in db.search_table_data('library', fields=['id', 'symbol', 'label']) or []:
+        if symbol:
+            library_ids.setdefault((label, symbol.strip().lower()), library_id)
+
+    def lookup(label, symbol):
+        return library_ids.get((label, symbol.strip().lower())) if symbol else None
+
+    def scan(table_name, fields):
+        last_id = 0
+        while True:
+            rows = db.search_relation_rows(table_name, fields, last_id, batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[1:]
+            last_id = rows[-1][0]
+
+    pairs, triples, skipped = [], [], 0
+    for table_name, field_1, label_1, field_2, label_2 in relations.PAIR_TABLES:
+        for symbol_1, symbol_2, num in scan(table_name, [field_1, field_2, 'num']):
+            ids = (lookup(label_1, symbol_1), lookup(label_2, symbol_2))
+            if all(ids):
+                pairs.append(ids + (num or 0,))
+            else:
+                skipped += 1
+    fields = ['library_1', 'label_1', 'library_2', 'label_2', 'library_3', 'label_3', 'num']
+    for symbol_1, label_1, symbol_2, label_2, symbol_3, label_3, num in scan('three_library_relationship', fields):
+        ids = (lookup(label_1, symbol_1), lookup(label_2, symbol_2), lookup(label_3, symbol_3))
+        if all(ids):
+            triples.append(ids + (num or 0,))
+        else:
+            skipped += 1
+    db.close()
+    indptr, indices, counts = relations.build_pairs(*(zip(*pairs) if pairs else ((), (), ())))
+    triples = relations.build_triples(*(zip(*triples) if triples else ((), (), (), ())))
+    relations.write_relations(relations.get_relations_path(), indptr, indices, counts, triples)
+    pub_miner.Config.Logger.info(f'build relation matrix finished, pairs: {len(indices) // 2}, '
+                                 f'triples: {len(triples) // 3}, skipped: {skipped}')
+
+
+def build_citation_graph(batch_size=10000):
+    """
+    根据cite_cited_similar_relationship表全量生成引用关系图
+    首次部署时执行, 删除GRAPH目录后重新执行可以去掉edges文件中已被覆盖的旧数据
+    """
+    db = pub_miner.PubMinerDB()
+    last_id, total = 0, 0
+    while True:
+        rows = db.search_citation_rows(last_id, batch_size)
+        if not rows:
+            break
+        pub_miner.save_citation_rows([row[1:] for row in rows])
+        last_id = rows[-1][0]
+        total += len(rows)
+    db.close()
+    pub_miner.Config.Logger.info(f'build citation graph finished, total: {total}')
+
+
+def sync_refreshed_citations(batch_size=10000):
+    """
+    API的elink刷新任务只写入cite_cited_similar_relationship表, 按timestamp增量同步到引用关系图和PMID列,
+    并重新生成受影响实体的预排序结果; 同步进度(timestamp, id)保存在GRAPH/refreshed文件中
+    """
+    path = os.path.join(os.path.dirname(pub_miner.get_citation_graph('cite').root), 'refreshed')
+    try:
+        with open(path) as f:
+            timestamp, last_id = (int(value) for value in f.read().split())
+    except (OSError, ValueError):
+        timestamp, last_id = 0, 0
+    db = pub_miner.PubMinerDB()
+    total, changed_pub_ids = 0, set()
+    while True:
+        rows = db.search_refreshed_citation_rows(timestamp, last_id, batch_size)
+        if not rows:
+            break
+        pub_miner.save_citation_rows([row[1:4] for row in rows])
+        pub_ids = [int(row[1]) for row in rows]
+        pub_miner.save_column_rows(db.search_column_rows_by_pub_ids(pub_ids))
+        changed_pub_ids.update(pub_ids)
+        timestamp, last_id = int(rows[-1][4]), rows[-1][0]
+        total += len(rows)
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(f'{timestamp} {last_id}')
+        os.replace(f'{path}.tmp', path)
+    refresh_orderings(db, list(changed_pub_ids))
+    db.close()
+    pub_miner.Config.Logger.info(f'sync refreshed citations finished, total: {total}')
+
+
+def build_pmid_columns(batch_size=10000):
+    """
+    根据pubmed/journal/cite_cited_similar_relationship表全量生成PMID列
+    首次部署或杂志影响因子更新后执行, 之后执行build_entity_orderings重新生成预排序结果
+    """
+    db = pub_miner.PubMinerDB()
+    last_id, total = 0, 0
+    while True:
+        rows = db.search_column_rows(last_id, batch_size)
+        if not rows:
+            break
+        pub_miner.save_column_rows(rows)
+        last_id = rows[-1][0]
+        total += len(rows)
+    db.close()
+    pub_miner.Config.Logger.info(f'build pmid columns finished, total: {total}')
+
+
+def pack_json_documents(resource, batch_size=1000, deleteJson=False):
+    """
+    将旧的每篇文献一个json文件(以及PUBMED_INFOS下的基本信息)迁移到打包存储
+    :param resource: PUBMED/PMC
+    :param batch_size: 每批写入的文献数
+    :param deleteJson: 迁移后是否删除json文件
+    """
+    global_setting = pub_miner.get_global_settings(True)
+    BioCPath = os.path.expanduser(global_setting["upload"]["local-directory"])
+    resourceBioCPath = os.path.join(BioCPath, resource)
+    resourceBioCInfoPath = os.path.join(BioCPath, 'PUBMED_INFOS')
+    store = pub_miner.get_document_store(resource)
+    batch, json_paths, total = [], [], 0
+    for root_path, _, files in os.walk(resourceBioCPath):
+        for filename in files:
+            if not filename.endswith('.json'):
+                continue
+            json_path = os.path.join(root_path, filename)
+            info_path = os.path.join(resourceBioCInfoPath, os.path.relpath(json_path, resourceBioCPath))
+            has_info = resource == 'PUBMED' and os.path.exists(info_path)
+            if not store.contains(filename[:-5]):
+                batch.append((filename[:-5], pub_miner.read_json_data(json_path),
+                              pub_miner.read_json_data(info_path) if has_info else None))
+            json_paths.extend([json_path, info_path] if has_info else [json_path])
+            if len(batch) >= batch_size:
+                store.put_many(batch)
+                total += len(batch)
+                batch = []
+                if deleteJson:
+                    # 只删除已经写入打包存储的文件
+                    for path in json_paths:
+                        os.remove(path)
+                json_paths = []
+    store.put_many(batch)
+    total += len(batch)
+    if deleteJson:
+        for path in json_paths:
+            os.remove(path)
+    pub_miner.Config.Logger.info(f'pack {resource} json documents finished, total: {total}')
+
+
+def upgrade_document_store(resource, batch_size=1000):
+    """
+    打包存储中的旧记录改写为带段落表的格式(API按章节/字段裁剪时不需要解析整篇文献),
+    修改compress-documents选项后已有的记录按新的选项压缩或解压
+    :param resource: PUBMED/PMC
+    """
+    total = pub_miner.get_document_store(resource).upgrade(batch_size)
+    pub_miner.Config.Logger.info(f'upgrade {resource} document store finished, total: {total}')
+
+
+def compact_document_store(resource, min_garbage=None):
+    """
+    打包存储中被覆盖的旧记录超过min_garbage(默认为docstore.COMPACT_MIN_GARBAGE)时压缩数据段
+    :param resource: PUBMED/PMC
+    """
+    store = pub_miner.get_document_store(resource)
+    reclaimed = store.compact() if min_garbage is None else store.compact(min_garbage)
+    if reclaimed:
+        pub_miner.Config.Logger.info(f'compact {resource} document store finished, reclaimed: {reclaimed} bytes')
+
+
 if __name__ == '__main__':
     update_pub_base_info('PUBMED')
     update_pub_base_info('PMC')
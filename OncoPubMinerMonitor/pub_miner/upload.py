@@ -5,9 +5,7 @@
 """
 上传结果数据
 """
-import math
 import time
-from ast import literal_eval
 import os
 import json
 
@@ -17,6 +15,9 @@ import markdown2
 
 import pub_miner
 
+# 已保存的PubMed文献每批更新基本信息的篇数
+UPDATE_BATCH_SIZE = 1000
+
 
 def pushToFTP(outputList, toolSettings, globalSettings):
     """
@@ -48,13 +49,20 @@ def pushToFTP(outputList, toolSettings, globalSettings):
     ftp_client.quit()
 
 
+def update_pub_documents(resource, pub_documents):
+    """
+    已保存的文献批量更新基本信息
+    :param pub_documents: {pid: (BioC文献, 基本信息)}
+    :return: 没有保存过的文献 [(pid, BioC Json, 基本信息)]
+    """
+    missing = pub_miner.update_documents_infos(resource, [(pid, infos) for pid, (_, infos) in pub_documents.items()])
+    return [(pid, bioc.toJSON(pub_documents[pid][0]), pub_documents[pid][1]) for pid in missing]
+
+
 def pushToLocalDirectory(resource):
     globalSettings = pub_miner.get_global_settings(True)
-    # 最终NER生成的BioC的存放路径
-    BioCPath = os.path.expanduser(globalSettings["storage"]["upload"]["local-directory"])
-    resourceBioCPath = os.path.join(BioCPath, resource)
-    # BioCInfo的存放路径
-    resourceBioCInfoPath = os.path.join(BioCPath, f'{resource}_INFOS')
+    # 最终NER生成的BioC的打包存储
+    store = pub_miner.get_document_store(resource)
     # 程序开始运行时间
     start_time = time.time()
     workspaceDir = os.path.expanduser(globalSettings["storage"]["workspace"])
@@ -62,23 +70,19 @@ def pushToLocalDirectory(resource):
     # BioC格式输出路径
     BioCDir = os.path.join(workspaceDir, resourceInfo['NerDir'])
     for BioCXmlFile in os.listdir(BioCDir):
+        new_documents, pub_documents = [], {}
         for document in bioc.BioCXMLDocumentReader(os.path.join(BioCDir, BioCXmlFile)):
             pid = document.id
-            """将PubMed基本信息和BioC数据保存"""
-            # 计算当前PubMed数据的二级存储路径
-            psd = str(math.ceil(int(pid) / 10000))
-
-            BioCDocJsonFilePath = os.path.join(resourceBioCPath, f'{psd[-1]}/{psd}/{pid}.json')
-            if not os.path.exists(BioCDocJsonFilePath):
-                pub_miner.save_json_data(BioCDocJsonFilePath, bioc.toJSON(document))
-
-            document_infos = document.passages[0].infons
-            document_infos['authors'] = literal_eval(document_infos.get('authors', '[]'))
-            document_infos['keywords'] = literal_eval(document_infos.get('keywords', '[]'))
-            document_infos['refIds'] = literal_eval(document_infos.get('refIds', '[]'))
-            PubMedInfoJsonFilePath = os.path.join(resourceBioCInfoPath, f'{psd[-1]}/{psd}/{pid}.json')
-            # 保存PubMed基本信息
-            pub_miner.save_json_data(PubMedInfoJsonFilePath, document_infos)
+            """将PubMed基本信息合并到BioC数据中保存"""
+            if resource == 'PUBMED':
+                pub_documents[pid] = (document, pub_miner.parse_infos(document.passages[0].infons))
+                if len(pub_documents) >= UPDATE_BATCH_SIZE:
+                    new_documents.extend(update_pub_documents(resource, pub_documents))
+                    pub_documents = {}
+            elif not pub_miner.document_exists(resource, pid):
+                new_documents.append((pid, bioc.toJSON(document), None))
+        new_documents.extend(update_pub_documents(resource, pub_documents))
+        store.put_many(new_documents)
     pub_miner.Config.Logger.info(f'upload BioC time: {time.time()-start_time}')
 
 
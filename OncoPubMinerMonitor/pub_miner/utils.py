@@ -5,11 +5,10 @@
 import os
 import shutil
 import xml.etree.cElementTree as etree
-
-from Bio import Entrez
 import json
 
 import pub_miner
+from pub_miner.eutils import get_eutils_client
 
 
 def save_json_data(json_file, json_data):
@@ -56,29 +55,20 @@ def eutilsToXmlData(db, document_id, email):
     下载指定id的pubmed或pmc文献数据
     :param db: PUBMED/PMC
     :param document_id: 指定id
-    :param email:
+    :param email: 已在Config.Entrez_email中设置, 保留参数以兼容旧的调用
     :return:
     """
-    Entrez.email = email  # Always tell NCBI who you are
-    handle = Entrez.efetch(db=db, id=document_id, rettype="gb", retmode="xml")
-    xml = handle.read()
-    if isinstance(xml, bytes):
-        xml = xml.decode('utf-8')
-    return xml
+    return get_eutils_client().efetch(db, [document_id], rettype="gb", retmode="xml")[0].decode('utf-8')
 
 
 def eutilsToXmlSimilarRef(document_id, email):
     """
     获取文献的相似/引用/被引用文献
     :param document_id: 指定id
-    :param email:
+    :param email: 已在Config.Entrez_email中设置, 保留参数以兼容旧的调用
     :return:
     """
-    Entrez.email = email
-    handle = Entrez.elink(db='pubmed', dbfrom='pubmed', cmd='neighbor', id=document_id)
-    xml = handle.read()
-    xml_data = xml.decode('utf-8') if isinstance(xml, bytes) else xml
-    root = etree.fromstring(xml_data)
+    root = etree.fromstring(get_eutils_client().elink([document_id])[0])
     LinkSetDbs = root.findall('./LinkSet/LinkSetDb')
     simIds, rIds, cIds = [], [], []
     for LinkSetDb in LinkSetDbs: